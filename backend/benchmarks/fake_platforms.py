@@ -0,0 +1,481 @@
+"""Local stand-ins for the Shopify, Facebook, Google Ads and Shiprocket APIs.
+
+Serves the subset of each API the integration clients use for syncing, with
+the platforms' pagination styles (Link header page_info, Graph API cursors,
+searchStream JSON arrays, numbered pages), their rate-limit signals and
+optional latency and injected 429/5xx errors. Records are generated from
+their index, so any size is served without holding the data in memory.
+
+All platforms share one server; requests are told apart by path, and the
+original Host header picks the Shopify shop. Run it on its own with
+
+    python -m benchmarks.fake_platforms --port 8900 --orders 100000
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+SHOPIFY_PREFIX = "/admin/api/2023-10"
+SHOPIFY_MAX_LIMIT = 250
+SHOPIFY_BUCKET_SIZE = 40
+SHOPIFY_LEAK_RATE = 2.0
+FACEBOOK_PREFIX = "/v18.0"
+GOOGLE_PREFIX = "/v14"
+GOOGLE_BATCH_ROWS = 10000
+SHIPROCKET_PREFIX = "/v1/external"
+SHIPROCKET_TOKEN = "fake-shiprocket-token"
+GOOGLE_TOKEN = "fake-google-token"
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fake platform APIs for sync benchmarks")
+    add_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    return parser.parse_args(argv)
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Data size and fault options, shared with the sync harness"""
+    parser.add_argument("--orders", type=int, default=10000, help="Shopify orders (customers and products scale with it)")
+    parser.add_argument("--campaigns", type=int, default=50, help="campaigns per ad account")
+    parser.add_argument("--history-days", type=int, default=365, help="days of order and ad history")
+    parser.add_argument("--shipments", type=int, default=10000, help="Shiprocket orders")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="random extra latency up to this much")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of calls answered as throttled")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with a 5xx")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry hint sent with injected throttles")
+    parser.add_argument("--facebook-calls-per-minute", type=int, default=6000, help="Graph API call budget per account")
+    parser.add_argument("--report-seconds", type=float, default=2.0, help="time an async insights report takes")
+    parser.add_argument("--seed", type=int, default=0)
+
+def _encode_cursor(value: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+def _decode_cursor(value: str) -> Dict[str, Any]:
+    return json.loads(base64.urlsafe_b64decode(value.encode()))
+
+def _iso(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+class FakeData:
+    """Deterministic records addressed by index"""
+
+    def __init__(self, options: argparse.Namespace):
+        self.options = options
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.start = self.now - timedelta(days=options.history_days)
+        self.customers = max(options.orders // 4, 1)
+        self.products = max(options.orders // 50, 10)
+
+    def _created_at(self, index: int, count: int) -> datetime:
+        # Spread evenly over the history, oldest first
+        return self.start + (self.now - self.start) * index / max(count, 1)
+
+    def shopify_count(self, resource: str) -> int:
+        return {"orders": self.options.orders, "customers": self.customers, "products": self.products}[resource]
+
+    def shopify_first_index(self, resource: str, updated_at_min: Optional[str]) -> int:
+        """First record updated at or after the bound (records are in updated_at order)"""
+        if not updated_at_min:
+            return 0
+        bound = datetime.fromisoformat(updated_at_min.replace("Z", "+00:00"))
+        count = self.shopify_count(resource)
+        if bound <= self.start:
+            return 0
+        share = (bound - self.start) / (self.now - self.start)
+        index = max(int(share * count) - 1, 0)
+        while index < count and self._created_at(index, count) < bound:
+            index += 1
+        return index
+
+    def shopify_record(self, resource: str, index: int) -> Dict[str, Any]:
+        rng = random.Random(f"{resource}:{index}")
+        created_at = self._created_at(index, self.shopify_count(resource))
+        if resource == "orders":
+            items = []
+            for _ in range(rng.randint(1, 3)):
+                product = rng.randrange(self.products)
+                items.append({
+                    "id": index * 10 + len(items),
+                    "product_id": 7_000_000 + product,
+                    "variant_id": 8_000_000 + product,
+                    "title": f"Product {product}",
+                    "quantity": rng.randint(1, 3),
+                    "price": f"{199 + product * 37 % 4800:.2f}"
+                })
+            total = sum(float(item["price"]) * item["quantity"] for item in items)
+            return {
+                "id": 5_000_000 + index,
+                "order_number": 1001 + index,
+                "created_at": _iso(created_at),
+                "updated_at": _iso(created_at),
+                "cancelled_at": _iso(created_at) if rng.random() < 0.03 else None,
+                "financial_status": "paid",
+                "currency": "INR",
+                "total_price": f"{total:.2f}",
+                "subtotal_price": f"{total:.2f}",
+                "total_discounts": "0.00",
+                "total_tax": f"{total * 0.18:.2f}",
+                "source_name": "web",
+                "customer": {"id": 6_000_000 + int(rng.paretovariate(1.2) * 7919) % self.customers},
+                "line_items": items
+            }
+        if resource == "products":
+            return {
+                "id": 7_000_000 + index,
+                "title": f"Product {index}",
+                "product_type": "Apparel",
+                "vendor": "Benchmark",
+                "status": "active",
+                "created_at": _iso(created_at),
+                "updated_at": _iso(created_at),
+                "variants": [{"id": 8_000_000 + index, "price": f"{199 + index * 37 % 4800:.2f}"}]
+            }
+        return {
+            "id": 6_000_000 + index,
+            "created_at": _iso(created_at),
+            "updated_at": _iso(created_at),
+            "orders_count": rng.randint(1, 6),
+            "total_spent": f"{rng.uniform(199, 20000):.2f}",
+            "state": "enabled"
+        }
+
+    def campaign_day(self, campaign: int, key: str) -> Dict[str, Any]:
+        """Metrics of a campaign on the day (and account) ``key`` names"""
+        rng = random.Random(f"{campaign}:{key}")
+        impressions = rng.randint(1000, 50000)
+        clicks = int(impressions * rng.uniform(0.005, 0.03))
+        conversions = int(clicks * rng.uniform(0.01, 0.08))
+        return {
+            "impressions": impressions,
+            "clicks": clicks,
+            "spend": round(clicks * rng.uniform(5, 30), 2),
+            "conversions": conversions,
+            "conversion_value": round(conversions * rng.uniform(800, 2500), 2)
+        }
+
+    def shipment(self, index: int) -> Dict[str, Any]:
+        created_at = self._created_at(index, self.options.shipments)
+        return {
+            "id": 9_000_000 + index,
+            "channel_order_id": str(5_000_000 + index),
+            "created_at": created_at.strftime("%d %b %Y, %I:%M %p"),
+            "status": "DELIVERED" if index % 10 else "IN TRANSIT",
+            "total": f"{199 + index * 37 % 4800:.2f}",
+            "payment_method": "prepaid" if index % 3 else "cod"
+        }
+
+def _days(since: str, until: str) -> List[str]:
+    start, end = date.fromisoformat(since), date.fromisoformat(until)
+    return [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
+
+def create_app(options: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="Fake platform APIs")
+    data = FakeData(options)
+    rng = random.Random(options.seed)
+    shopify_buckets: Dict[str, List[float]] = {}
+    facebook_calls: Dict[str, deque] = {}
+    reports: Dict[str, Dict[str, Any]] = {}
+
+    async def delay():
+        await asyncio.sleep((options.latency_ms + rng.random() * options.jitter_ms) / 1000)
+
+    def injected_error() -> Optional[Response]:
+        if rng.random() < options.error_rate:
+            return JSONResponse({"errors": "Injected server error"}, status_code=rng.choice([500, 502, 503]))
+        return None
+
+    def throttled() -> bool:
+        return rng.random() < options.throttle_rate
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    # Shopify: leaky-bucket call limit per shop, page_info cursors in the Link header
+    @app.get(SHOPIFY_PREFIX + "/shop.json")
+    async def shopify_shop(request: Request):
+        return {"shop": {"myshopify_domain": request.headers.get("host")}}
+
+    @app.get(SHOPIFY_PREFIX + "/{resource}.json")
+    async def shopify_list(resource: str, request: Request):
+        await delay()
+        if resource not in ("orders", "products", "customers"):
+            return JSONResponse({"errors": "Not Found"}, status_code=404)
+        shop = request.headers.get("host", "")
+        level, last = shopify_buckets.get(shop, (0.0, time.monotonic()))
+        now = time.monotonic()
+        level = max(0.0, level - (now - last) * SHOPIFY_LEAK_RATE)
+        if level + 1 > SHOPIFY_BUCKET_SIZE or throttled():
+            shopify_buckets[shop] = (level, now)
+            return JSONResponse(
+                {"errors": "Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service."},
+                status_code=429,
+                headers={"Retry-After": f"{options.retry_after:g}"}
+            )
+        shopify_buckets[shop] = (level + 1, now)
+        error = injected_error()
+        if error:
+            return error
+
+        query = request.query_params
+        limit = min(int(query.get("limit", 50)), SHOPIFY_MAX_LIMIT)
+        if "page_info" in query:
+            try:
+                cursor = _decode_cursor(query["page_info"])
+            except ValueError:
+                return JSONResponse({"errors": {"page_info": "Invalid value."}}, status_code=400)
+            offset = cursor["offset"]
+        else:
+            offset = data.shopify_first_index(resource, query.get("updated_at_min"))
+        fields = query.get("fields", "").split(",") if query.get("fields") else None
+        count = data.shopify_count(resource)
+        records = []
+        for index in range(offset, min(offset + limit, count)):
+            record = data.shopify_record(resource, index)
+            records.append({field: record[field] for field in fields if field in record} if fields else record)
+
+        headers = {"X-Shopify-Shop-Api-Call-Limit": f"{int(level + 1)}/{SHOPIFY_BUCKET_SIZE}"}
+        if offset + limit < count:
+            page_info = _encode_cursor({"offset": offset + limit})
+            link_query = f"limit={limit}&page_info={page_info}" + (f"&fields={query['fields']}" if fields else "")
+            headers["Link"] = f'<https://{shop}{SHOPIFY_PREFIX}/{resource}.json?{link_query}>; rel="next"'
+        return JSONResponse({resource: records}, headers=headers)
+
+    # Facebook: call-count usage headers, Graph API cursors and async report jobs
+    def facebook_usage(account: str) -> Tuple[Dict[str, str], bool]:
+        """Usage headers of an account's call and whether the call is throttled"""
+        calls = facebook_calls.setdefault(account, deque())
+        now = time.monotonic()
+        while calls and calls[0] < now - 60:
+            calls.popleft()
+        calls.append(now)
+        percent = min(100, int(len(calls) * 100 / options.facebook_calls_per_minute))
+        usage = {account: [{
+            "type": "ads_insights",
+            "call_count": percent,
+            "total_cputime": percent // 2,
+            "total_time": percent // 2,
+            "estimated_time_to_regain_access": 0
+        }]}
+        headers = {"x-business-use-case-usage": json.dumps(usage)}
+        limited = percent >= 100 or throttled()
+        if limited:
+            # The Graph API sends no Retry-After; the hint keeps benchmark backoffs short
+            headers["Retry-After"] = f"{options.retry_after:g}"
+        return headers, limited
+
+    def facebook_throttled(headers: Dict[str, str]) -> Response:
+        return JSONResponse(
+            {"error": {"message": "User request limit reached", "type": "OAuthException", "code": 80004, "error_subcode": 2446079}},
+            status_code=400,
+            headers=headers
+        )
+
+    def insight_row(account: str, day: str, campaign: int) -> Dict[str, Any]:
+        metrics = data.campaign_day(campaign, f"facebook:{account}:{day}")
+        return {
+            "campaign_id": f"{account}{campaign:04d}",
+            "campaign_name": f"Campaign {campaign}",
+            "date_start": day,
+            "date_stop": day,
+            "spend": f"{metrics['spend']:.2f}",
+            "impressions": str(metrics["impressions"]),
+            "clicks": str(metrics["clicks"]),
+            "actions": [{"action_type": "purchase", "value": str(metrics["conversions"])}],
+            "action_values": [{"action_type": "purchase", "value": f"{metrics['conversion_value']:.2f}"}]
+        }
+
+    def insights_page(request: Request, account: str, since: str, until: str, headers: Dict[str, str]) -> Response:
+        query = request.query_params
+        limit = int(query.get("limit", 25))
+        offset = _decode_cursor(query["after"])["offset"] if query.get("after") else 0
+        days = _days(since, until)
+        total = len(days) * options.campaigns
+        # Rows run day by day, every campaign within a day
+        rows = [
+            insight_row(account, days[position // options.campaigns], position % options.campaigns)
+            for position in range(offset, min(offset + limit, total))
+        ]
+        body: Dict[str, Any] = {"data": rows}
+        if rows:
+            after = _encode_cursor({"offset": offset + len(rows)})
+            body["paging"] = {"cursors": {"before": _encode_cursor({"offset": offset}), "after": after}}
+            if offset + len(rows) < total:
+                body["paging"]["next"] = f"https://graph.facebook.com{request.url.path}?limit={limit}&after={after}"
+        return JSONResponse(body, headers=headers)
+
+    @app.get(FACEBOOK_PREFIX + "/me")
+    async def facebook_me():
+        return {"id": "1", "name": "Benchmark"}
+
+    @app.api_route(FACEBOOK_PREFIX + "/{node}/insights", methods=["GET", "POST"])
+    async def facebook_insights(node: str, request: Request):
+        await delay()
+        report = reports.get(node)
+        account = report["account"] if report else node.removeprefix("act_")
+        headers, limited = facebook_usage(account)
+        if limited:
+            return facebook_throttled(headers)
+        error = injected_error()
+        if error:
+            return error
+
+        if report:
+            if time.monotonic() < report["ready_at"]:
+                return JSONResponse({"error": {"message": "Report is not ready", "code": 2601}}, status_code=400)
+            return insights_page(request, account, report["since"], report["until"], headers)
+
+        params = dict(await request.form()) if request.method == "POST" else dict(request.query_params)
+        time_range = json.loads(params.get("time_range") or "{}")
+        since, until = time_range.get("since"), time_range.get("until")
+        if not since or not until:
+            return JSONResponse({"error": {"message": "time_range is required", "code": 100}}, status_code=400)
+        if request.method == "POST":
+            report_run_id = str(len(reports) + 1_000_000_000)
+            reports[report_run_id] = {"account": account, "since": since, "until": until, "started_at": time.monotonic(),
+                                      "ready_at": time.monotonic() + options.report_seconds}
+            return JSONResponse({"report_run_id": report_run_id}, headers=headers)
+        return insights_page(request, account, since, until, headers)
+
+    @app.get(FACEBOOK_PREFIX + "/{report_run_id}")
+    async def facebook_report_status(report_run_id: str):
+        await delay()
+        report = reports.get(report_run_id)
+        if not report:
+            return JSONResponse({"error": {"message": "Unsupported get request", "code": 100}}, status_code=400)
+        error = injected_error()
+        if error:
+            return error
+        elapsed = time.monotonic() - report["started_at"]
+        done = time.monotonic() >= report["ready_at"]
+        return {
+            "id": report_run_id,
+            "async_status": "Job Completed" if done else "Job Running",
+            "async_percent_completion": 100 if done else int(elapsed / max(options.report_seconds, 0.001) * 100)
+        }
+
+    # Google Ads: OAuth token endpoint and a streamed searchStream JSON array
+    @app.post("/token")
+    async def google_token():
+        await delay()
+        return {"access_token": GOOGLE_TOKEN, "expires_in": 3599, "token_type": "Bearer"}
+
+    @app.post(GOOGLE_PREFIX + "/customers/{customer_id}/googleAds:searchStream")
+    async def google_search_stream(customer_id: str, request: Request):
+        await delay()
+        if request.headers.get("authorization") != f"Bearer {GOOGLE_TOKEN}":
+            return JSONResponse({"error": {"code": 401, "status": "UNAUTHENTICATED"}}, status_code=401)
+        if throttled():
+            return JSONResponse({"error": {
+                "code": 429,
+                "message": "Resource has been exhausted (e.g. check quota).",
+                "status": "RESOURCE_EXHAUSTED",
+                "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{options.retry_after:g}s"}]
+            }}, status_code=429)
+        error = injected_error()
+        if error:
+            return error
+
+        query = (await request.json()).get("query", "")
+        match = re.search(r"BETWEEN '(\d{4}-\d{2}-\d{2})' AND '(\d{4}-\d{2}-\d{2})'", query)
+        if not match:
+            return JSONResponse({"error": {"code": 400, "status": "INVALID_ARGUMENT"}}, status_code=400)
+        days = _days(match.group(1), match.group(2))
+
+        async def body():
+            rows = (
+                (day, campaign, data.campaign_day(campaign, f"google:{customer_id}:{day}"))
+                for day in days for campaign in range(options.campaigns)
+            )
+            yield b"["
+            first = True
+            while True:
+                batch = []
+                for day, campaign, metrics in rows:
+                    batch.append({
+                        "segments": {"date": day},
+                        "campaign": {"resourceName": f"customers/{customer_id}/campaigns/{campaign}", "id": str(campaign), "name": f"Campaign {campaign}"},
+                        "metrics": {
+                            "impressions": str(metrics["impressions"]),
+                            "clicks": str(metrics["clicks"]),
+                            "costMicros": str(int(metrics["spend"] * 1_000_000)),
+                            "conversions": float(metrics["conversions"]),
+                            "conversionsValue": metrics["conversion_value"]
+                        }
+                    })
+                    if len(batch) == GOOGLE_BATCH_ROWS:
+                        break
+                if not batch and not first:
+                    break
+                # Batches are produced (and arrive) over time, like the real stream
+                await delay()
+                chunk = json.dumps({"results": batch, "fieldMask": "segments.date,campaign.id,campaign.name,metrics.impressions"}).encode()
+                yield chunk if first else b"," + chunk
+                first = False
+                if len(batch) < GOOGLE_BATCH_ROWS:
+                    break
+            yield b"]"
+
+        return StreamingResponse(body(), media_type="application/json")
+
+    # Shiprocket: login token and page-numbered order lists
+    @app.post(SHIPROCKET_PREFIX + "/auth/login")
+    async def shiprocket_login():
+        await delay()
+        return {"token": SHIPROCKET_TOKEN}
+
+    @app.get(SHIPROCKET_PREFIX + "/orders")
+    async def shiprocket_orders(request: Request):
+        await delay()
+        if request.headers.get("authorization") != f"Bearer {SHIPROCKET_TOKEN}":
+            return JSONResponse({"message": "Token has expired", "status_code": 401}, status_code=401)
+        if throttled():
+            return JSONResponse({"message": "Too Many Attempts.", "status_code": 429}, status_code=429,
+                                headers={"Retry-After": f"{options.retry_after:g}"})
+        error = injected_error()
+        if error:
+            return error
+
+        query = request.query_params
+        per_page = int(query.get("per_page", 15))
+        page = int(query.get("page", 1))
+        first = 0
+        if query.get("from"):
+            bound = datetime.fromisoformat(query["from"]).replace(tzinfo=timezone.utc)
+            share = max((bound - data.start) / (data.now - data.start), 0)
+            first = min(int(share * options.shipments), options.shipments)
+        total = options.shipments - first
+        start = first + (page - 1) * per_page
+        return {
+            "data": [data.shipment(index) for index in range(start, min(start + per_page, options.shipments))],
+            "meta": {"pagination": {
+                "total": total,
+                "count": max(min(per_page, options.shipments - start), 0),
+                "per_page": per_page,
+                "current_page": page,
+                "total_pages": (total + per_page - 1) // per_page
+            }}
+        }
+
+    return app
+
+def main(argv: Optional[List[str]] = None):
+    import uvicorn
+
+    options = parse_args(argv)
+    # Idle pooled connections stay open while the client is busy writing, as with the real APIs
+    uvicorn.run(create_app(options), host=options.host, port=options.port, log_level="warning", timeout_keep_alive=75)
+
+if __name__ == "__main__":
+    main()
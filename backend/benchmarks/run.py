@@ -0,0 +1,285 @@
+"""Endpoint latency benchmarks.
+
+Boots the API in-process (or targets a running server with --base-url)
+against a MongoDB seeded with synthetic tenants, drives every dashboard,
+analytics and auth route at a fixed concurrency and writes p50/p95/p99
+latency and throughput per route as a JSON baseline:
+
+    cd backend
+    python -m benchmarks.run --size 10k --output benchmarks/baseline.json
+    python -m benchmarks.run --size 10k --compare benchmarks/baseline.json
+
+Seeded tenants are reused between runs of the same size; --reseed rebuilds
+them. --in-memory starts a throwaway mongod via pymongo_inmemory instead of
+using --mongodb-url.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+# (name, method, path, needs a token); "{since}" is filled with a date a week back
+ROUTES: List[Tuple[str, str, str, bool]] = [
+    ("auth.login", "POST", "/api/auth/login", False),
+    ("auth.me", "GET", "/api/auth/me", True),
+    ("dashboard.metrics", "GET", "/api/dashboard/metrics?time_range=30d", True),
+    ("dashboard.revenue", "GET", "/api/dashboard/charts/revenue?time_range=30d", True),
+    ("dashboard.platforms", "GET", "/api/dashboard/charts/platforms", True),
+    ("dashboard.conversion_funnel", "GET", "/api/dashboard/charts/conversion-funnel", True),
+    ("dashboard.customer_segments", "GET", "/api/dashboard/charts/customer-segments", True),
+    ("analytics.overview", "GET", "/api/analytics/overview?time_range=30d", True),
+    ("analytics.customer_segments", "GET", "/api/analytics/customer-segments", True),
+    ("analytics.product_performance", "GET", "/api/analytics/product-performance?time_range=90d", True),
+    ("analytics.cohort_analysis", "GET", "/api/analytics/cohort-analysis", True),
+    ("analytics.export_orders", "GET", "/api/analytics/export/orders?format=ndjson&start={since}", True)
+]
+
+def add_mongo_arguments(parser: argparse.ArgumentParser, database: str):
+    parser.add_argument("--mongodb-url", default=os.getenv("BENCHMARK_MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default=os.getenv("BENCHMARK_DATABASE_NAME", database))
+    parser.add_argument("--in-memory", action="store_true", help="start a throwaway mongod (needs pymongo_inmemory)")
+
+def start_mongo(args: argparse.Namespace):
+    """Point the app at the benchmark database, starting a throwaway mongod for --in-memory.
+
+    Returns the mongod to stop afterwards (or None); must run before the app
+    connects.
+    """
+    mongod = None
+    if args.in_memory:
+        from pymongo_inmemory import Mongod
+        from pymongo_inmemory.context import Context
+
+        # pymongo_inmemory 0.5 takes the context explicitly; it picks the mongod
+        # version from PYMONGOIM__* environment variables or setup.cfg
+        mongod = Mongod(Context())
+        mongod.start()
+        args.mongodb_url = mongod.connection_string
+    os.environ["MONGODB_URL"] = args.mongodb_url
+    os.environ["DATABASE_NAME"] = args.database
+    return mongod
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    from benchmarks.seed import SIZES
+
+    parser = argparse.ArgumentParser(description="Benchmark the API routes against synthetic tenants")
+    add_mongo_arguments(parser, "d2c_analytics_benchmark")
+    parser.add_argument("--base-url", help="benchmark a running server instead of booting the app in-process")
+    parser.add_argument("--size", choices=sorted(SIZES, key=SIZES.get), default="10k", help="orders per tenant")
+    parser.add_argument("--orders", type=int, help="exact orders per tenant, overrides --size")
+    parser.add_argument("--tenants", type=int, default=2)
+    parser.add_argument("--reseed", action="store_true", help="clear the benchmark database and seed it again")
+    parser.add_argument("--routes", help="comma separated route names or prefixes (default: all)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--cache", choices=["warm", "cold", "conditional"], default="warm",
+                        help="cold invalidates the tenant's cached responses before every request; "
+                             "conditional revalidates with the ETag of the warm-up response (304s)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare p95 latencies against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 slowdown vs the baseline (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+async def prepare_tenants(db, count: int, orders: int, reseed: bool) -> List[Dict[str, Any]]:
+    """Seeded benchmark tenants, reusing the stored ones when they have the requested size"""
+    from benchmarks.seed import seed_tenant, tenant_email
+    from services.snapshots import SNAPSHOT_DIR
+
+    users = []
+    if not reseed:
+        for index in range(count):
+            user = await db.users.find_one({"email": tenant_email(index)})
+            if not user or await db.orders.count_documents({"tenant_id": str(user["_id"])}) != orders:
+                break
+            users.append(user)
+    if len(users) == count:
+        return users
+
+    print(f"Seeding {count} tenant(s) with {orders} orders each...")
+    for collection in await db.list_collection_names():
+        # Keep the indexes created at startup
+        await db[collection].delete_many({})
+    shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
+    users = []
+    for index in range(count):
+        started = time.perf_counter()
+        users.append(await seed_tenant(db, index, orders))
+        print(f"  tenant {index}: {time.perf_counter() - started:.1f}s")
+    return users
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "mean_ms": round(float(values.mean()), 2) if len(values) else 0.0,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0
+    }
+
+async def bench_route(client: httpx.AsyncClient, route: Tuple[str, str, str, bool], users: List[Dict[str, Any]],
+                      tokens: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.seed import BENCHMARK_PASSWORD
+    from utils.cache import invalidate_tenant
+
+    name, method, path, needs_token = route
+    path = path.format(since=(date.today() - timedelta(days=7)).isoformat())
+
+    etags: Dict[int, str] = {}
+
+    async def send(i: int) -> httpx.Response:
+        tenant = i % len(users)
+        if method == "POST":
+            return await client.post(path, json={"email": users[tenant]["email"], "password": BENCHMARK_PASSWORD})
+        headers = {"Authorization": f"Bearer {tokens[tenant]}"} if needs_token else {}
+        if tenant in etags:
+            headers["If-None-Match"] = etags[tenant]
+        return await client.get(path, headers=headers)
+
+    if args.cache != "cold":
+        for i in range(len(users)):
+            response = await send(i)
+            await response.aread()
+            if args.cache == "conditional" and "etag" in response.headers:
+                etags[i] = response.headers["etag"]
+
+    latencies: List[float] = []
+    errors = 0
+    issued = 0
+
+    async def worker():
+        nonlocal errors, issued
+        while issued < args.requests:
+            i = issued
+            issued += 1
+            if args.cache == "cold":
+                # Outside the timed section
+                await invalidate_tenant(str(users[i % len(users)]["_id"]))
+            started = time.perf_counter()
+            try:
+                response = await send(i)
+                # Streaming routes are only done once the body is read
+                await response.aread()
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    for key in ("target", "orders_per_tenant", "tenants", "concurrency", "cache"):
+        if baseline.get("meta", {}).get(key) != results["meta"][key]:
+            print(f"Warning: {key} differs from the baseline ({baseline.get('meta', {}).get(key)} vs {results['meta'][key]})")
+    regressions = []
+    for name, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(name)
+        if not previous or not previous["p95_ms"]:
+            continue
+        change = current["p95_ms"] / previous["p95_ms"] - 1
+        marker = "REGRESSION" if change > threshold else ""
+        print(f"{name:34} p95 {previous['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} ms ({change:+.0%}) {marker}")
+        if marker:
+            regressions.append(name)
+    return regressions
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.seed import SIZES
+    from database import connect_to_mongo, close_mongo_connection, get_database
+    from utils.auth import create_access_token
+    import main as app_module
+
+    orders = args.orders or SIZES[args.size]
+    selected = [
+        route for route in ROUTES
+        if not args.routes or any(route[0].startswith(prefix.strip()) for prefix in args.routes.split(","))
+    ]
+
+    async def bench(client: httpx.AsyncClient) -> Dict[str, Any]:
+        users = await prepare_tenants(get_database(), args.tenants, orders, args.reseed)
+        tokens = [create_access_token({"sub": user["email"]}, timedelta(hours=12)) for user in users]
+        routes = {}
+        for route in selected:
+            routes[route[0]] = await bench_route(client, route, users, tokens, args)
+            stats = routes[route[0]]
+            print(f"{route[0]:34} p50 {stats['p50_ms']:>9.2f}  p95 {stats['p95_ms']:>9.2f}  "
+                  f"p99 {stats['p99_ms']:>9.2f} ms  {stats['rps']:>8.1f} req/s  {stats['errors']} errors")
+        return routes
+
+    timeout = httpx.Timeout(300.0)
+    if args.base_url:
+        # The server must use the same database; seeding goes through our own connection
+        await connect_to_mongo()
+        try:
+            async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+                routes = await bench(client)
+        finally:
+            await close_mongo_connection()
+    else:
+        async with app_module.lifespan(app_module.app):
+            # Unhandled route errors come back as 500s and count as errors
+            transport = httpx.ASGITransport(app=app_module.app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=timeout) as client:
+                routes = await bench(client)
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "target": args.base_url or "in-process",
+            "orders_per_tenant": orders,
+            "tenants": args.tenants,
+            "concurrency": args.concurrency,
+            "requests_per_route": args.requests,
+            "cache": args.cache,
+            "python": platform.python_version(),
+            "machine": platform.machine()
+        },
+        "routes": routes
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    # Read by the app modules at import time, so set before importing any of them
+    os.environ.setdefault("ANALYTICS_SNAPSHOT_DIR", os.path.join("data", "benchmarks", "snapshots"))
+    args = parse_args(argv)
+    try:
+        mongod = start_mongo(args)
+    except ImportError:
+        print("--in-memory requires pymongo_inmemory (pip install -r requirements-dev.txt)")
+        return 2
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if mongod:
+            mongod.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"p95 regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+import numpy as np
+
+from services.cohorts import refresh_cohorts
+from services.rollups import refresh_rollups
+from services.segments import refresh_segments
+from services.snapshots import refresh_order_snapshot
+from utils.auth import get_password_hash
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+INSERT_BATCH_SIZE = 10_000
+BENCHMARK_PASSWORD = "benchmark-password"
+BENCHMARK_TIMEZONE = "Asia/Kolkata"
+PRODUCTS = 500
+CAMPAIGNS = 20
+
+def tenant_email(index: int) -> str:
+    return f"bench-{index}@example.com"
+
+def _orders_batch(rng: np.random.Generator, start: int, count: int, customers: int, prices: np.ndarray,
+                  now: datetime, days: int) -> list:
+    created = now - (rng.random(count) * days * 86400).astype("timedelta64[s]").astype(timedelta)
+    customer_ids = rng.zipf(1.3, count) % customers
+    cancelled = rng.random(count) < 0.03
+    item_counts = rng.integers(1, 4, count)
+    orders = []
+    for i in range(count):
+        items = [
+            {
+                "product_id": str(product),
+                "variant_id": str(product),
+                "title": f"Product {product}",
+                "quantity": int(quantity),
+                "price": float(prices[product])
+            }
+            for product, quantity in zip(rng.integers(0, PRODUCTS, item_counts[i]), rng.integers(1, 4, item_counts[i]))
+        ]
+        orders.append({
+            "platform": "shopify",
+            "external_id": str(start + i),
+            "order_number": 1000 + start + i,
+            "customer_id": str(customer_ids[i]),
+            "created_at": created[i],
+            "updated_at": created[i],
+            "synced_at": now,
+            "cancelled_at": created[i] if cancelled[i] else None,
+            "financial_status": "paid",
+            "currency": "INR",
+            "total_price": round(sum(item["price"] * item["quantity"] for item in items), 2),
+            "line_items": items
+        })
+    return orders
+
+async def seed_tenant(db, index: int, orders: int, days: int = 365, seed: int = 0) -> Dict[str, Any]:
+    """Insert a synthetic tenant with ``orders`` Shopify orders plus ad metrics and build its derived data"""
+    rng = np.random.default_rng(seed + index)
+    now = datetime.utcnow()
+    user = {
+        "email": tenant_email(index),
+        "full_name": f"Benchmark Tenant {index}",
+        "company_name": "Benchmark",
+        "timezone": BENCHMARK_TIMEZONE,
+        "is_active": True,
+        "hashed_password": get_password_hash(BENCHMARK_PASSWORD),
+        "created_at": now,
+        "updated_at": now
+    }
+    user["_id"] = (await db.users.insert_one(user)).inserted_id
+    tenant_id = str(user["_id"])
+
+    prices = np.round(rng.uniform(199, 4999, PRODUCTS), 2)
+    customers = max(orders // 4, 1)
+    for start in range(0, orders, INSERT_BATCH_SIZE):
+        batch = _orders_batch(rng, start, min(INSERT_BATCH_SIZE, orders - start), customers, prices, now, days)
+        await db.orders.insert_many([{"tenant_id": tenant_id, **order} for order in batch], ordered=False)
+
+    metrics = []
+    for day in range(days):
+        date = (now - timedelta(days=day)).strftime("%Y-%m-%d")
+        for platform in ("facebook_ads", "google_ads"):
+            for campaign in range(CAMPAIGNS):
+                impressions = int(rng.integers(1_000, 50_000))
+                clicks = int(impressions * rng.uniform(0.005, 0.03))
+                conversions = float(int(clicks * rng.uniform(0.01, 0.08)))
+                metrics.append({
+                    "tenant_id": tenant_id,
+                    "platform": platform,
+                    "external_id": f"{campaign}:{date}",
+                    "campaign_id": str(campaign),
+                    "campaign_name": f"Campaign {campaign}",
+                    "date": date,
+                    "spend": round(clicks * rng.uniform(5, 30), 2),
+                    "impressions": impressions,
+                    "clicks": clicks,
+                    "conversions": conversions,
+                    "conversion_value": round(conversions * rng.uniform(800, 2500), 2)
+                })
+    for start in range(0, len(metrics), INSERT_BATCH_SIZE):
+        await db.campaign_metrics.insert_many(metrics[start:start + INSERT_BATCH_SIZE], ordered=False)
+
+    # Derived data the sync engine would normally maintain
+    all_days = [(now - timedelta(days=day)).strftime("%Y-%m-%d") for day in range(days + 1)]
+    await refresh_rollups(db, tenant_id, "shopify", "orders", all_days, BENCHMARK_TIMEZONE)
+    for platform in ("facebook_ads", "google_ads"):
+        await refresh_rollups(db, tenant_id, platform, "campaign_metrics", all_days, BENCHMARK_TIMEZONE)
+    await refresh_order_snapshot(db, tenant_id)
+    await refresh_cohorts(db, tenant_id, None, BENCHMARK_TIMEZONE)
+    await refresh_segments(db, tenant_id)
+    return user
@@ -0,0 +1,258 @@
+"""Sync throughput harness.
+
+Starts the fake platform APIs (benchmarks/fake_platforms.py) in a separate
+process, sends the integration clients' traffic there, and syncs one
+integration per platform end to end into a benchmark database. That covers
+fetching, writing, rollups, snapshots, cohorts and segments. For each
+platform it reports records per second, peak RSS of the syncing process and
+the API calls made, by status:
+
+    cd backend
+    python -m benchmarks.sync --orders 100000 --latency-ms 50 --output benchmarks/sync.json
+    python -m benchmarks.sync --platforms shopify --throttle-rate 0.05 --error-rate 0.01
+
+A resource that fails on an injected 5xx is synced again, resuming from its
+checkpoint, up to --max-attempts times.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_platforms import add_arguments
+from benchmarks.run import add_mongo_arguments, start_mongo
+
+PLATFORMS = ["shopify", "facebook_ads", "google_ads", "shiprocket"]
+CREDENTIALS = {
+    "shopify": {"shop_domain": "benchmark-shop", "access_token": "fake-shopify-token"},
+    "facebook_ads": {"access_token": "fake-facebook-token", "ad_account_id": "1000"},
+    "google_ads": {
+        "developer_token": "fake-developer-token",
+        "client_id": "fake-client-id",
+        "client_secret": "fake-client-secret",
+        "refresh_token": "fake-refresh-token",
+        "customer_id": "2000"
+    },
+    "shiprocket": {"email": "benchmark@example.com", "password": "fake-password"}
+}
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure sync throughput against fake platform APIs")
+    add_mongo_arguments(parser, "d2c_analytics_sync_benchmark")
+    add_arguments(parser)
+    parser.add_argument("--platforms", default=",".join(PLATFORMS), help="comma separated platforms to sync")
+    parser.add_argument("--ad-days", type=int, default=90, help="days the first ad sync backfills")
+    parser.add_argument("--max-attempts", type=int, default=20, help="sync attempts per resource before giving up")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser.parse_args(argv)
+
+def _platform_of(host: str) -> str:
+    if host.endswith("myshopify.com"):
+        return "shopify"
+    if host.endswith("facebook.com"):
+        return "facebook_ads"
+    if host.endswith("googleapis.com"):
+        return "google_ads"
+    return "shiprocket"
+
+class FakeRouter:
+    """httpx event hooks sending platform traffic to the fake server and counting it.
+
+    Only the URL's scheme, host and port change; the Host header still names
+    the real platform, so the fake server can tell shops apart.
+    """
+
+    def __init__(self, port: int):
+        self.port = port
+        self.calls: Dict[str, Counter] = defaultdict(Counter)
+
+    async def on_request(self, request: httpx.Request):
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+
+    async def on_response(self, response: httpx.Response):
+        platform = _platform_of(response.request.headers["host"])
+        self.calls[platform][str(response.status_code)] += 1
+
+    def install(self, client: httpx.AsyncClient):
+        client.event_hooks = {
+            "request": [*client.event_hooks["request"], self.on_request],
+            "response": [*client.event_hooks["response"], self.on_response]
+        }
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Without procfs fall back to the process peak (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class PeakRSS:
+    """Sample the resident set size while a block runs"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.start = self.peak = 0
+        self._task = None
+
+    async def _sample(self):
+        while True:
+            self.peak = max(self.peak, rss_bytes())
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self.start = self.peak = rss_bytes()
+        self._task = asyncio.create_task(self._sample())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        self.peak = max(self.peak, rss_bytes())
+
+def start_fake_server(args: argparse.Namespace) -> subprocess.Popen:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        args.fake_port = sock.getsockname()[1]
+    defaults = argparse.ArgumentParser(add_help=False)
+    add_arguments(defaults)
+    command = [sys.executable, "-m", "benchmarks.fake_platforms", "--port", str(args.fake_port)]
+    for name in vars(defaults.parse_args([])):
+        command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    server = subprocess.Popen(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Fake platform server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.fake_port}/health").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Fake platform server did not start")
+
+async def sync_platform(db, tenant_id: str, platform: str, router: FakeRouter, max_attempts: int) -> Dict[str, Any]:
+    from services.rollups import get_tenant_timezone
+    from services.sync import SyncEngine
+
+    integration = {
+        "user_id": tenant_id,
+        "platform": platform,
+        "status": "connected",
+        "credentials": CREDENTIALS[platform],
+        "created_at": datetime.utcnow()
+    }
+    integration["_id"] = (await db.integrations.insert_one(integration)).inserted_id
+    engine = SyncEngine(integration, db)
+    engine.timezone = await get_tenant_timezone(db, tenant_id)
+
+    calls_before = Counter(router.calls[platform])
+    resources = {}
+    started = time.perf_counter()
+    async with PeakRSS() as rss:
+        for sync_resource in engine.resources:
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    result = await engine.sync_resource(sync_resource)
+                    resources[sync_resource.name] = {"attempts": attempt, **result}
+                    break
+                except Exception as e:
+                    # The next attempt resumes from the run's checkpoint
+                    print(f"  {platform} {sync_resource.name} attempt {attempt} failed: {e}")
+            else:
+                resources[sync_resource.name] = {"attempts": max_attempts, "records": 0, "error": "gave up"}
+    elapsed = time.perf_counter() - started
+
+    calls = router.calls[platform] - calls_before
+    records = sum(result["records"] for result in resources.values())
+    return {
+        "records": records,
+        "seconds": round(elapsed, 2),
+        "records_per_second": round(records / elapsed, 1) if elapsed else 0.0,
+        "api_calls": sum(calls.values()),
+        "api_calls_by_status": dict(sorted(calls.items())),
+        "peak_rss_mb": round(rss.peak / 2**20, 1),
+        "rss_growth_mb": round((rss.peak - rss.start) / 2**20, 1),
+        "resources": resources
+    }
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from database import connect_to_mongo, close_mongo_connection, get_database
+    from integrations.transport import close_http_client, get_http_client
+    from services.snapshots import SNAPSHOT_DIR
+
+    router = FakeRouter(args.fake_port)
+    router.install(get_http_client())
+    await connect_to_mongo()
+    try:
+        db = get_database()
+        for collection in await db.list_collection_names():
+            await db[collection].delete_many({})
+        shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
+        now = datetime.utcnow()
+        user = {"email": "sync-benchmark@example.com", "full_name": "Sync Benchmark", "timezone": "Asia/Kolkata",
+                "is_active": True, "created_at": now, "updated_at": now}
+        tenant_id = str((await db.users.insert_one(user)).inserted_id)
+
+        platforms = {}
+        for platform in [name.strip() for name in args.platforms.split(",")]:
+            print(f"Syncing {platform}...")
+            stats = platforms[platform] = await sync_platform(db, tenant_id, platform, router, args.max_attempts)
+            print(f"{platform:14} {stats['records']:>9} records  {stats['seconds']:>8.2f}s  "
+                  f"{stats['records_per_second']:>9.1f} rec/s  {stats['api_calls']:>6} calls  "
+                  f"peak RSS {stats['peak_rss_mb']:.1f} MB (+{stats['rss_growth_mb']:.1f})")
+    finally:
+        await close_http_client()
+        await close_mongo_connection()
+
+    options = {name: getattr(args, name) for name in vars(args) if name not in ("mongodb_url", "output", "fake_port")}
+    return {"meta": {"created_at": datetime.utcnow().isoformat(), **options}, "platforms": platforms}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    unknown = set(args.platforms.split(",")) - set(PLATFORMS)
+    if unknown:
+        print(f"Unknown platforms: {', '.join(sorted(unknown))}")
+        return 2
+
+    # Read by the app modules at import time, so set before importing any of them
+    os.environ.setdefault("ANALYTICS_SNAPSHOT_DIR", os.path.join("data", "benchmarks", "snapshots"))
+    os.environ["SYNC_INITIAL_AD_DAYS"] = str(args.ad_days)
+    os.environ.setdefault("FACEBOOK_REPORT_POLL_SECONDS", "0.5")
+    try:
+        mongod = start_mongo(args)
+    except ImportError:
+        print("--in-memory requires pymongo_inmemory (pip install -r requirements-dev.txt)")
+        return 2
+
+    server = start_fake_server(args)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.wait()
+        if mongod:
+            mongod.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,108 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
 import os
 from dotenv import load_dotenv
 
+# Before the utils import below: utils.metrics (and through it utils.cache and
+# utils.compression) read their settings at import time
 load_dotenv()
 
+from utils.metrics import mongo_listeners
+
 class Database:
     client: AsyncIOMotorClient = None
     database = None
 
 db = Database()
 
+# Indexes and hot queries are declared by the modules that issue the queries
+# (see register_indexes / register_hot_query) and applied once at startup
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = {}
+HOT_QUERIES: List[Tuple[str, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = []
+
+# Registered indexes with no recorded use for this long are reported as unused
+INDEX_UNUSED_AFTER_HOURS = float(os.getenv("INDEX_UNUSED_AFTER_HOURS", "168"))
+# Fail startup instead of only warning when a hot query would scan a collection
+INDEX_CHECK_STRICT = os.getenv("INDEX_CHECK_STRICT", "false").lower() == "true"
+
+def register_indexes(collection: str, *indexes: IndexModel):
+    registered = INDEX_REGISTRY.setdefault(collection, [])
+    names = {index.document["name"] for index in registered}
+    registered.extend(index for index in indexes if index.document["name"] not in names)
+
+def register_hot_query(collection: str, filter: Dict[str, Any], sort: Optional[List[Tuple[str, int]]] = None):
+    """Declare a query that must be served by an index; checked with explain() at startup"""
+    HOT_QUERIES.append((collection, filter, sort))
+
+async def ensure_indexes():
+    """Create the registered indexes (no-op when they exist) and report drift"""
+    for collection, indexes in INDEX_REGISTRY.items():
+        try:
+            await db.database[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # e.g. an index with the same keys but different options already exists
+            print(f"Error creating indexes on {collection}: {e}")
+    await report_index_usage()
+
+    uncovered = await check_hot_queries()
+    if uncovered and INDEX_CHECK_STRICT:
+        raise RuntimeError(f"Hot queries not covered by an index: {uncovered}")
+
+async def report_index_usage():
+    """Print registered indexes that are missing, indexes nobody registered and unused ones"""
+    for collection, indexes in INDEX_REGISTRY.items():
+        expected = {index.document["name"] for index in indexes}
+        existing = {index["name"] async for index in db.database[collection].list_indexes()} - {"_id_"}
+        for name in sorted(expected - existing):
+            print(f"Missing index {collection}.{name}")
+        for name in sorted(existing - expected):
+            print(f"Index {collection}.{name} is not in the index registry")
+
+        try:
+            stats = await db.database[collection].aggregate([{"$indexStats": {}}]).to_list(length=None)
+        except OperationFailure:
+            continue
+        cutoff = datetime.utcnow() - timedelta(hours=INDEX_UNUSED_AFTER_HOURS)
+        for stat in stats:
+            accesses = stat.get("accesses", {})
+            if stat["name"] in expected and accesses.get("ops") == 0 and accesses.get("since", cutoff) < cutoff:
+                print(f"Index {collection}.{stat['name']} has not been used since {accesses['since']:%Y-%m-%d}")
+
+def _plan_stages(plan: Dict[str, Any]):
+    yield plan.get("stage")
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            yield from _plan_stages(child)
+
+async def check_hot_queries() -> List[str]:
+    """Explain every registered hot query and return those the planner answers with a collection scan"""
+    uncovered = []
+    for collection, filter, sort in HOT_QUERIES:
+        cursor = db.database[collection].find(filter)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explain = await cursor.explain()
+        except OperationFailure as e:
+            print(f"Error explaining hot query on {collection}: {e}")
+            continue
+        winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stages = set(_plan_stages(winning.get("queryPlan", winning)))
+        if "COLLSCAN" in stages or (sort and "SORT" in stages):
+            uncovered.append(f"{collection} {list(filter)}")
+            print(f"Hot query on {collection} {list(filter)} is not covered by an index: {sorted(s for s in stages if s)}")
+    return uncovered
+
 async def connect_to_mongo():
     """Create database connection"""
     mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
     database_name = os.getenv("DATABASE_NAME", "d2c_analytics")
     
-    db.client = AsyncIOMotorClient(mongodb_url)
+    # Listeners feed the command latency and pool metrics served on /metrics
+    db.client = AsyncIOMotorClient(mongodb_url, event_listeners=mongo_listeners())
     db.database = db.client[database_name]
     
     # Test connection
@@ -24,6 +111,8 @@ async def connect_to_mongo():
         print("Successfully connected to MongoDB!")
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
+        return
+    await ensure_indexes()
 
 async def close_mongo_connection():
     """Close database connection"""
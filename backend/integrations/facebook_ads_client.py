@@ -1,6 +1,22 @@
-import requests
-from typing import Dict, List, Any, Optional
+import httpx
+from typing import Dict, List, Any, Optional, AsyncIterator, Iterable, Tuple
+import asyncio
+import json
 import os
+from urllib.parse import urlencode
+
+from integrations.transport import request
+from integrations.ratelimit import get_limiter
+
+# Graph API accepts at most 50 requests per batch call
+BATCH_SIZE = 50
+INSIGHT_FIELDS = "spend,impressions,clicks,ctr,cpc,cpm,reach,frequency,actions"
+DAILY_INSIGHT_FIELDS = "campaign_id,campaign_name,spend,impressions,clicks,actions,action_values"
+REPORT_POLL_SECONDS = float(os.getenv("FACEBOOK_REPORT_POLL_SECONDS", "2"))
+REPORT_TIMEOUT_SECONDS = float(os.getenv("FACEBOOK_REPORT_TIMEOUT_SECONDS", "900"))
+
+class FacebookReportError(Exception):
+    pass
 
 class FacebookAdsClient:
     def __init__(self, access_token: str, ad_account_id: str):
@@ -8,6 +24,10 @@ class FacebookAdsClient:
         self.ad_account_id = ad_account_id
         self.base_url = "https://graph.facebook.com/v18.0"
         self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.limiter = get_limiter("facebook_ads", ad_account_id)
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self.limiter.call(lambda: request(method, url, headers=self.headers, platform="facebook_ads", **kwargs))
     
     async def get_campaigns(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Fetch campaigns from Facebook Ads"""
@@ -18,7 +38,7 @@ class FacebookAdsClient:
                 "limit": limit
             }
             
-            response = requests.get(url, headers=self.headers, params=params)
+            response = await self._request("GET", url, params=params)
             response.raise_for_status()
             
             return response.json().get("data", [])
@@ -31,11 +51,11 @@ class FacebookAdsClient:
         try:
             url = f"{self.base_url}/{campaign_id}/insights"
             params = {
-                "fields": "spend,impressions,clicks,ctr,cpc,cpm,reach,frequency,actions",
+                "fields": INSIGHT_FIELDS,
                 "date_preset": date_range
             }
             
-            response = requests.get(url, headers=self.headers, params=params)
+            response = await self._request("GET", url, params=params)
             response.raise_for_status()
             
             data = response.json().get("data", [])
@@ -53,7 +73,7 @@ class FacebookAdsClient:
                 "date_preset": date_range
             }
             
-            response = requests.get(url, headers=self.headers, params=params)
+            response = await self._request("GET", url, params=params)
             response.raise_for_status()
             
             data = response.json().get("data", [])
@@ -62,11 +82,111 @@ class FacebookAdsClient:
             print(f"Error fetching Facebook ad account insights: {e}")
             return {}
     
-    def test_connection(self) -> bool:
+    async def get_campaign_insights_bulk(self, campaign_ids: Iterable[str], date_range: str = "last_30d") -> Dict[str, Dict[str, Any]]:
+        """Fetch insights of many campaigns, packing up to 50 per Graph API batch call"""
+        campaign_ids = list(campaign_ids)
+        chunks = [campaign_ids[i:i + BATCH_SIZE] for i in range(0, len(campaign_ids), BATCH_SIZE)]
+        results = await asyncio.gather(*[self._insights_batch(chunk, date_range) for chunk in chunks])
+        return {campaign_id: insights for chunk in results for campaign_id, insights in chunk.items()}
+    
+    async def _insights_batch(self, campaign_ids: List[str], date_range: str) -> Dict[str, Dict[str, Any]]:
+        query = urlencode({"fields": INSIGHT_FIELDS, "date_preset": date_range})
+        batch = [
+            {"method": "GET", "relative_url": f"{campaign_id}/insights?{query}"}
+            for campaign_id in campaign_ids
+        ]
+        
+        response = await self._request("POST", self.base_url, data={"batch": json.dumps(batch), "include_headers": "false"})
+        response.raise_for_status()
+        
+        insights = {}
+        for campaign_id, item in zip(campaign_ids, response.json()):
+            # Failed sub-requests come back as null or a non-200 code inside the batch
+            if not item or item.get("code") != 200:
+                print(f"Error fetching Facebook insights for campaign {campaign_id}: {item and item.get('body')}")
+                insights[campaign_id] = {}
+                continue
+            data = json.loads(item["body"]).get("data", [])
+            insights[campaign_id] = data[0] if data else {}
+        return insights
+    
+    async def _iter_insight_pages(self, url: str, params: Dict[str, Any], after: Optional[str]) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        params = dict(params)
+        while True:
+            if after:
+                params["after"] = after
+            
+            response = await self._request("GET", url, params=params)
+            response.raise_for_status()
+            
+            body = response.json()
+            paging = body.get("paging", {})
+            after = paging.get("cursors", {}).get("after") if paging.get("next") else None
+            yield body.get("data", []), after
+            
+            if not after:
+                break
+    
+    def _daily_insight_params(self, since: str, until: str) -> Dict[str, Any]:
+        return {
+            "level": "campaign",
+            "fields": DAILY_INSIGHT_FIELDS,
+            "time_range": json.dumps({"since": since, "until": until}),
+            "time_increment": 1,
+            "limit": 500
+        }
+    
+    def iter_campaign_insight_pages(
+        self,
+        since: str,
+        until: str,
+        after: Optional[str] = None
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """Yield (rows, next_after) of daily campaign insights between two dates"""
+        url = f"{self.base_url}/act_{self.ad_account_id}/insights"
+        return self._iter_insight_pages(url, self._daily_insight_params(since, until), after)
+    
+    async def start_insights_report(self, since: str, until: str) -> str:
+        """Submit an async daily campaign insights report job and return its report_run_id"""
+        url = f"{self.base_url}/act_{self.ad_account_id}/insights"
+        params = self._daily_insight_params(since, until)
+        del params["limit"]
+        
+        response = await self._request("POST", url, data=params)
+        response.raise_for_status()
+        
+        return response.json()["report_run_id"]
+    
+    async def wait_for_report(self, report_run_id: str):
+        """Poll an async report job until it completes"""
+        url = f"{self.base_url}/{report_run_id}"
+        delay = REPORT_POLL_SECONDS
+        deadline = asyncio.get_running_loop().time() + REPORT_TIMEOUT_SECONDS
+        while True:
+            response = await self._request("GET", url, params={"fields": "async_status,async_percent_completion"})
+            response.raise_for_status()
+            
+            job_status = response.json().get("async_status")
+            if job_status == "Job Completed":
+                return
+            if job_status in ("Job Failed", "Job Skipped"):
+                raise FacebookReportError(f"Insights report {report_run_id} ended with status {job_status}")
+            if asyncio.get_running_loop().time() > deadline:
+                raise FacebookReportError(f"Insights report {report_run_id} did not finish in time")
+            
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.5, 30)
+    
+    def iter_report_pages(self, report_run_id: str, after: Optional[str] = None) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """Yield (rows, next_after) of a completed async insights report"""
+        url = f"{self.base_url}/{report_run_id}/insights"
+        return self._iter_insight_pages(url, {"limit": 500}, after)
+    
+    async def test_connection(self) -> bool:
         """Test Facebook Ads API connection"""
         try:
             url = f"{self.base_url}/me"
-            response = requests.get(url, headers=self.headers)
+            response = await self._request("GET", url)
             return response.status_code == 200
         except:
             return False
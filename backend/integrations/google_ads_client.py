@@ -1,7 +1,73 @@
-import requests
-from typing import Dict, List, Any, Optional
+import httpx
+import json
+import re
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Optional, AsyncIterator, NamedTuple
 import os
 
+from integrations.transport import request, stream
+from integrations.tokens import token_cache, credential_key
+from integrations.ratelimit import get_limiter, MAX_RETRIES
+
+class CampaignDayMetrics(NamedTuple):
+    """One campaign-day row of a performance stream, kept as a compact tuple"""
+    date: str
+    campaign_id: str
+    campaign_name: str
+    impressions: int
+    clicks: int
+    cost_micros: int
+    conversions: float
+    conversion_value: float
+
+# Characters that change the nesting state of a JSON document
+_JSON_STRUCTURE = re.compile(rb'["\\\[\]{}]')
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Decode the object/array elements of a top-level JSON array as their bytes arrive.
+
+    Only structural characters are visited (via a C-level regex scan), so each
+    byte is examined once; an element is decoded as soon as its closing
+    bracket is seen and dropped from the buffer right after.
+    """
+    buffer = bytearray()
+    position = 0
+    depth = 0
+    in_string = False
+    escaped_at = -1
+    element_start = -1
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        for match in _JSON_STRUCTURE.finditer(buffer, position):
+            index = match.start()
+            char = buffer[index]
+            if in_string:
+                if index == escaped_at:
+                    continue
+                if char == 0x5C:  # backslash escapes the next byte
+                    escaped_at = index + 1
+                elif char == 0x22:
+                    in_string = False
+                continue
+            if char == 0x22:
+                in_string = True
+            elif char in (0x5B, 0x7B):
+                depth += 1
+                if depth == 2:
+                    element_start = index
+            else:
+                depth -= 1
+                if depth == 1:
+                    yield json.loads(bytes(buffer[element_start:index + 1]))
+                    element_start = -1
+        # Drop everything already decoded but keep the partial element
+        keep_from = element_start if element_start >= 0 else len(buffer)
+        position = len(buffer) - keep_from
+        escaped_at -= keep_from
+        del buffer[:keep_from]
+        element_start = 0 if element_start >= 0 else -1
+
+
 class GoogleAdsClient:
     def __init__(self, developer_token: str, client_id: str, client_secret: str, refresh_token: str, customer_id: str):
         self.developer_token = developer_token
@@ -11,40 +77,75 @@ class GoogleAdsClient:
         self.customer_id = customer_id
         self.base_url = "https://googleads.googleapis.com/v14"
         self.access_token = None
+        self._token_key = credential_key("google_ads", client_id, client_secret, refresh_token)
+        self.limiter = get_limiter("google_ads", customer_id)
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await request(method, url, platform="google_ads", **kwargs)
+    
+    async def _fetch_access_token(self):
+        url = "https://oauth2.googleapis.com/token"
+        data = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "refresh_token": self.refresh_token,
+            "grant_type": "refresh_token"
+        }
+        
+        response = await self._request("POST", url, data=data)
+        response.raise_for_status()
+        
+        body = response.json()
+        return body["access_token"], float(body.get("expires_in", 3600))
     
     async def _get_access_token(self) -> str:
-        """Get access token using refresh token"""
-        try:
-            url = "https://oauth2.googleapis.com/token"
-            data = {
-                "client_id": self.client_id,
-                "client_secret": self.client_secret,
-                "refresh_token": self.refresh_token,
-                "grant_type": "refresh_token"
-            }
-            
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            
-            self.access_token = response.json().get("access_token")
-            return self.access_token
-        except Exception as e:
-            print(f"Error getting Google Ads access token: {e}")
-            return None
+        """Get access token using refresh token, shared by every client with these credentials"""
+        self.access_token = await token_cache.get(self._token_key, self._fetch_access_token)
+        return self.access_token
     
-    async def get_campaigns(self) -> List[Dict[str, Any]]:
-        """Fetch campaigns from Google Ads"""
-        try:
-            if not self.access_token:
-                await self._get_access_token()
-            
-            url = f"{self.base_url}/customers/{self.customer_id}/googleAds:searchStream"
+    @asynccontextmanager
+    async def _search_stream(self, query: str) -> AsyncIterator[httpx.Response]:
+        """Open googleAds:searchStream through the account limiter, refreshing the token once on 401"""
+        url = f"{self.base_url}/customers/{self.customer_id}/googleAds:searchStream"
+        refreshed = False
+        for attempt in range(MAX_RETRIES + 1):
+            token = await self._get_access_token()
             headers = {
-                "Authorization": f"Bearer {self.access_token}",
+                "Authorization": f"Bearer {token}",
                 "developer-token": self.developer_token,
                 "Content-Type": "application/json"
             }
-            
+            await self.limiter.acquire()
+            released = False
+            try:
+                async with stream("POST", url, platform="google_ads", headers=headers, json={"query": query}) as response:
+                    if response.status_code < 400:
+                        yield response
+                        return
+                    await response.aread()
+                
+                released = True
+                retry_after = await self.limiter.release(response)
+                if response.status_code == 401 and not refreshed:
+                    refreshed = True
+                    token_cache.invalidate(self._token_key, token)
+                elif retry_after is None or attempt == MAX_RETRIES:
+                    response.raise_for_status()
+            finally:
+                if not released:
+                    await self.limiter.release(None)
+    
+    async def search(self, query: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the result rows of a GAQL query without buffering the response"""
+        async with self._search_stream(query) as response:
+            # searchStream answers with a JSON array of result batches
+            async for batch in iter_json_array(response.aiter_bytes()):
+                for row in batch.get("results", []):
+                    yield row
+    
+    async def get_campaigns(self) -> List[Dict[str, Any]]:
+        """Fetch campaigns from Google Ads"""
+        try:
             query = """
                 SELECT 
                     campaign.id,
@@ -55,11 +156,7 @@ class GoogleAdsClient:
                 WHERE campaign.status != 'REMOVED'
             """
             
-            data = {"query": query}
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            return response.json().get("results", [])
+            return [row async for row in self.search(query)]
         except Exception as e:
             print(f"Error fetching Google Ads campaigns: {e}")
             return []
@@ -67,16 +164,6 @@ class GoogleAdsClient:
     async def get_campaign_performance(self, date_range: str = "LAST_30_DAYS") -> List[Dict[str, Any]]:
         """Fetch campaign performance metrics"""
         try:
-            if not self.access_token:
-                await self._get_access_token()
-            
-            url = f"{self.base_url}/customers/{self.customer_id}/googleAds:searchStream"
-            headers = {
-                "Authorization": f"Bearer {self.access_token}",
-                "developer-token": self.developer_token,
-                "Content-Type": "application/json"
-            }
-            
             query = f"""
                 SELECT 
                     campaign.id,
@@ -87,22 +174,50 @@ class GoogleAdsClient:
                     metrics.ctr,
                     metrics.average_cpc,
                     metrics.conversions,
-                    metrics.conversion_value
+                    metrics.conversions_value
                 FROM campaign
                 WHERE segments.date DURING {date_range}
                 AND campaign.status != 'REMOVED'
             """
             
-            data = {"query": query}
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            return response.json().get("results", [])
+            return [row async for row in self.search(query)]
         except Exception as e:
             print(f"Error fetching Google Ads performance: {e}")
             return []
     
-    def test_connection(self) -> bool:
+    async def iter_campaign_performance(self, start_date: str, end_date: str) -> AsyncIterator[CampaignDayMetrics]:
+        """Stream per-day campaign metrics for an inclusive YYYY-MM-DD date range"""
+        query = f"""
+            SELECT 
+                segments.date,
+                campaign.id,
+                campaign.name,
+                metrics.impressions,
+                metrics.clicks,
+                metrics.cost_micros,
+                metrics.conversions,
+                metrics.conversions_value
+            FROM campaign
+            WHERE segments.date BETWEEN '{start_date}' AND '{end_date}'
+            AND campaign.status != 'REMOVED'
+        """
+        
+        async for row in self.search(query):
+            campaign = row.get("campaign", {})
+            metrics = row.get("metrics", {})
+            # int64 metrics arrive as JSON strings; cost stays in integer micros
+            yield CampaignDayMetrics(
+                date=row.get("segments", {}).get("date"),
+                campaign_id=str(campaign.get("id")),
+                campaign_name=campaign.get("name"),
+                impressions=int(metrics.get("impressions", 0)),
+                clicks=int(metrics.get("clicks", 0)),
+                cost_micros=int(metrics.get("costMicros", 0)),
+                conversions=float(metrics.get("conversions", 0)),
+                conversion_value=float(metrics.get("conversionsValue", 0))
+            )
+    
+    async def test_connection(self) -> bool:
         """Test Google Ads API connection"""
         try:
             # This would require a proper test query
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from utils.metrics import integration_throttled, tenant_tier
+
+MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+MAX_BACKOFF_SECONDS = 60.0
+
+class RateLimiter:
+    """Adaptive concurrency limiter for one platform account.
+
+    Calls queue in ``acquire`` instead of failing. After each response the
+    platform's usage signal feeds an AIMD controller: concurrency grows by a
+    small step while usage is comfortably low and halves once usage nears the
+    budget. Throttled responses pause the whole account for the hinted time
+    and are retried.
+    """
+
+    # Usage (0..1) above which concurrency is cut, and below which it may grow
+    high_water = 0.8
+    low_water = 0.5
+
+    def __init__(self, platform: str, account: str, max_concurrency: int = 8):
+        self.platform = platform
+        self.account = account
+        self.max_concurrency = max_concurrency
+        self.limit = float(max(1, max_concurrency // 2))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            while True:
+                delay = self.paused_until - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.in_flight < int(self.limit):
+                    break
+                await self._cond.wait()
+            self.in_flight += 1
+
+    async def release(self, response: Optional[httpx.Response]) -> Optional[float]:
+        """Return a slot and report how long to back off if the call was throttled"""
+        async with self._cond:
+            self.in_flight -= 1
+            retry_after = None
+            if response is not None:
+                usage, retry_after = self.inspect(response)
+                if retry_after is not None:
+                    self.throttled += 1
+                    integration_throttled.inc(self.platform, tenant_tier.get())
+                    self.limit = max(1.0, self.limit / 2)
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                elif usage is not None and usage >= self.high_water:
+                    self.limit = max(1.0, self.limit / 2)
+                elif usage is None or usage < self.low_water:
+                    self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+            return retry_after
+
+    def inspect(self, response: httpx.Response) -> Tuple[Optional[float], Optional[float]]:
+        """Platform specific: (usage of the budget 0..1, retry delay if throttled)"""
+        if response.status_code == 429:
+            return 1.0, _retry_after(response)
+        return None, None
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Send through the limiter, retrying throttled calls with backoff"""
+        for attempt in range(MAX_RETRIES + 1):
+            await self.acquire()
+            response = None
+            try:
+                response = await send()
+            finally:
+                retry_after = await self.release(response)
+            if retry_after is None or attempt == MAX_RETRIES:
+                return response
+            print(f"{self.platform} throttled for {self.account}, retrying in {retry_after:.1f}s")
+        return response
+
+def _retry_after(response: httpx.Response, attempt_backoff: float = 2.0) -> float:
+    value = response.headers.get("Retry-After")
+    try:
+        return min(float(value), MAX_BACKOFF_SECONDS)
+    except (TypeError, ValueError):
+        return attempt_backoff
+
+class ShopifyRateLimiter(RateLimiter):
+    # Standard plans leak two calls per second out of a 40 call bucket
+    leak_rate = 2.0
+
+    def inspect(self, response):
+        if response.status_code == 429:
+            return 1.0, _retry_after(response)
+        header = response.headers.get("X-Shopify-Shop-Api-Call-Limit", "")
+        if "/" not in header:
+            return None, None
+        used, size = (int(part) for part in header.split("/", 1))
+        if used / size >= self.high_water:
+            # Let the bucket drain back to half full before sending more
+            drain = (used - size * self.low_water) / self.leak_rate
+            self.paused_until = max(self.paused_until, time.monotonic() + drain)
+        return used / size, None
+
+# Graph API error codes that mean "throttled" rather than "bad request"
+FACEBOOK_THROTTLE_CODES = {4, 17, 32, 613, 80000, 80001, 80002, 80003, 80004, 80005, 80006, 80008, 80009, 80014}
+
+class FacebookRateLimiter(RateLimiter):
+    def inspect(self, response):
+        usage, regain_minutes = None, 0.0
+        for header in ("x-business-use-case-usage", "x-ad-account-usage", "x-app-usage"):
+            value = response.headers.get(header)
+            if not value:
+                continue
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                continue
+            entries = [parsed]
+            if header == "x-business-use-case-usage":
+                entries = [entry for items in parsed.values() for entry in items]
+            for entry in entries:
+                percents = [v for k, v in entry.items() if k in ("call_count", "total_cputime", "total_time", "acc_id_util_pct") and isinstance(v, (int, float))]
+                if percents:
+                    usage = max(usage or 0.0, max(percents) / 100)
+                regain_minutes = max(regain_minutes, float(entry.get("estimated_time_to_regain_access") or 0))
+
+        throttled = response.status_code == 429
+        if response.status_code in (400, 403) and not throttled:
+            try:
+                throttled = response.json().get("error", {}).get("code") in FACEBOOK_THROTTLE_CODES
+            except ValueError:
+                pass
+        regain = min(regain_minutes * 60, MAX_BACKOFF_SECONDS * 5)
+        if throttled:
+            return 1.0, regain or _retry_after(response, 30.0)
+        if regain:
+            # Served, but the account is blocked for a while: hold back later calls
+            self.paused_until = max(self.paused_until, time.monotonic() + regain)
+            return 1.0, None
+        return usage, None
+
+class GoogleAdsRateLimiter(RateLimiter):
+    def inspect(self, response):
+        if response.status_code != 429:
+            return None, None
+        delay = None
+        try:
+            # RESOURCE_EXHAUSTED errors carry e.g. "retryDelay": "30s"
+            match = re.search(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"', response.text)
+            delay = float(match.group(1)) if match else None
+        except Exception:
+            pass
+        return 1.0, min(delay, MAX_BACKOFF_SECONDS * 5) if delay else _retry_after(response, 5.0)
+
+LIMITER_CLASSES = {
+    "shopify": (ShopifyRateLimiter, 4),
+    "facebook_ads": (FacebookRateLimiter, 8),
+    "google_ads": (GoogleAdsRateLimiter, 8),
+    "shiprocket": (RateLimiter, 4)
+}
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+
+def get_limiter(platform: str, account: str) -> RateLimiter:
+    """Process-wide limiter shared by every client of one platform account"""
+    key = (platform, account)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter_class, concurrency = LIMITER_CLASSES.get(platform, (RateLimiter, 4))
+        max_concurrency = int(os.getenv(f"RATE_LIMIT_{platform.upper()}_CONCURRENCY", str(concurrency)))
+        limiter = _limiters[key] = limiter_class(platform, account, max_concurrency)
+    return limiter
@@ -1,43 +1,61 @@
-import requests
-from typing import Dict, List, Any, Optional
+import httpx
+from typing import Dict, List, Any, Optional, AsyncIterator, Tuple
 import os
 
+from integrations.transport import request
+from integrations.tokens import token_cache, credential_key
+from integrations.ratelimit import get_limiter
+
+# Shiprocket login tokens are valid for 240 hours
+TOKEN_TTL_SECONDS = 240 * 3600
+
 class ShiprocketClient:
     def __init__(self, email: str, password: str):
         self.email = email
         self.password = password
         self.base_url = "https://apiv2.shiprocket.in/v1/external"
         self.token = None
+        self._token_key = credential_key("shiprocket", email, password)
+        self.limiter = get_limiter("shiprocket", email)
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await request(method, url, platform="shiprocket", **kwargs)
+    
+    async def _login(self):
+        url = f"{self.base_url}/auth/login"
+        data = {
+            "email": self.email,
+            "password": self.password
+        }
+        
+        response = await self._request("POST", url, json=data)
+        response.raise_for_status()
+        
+        return response.json()["token"], TOKEN_TTL_SECONDS
     
     async def _authenticate(self) -> str:
-        """Authenticate with Shiprocket API"""
-        try:
-            url = f"{self.base_url}/auth/login"
-            data = {
-                "email": self.email,
-                "password": self.password
-            }
-            
-            response = requests.post(url, json=data)
-            response.raise_for_status()
-            
-            self.token = response.json().get("token")
-            return self.token
-        except Exception as e:
-            print(f"Error authenticating with Shiprocket: {e}")
-            return None
+        """Authenticate with Shiprocket API, reusing a cached token for these credentials"""
+        self.token = await token_cache.get(self._token_key, self._login)
+        return self.token
+    
+    async def _api_request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Call the Shiprocket API, logging in again once if the token is rejected"""
+        for attempt in range(2):
+            token = await self._authenticate()
+            headers = {"Authorization": f"Bearer {token}"}
+            response = await self.limiter.call(lambda: self._request(method, url, headers=headers, **kwargs))
+            if response.status_code != 401 or attempt:
+                return response
+            token_cache.invalidate(self._token_key, token)
+        return response
     
     async def get_orders(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Fetch orders from Shiprocket"""
         try:
-            if not self.token:
-                await self._authenticate()
-            
             url = f"{self.base_url}/orders"
-            headers = {"Authorization": f"Bearer {self.token}"}
             params = {"per_page": limit}
             
-            response = requests.get(url, headers=headers, params=params)
+            response = await self._api_request("GET", url, params=params)
             response.raise_for_status()
             
             return response.json().get("data", [])
@@ -48,14 +66,10 @@ class ShiprocketClient:
     async def get_shipments(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Fetch shipments from Shiprocket"""
         try:
-            if not self.token:
-                await self._authenticate()
-            
             url = f"{self.base_url}/shipments"
-            headers = {"Authorization": f"Bearer {self.token}"}
             params = {"per_page": limit}
             
-            response = requests.get(url, headers=headers, params=params)
+            response = await self._api_request("GET", url, params=params)
             response.raise_for_status()
             
             return response.json().get("data", [])
@@ -63,16 +77,36 @@ class ShiprocketClient:
             print(f"Error fetching Shiprocket shipments: {e}")
             return []
     
+    async def iter_order_pages(
+        self,
+        from_date: Optional[str] = None,
+        page: int = 1,
+        per_page: int = 100
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[int]]]:
+        """Yield (orders, next_page) for orders created or updated since a YYYY-MM-DD date"""
+        url = f"{self.base_url}/orders"
+        while True:
+            params = {"per_page": per_page, "page": page}
+            if from_date:
+                params["from"] = from_date
+            
+            response = await self._api_request("GET", url, params=params)
+            response.raise_for_status()
+            
+            body = response.json()
+            pagination = body.get("meta", {}).get("pagination", {})
+            page = page + 1 if pagination.get("current_page", page) < pagination.get("total_pages", 0) else None
+            yield body.get("data", []), page
+            
+            if page is None:
+                break
+    
     async def track_shipment(self, awb_code: str) -> Dict[str, Any]:
         """Track a specific shipment"""
         try:
-            if not self.token:
-                await self._authenticate()
-            
             url = f"{self.base_url}/courier/track/awb/{awb_code}"
-            headers = {"Authorization": f"Bearer {self.token}"}
             
-            response = requests.get(url, headers=headers)
+            response = await self._api_request("GET", url)
             response.raise_for_status()
             
             return response.json()
@@ -80,13 +114,10 @@ class ShiprocketClient:
             print(f"Error tracking Shiprocket shipment: {e}")
             return {}
     
-    def test_connection(self) -> bool:
+    async def test_connection(self) -> bool:
         """Test Shiprocket API connection"""
         try:
-            # Test authentication
-            url = f"{self.base_url}/auth/login"
-            data = {"email": self.email, "password": self.password}
-            response = requests.post(url, json=data)
-            return response.status_code == 200
+            # A cached token proves these credentials without another login
+            return bool(await self._authenticate())
         except:
             return False
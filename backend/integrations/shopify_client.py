@@ -1,7 +1,22 @@
-import requests
-from typing import Dict, List, Any, Optional
+import httpx
+from typing import Dict, List, Any, Optional, AsyncIterator, Iterable, Tuple
+from urllib.parse import urlsplit, parse_qs
 import os
 
+from integrations.transport import request
+from integrations.ratelimit import get_limiter
+
+# Shopify's maximum page size for cursor-paginated REST endpoints
+PAGE_SIZE = 250
+
+def _next_page_info(response: httpx.Response) -> Optional[str]:
+    """Extract the page_info cursor of the next page from the Link header"""
+    next_link = response.links.get("next")
+    if not next_link:
+        return None
+    values = parse_qs(urlsplit(next_link["url"]).query).get("page_info")
+    return values[0] if values else None
+
 class ShopifyClient:
     def __init__(self, shop_domain: str, access_token: str):
         self.shop_domain = shop_domain
@@ -11,6 +26,10 @@ class ShopifyClient:
             "X-Shopify-Access-Token": access_token,
             "Content-Type": "application/json"
         }
+        self.limiter = get_limiter("shopify", shop_domain)
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self.limiter.call(lambda: request(method, url, headers=self.headers, platform="shopify", **kwargs))
     
     async def get_orders(self, limit: int = 50, status: str = "any") -> List[Dict[str, Any]]:
         """Fetch orders from Shopify"""
@@ -18,7 +37,7 @@ class ShopifyClient:
             url = f"{self.base_url}/orders.json"
             params = {"limit": limit, "status": status}
             
-            response = requests.get(url, headers=self.headers, params=params)
+            response = await self._request("GET", url, params=params)
             response.raise_for_status()
             
             return response.json().get("orders", [])
@@ -32,7 +51,7 @@ class ShopifyClient:
             url = f"{self.base_url}/products.json"
             params = {"limit": limit}
             
-            response = requests.get(url, headers=self.headers, params=params)
+            response = await self._request("GET", url, params=params)
             response.raise_for_status()
             
             return response.json().get("products", [])
@@ -46,7 +65,7 @@ class ShopifyClient:
             url = f"{self.base_url}/customers.json"
             params = {"limit": limit}
             
-            response = requests.get(url, headers=self.headers, params=params)
+            response = await self._request("GET", url, params=params)
             response.raise_for_status()
             
             return response.json().get("customers", [])
@@ -54,11 +73,61 @@ class ShopifyClient:
             print(f"Error fetching Shopify customers: {e}")
             return []
     
-    def test_connection(self) -> bool:
+    async def iter_pages(
+        self,
+        resource: str,
+        params: Optional[Dict[str, Any]] = None,
+        fields: Optional[Iterable[str]] = None,
+        page_info: Optional[str] = None
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """Yield (records, next_page_info) for every page of a resource.
+
+        Filters in ``params`` only apply to the first request; Shopify rejects
+        them alongside a ``page_info`` cursor. Pass a saved ``page_info`` to
+        resume mid-way. Errors are raised rather than swallowed so callers
+        never mistake a failed page for the end of the data.
+        """
+        url = f"{self.base_url}/{resource}.json"
+        while True:
+            if page_info:
+                query = {"limit": PAGE_SIZE, "page_info": page_info}
+            else:
+                query = {"limit": PAGE_SIZE, **(params or {})}
+            if fields:
+                query["fields"] = ",".join(fields)
+            
+            response = await self._request("GET", url, params=query)
+            response.raise_for_status()
+            
+            records = response.json().get(resource, [])
+            page_info = _next_page_info(response)
+            yield records, page_info
+            
+            if not page_info:
+                break
+    
+    async def _iter_records(self, resource: str, params: Dict[str, Any], fields: Optional[Iterable[str]]) -> AsyncIterator[Dict[str, Any]]:
+        async for records, _ in self.iter_pages(resource, params, fields):
+            for record in records:
+                yield record
+    
+    def iter_orders(self, status: str = "any", fields: Optional[Iterable[str]] = None, **filters) -> AsyncIterator[Dict[str, Any]]:
+        """Stream every matching order, one page in memory at a time"""
+        return self._iter_records("orders", {"status": status, **filters}, fields)
+    
+    def iter_products(self, fields: Optional[Iterable[str]] = None, **filters) -> AsyncIterator[Dict[str, Any]]:
+        """Stream every matching product, one page in memory at a time"""
+        return self._iter_records("products", filters, fields)
+    
+    def iter_customers(self, fields: Optional[Iterable[str]] = None, **filters) -> AsyncIterator[Dict[str, Any]]:
+        """Stream every matching customer, one page in memory at a time"""
+        return self._iter_records("customers", filters, fields)
+    
+    async def test_connection(self) -> bool:
         """Test Shopify API connection"""
         try:
             url = f"{self.base_url}/shop.json"
-            response = requests.get(url, headers=self.headers)
+            response = await self._request("GET", url)
             return response.status_code == 200
         except:
             return False
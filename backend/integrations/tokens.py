@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# Fetchers return the token and its lifetime in seconds
+TokenFetcher = Callable[[], Awaitable[Tuple[str, float]]]
+
+def credential_key(platform: str, *secrets: str) -> str:
+    """Stable cache key for a credential set that does not keep the secrets in memory twice"""
+    digest = hashlib.sha256("\0".join(secrets).encode()).hexdigest()
+    return f"{platform}:{digest}"
+
+class TokenCache:
+    """Process-wide cache of access tokens keyed per credential set.
+
+    Tokens inside the refresh margin are still handed out while a single
+    background refresh replaces them; expired tokens are refreshed inline.
+    Either way at most one refresh per credential set is in flight.
+    """
+
+    def __init__(self, refresh_margin: Optional[float] = None):
+        self.refresh_margin = refresh_margin if refresh_margin is not None else float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._background: Dict[str, asyncio.Task] = {}
+
+    def _lock(self, key: str) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    async def _refresh(self, key: str, fetch: TokenFetcher) -> str:
+        async with self._lock(key):
+            entry = self._tokens.get(key)
+            # Another caller may have refreshed while we waited for the lock
+            if entry and entry[1] - self.refresh_margin > time.time():
+                return entry[0]
+            token, expires_in = await fetch()
+            self._tokens[key] = (token, time.time() + expires_in)
+            return token
+
+    def _refresh_in_background(self, key: str, fetch: TokenFetcher):
+        task = self._background.get(key)
+        if task is not None and not task.done():
+            return
+
+        async def refresh():
+            try:
+                await self._refresh(key, fetch)
+            except Exception as e:
+                print(f"Error refreshing token in background: {e}")
+            finally:
+                self._background.pop(key, None)
+
+        self._background[key] = asyncio.create_task(refresh())
+
+    async def get(self, key: str, fetch: TokenFetcher) -> str:
+        entry = self._tokens.get(key)
+        now = time.time()
+        if entry:
+            token, expires_at = entry
+            if expires_at - self.refresh_margin > now:
+                return token
+            if expires_at > now:
+                self._refresh_in_background(key, fetch)
+                return token
+        return await self._refresh(key, fetch)
+
+    def invalidate(self, key: str, token: Optional[str] = None):
+        """Forget a token the API rejected (only if it is still the cached one)"""
+        entry = self._tokens.get(key)
+        if entry and (token is None or entry[0] == token):
+            del self._tokens[key]
+
+token_cache = TokenCache()
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from utils.metrics import integration_errors, observe_outbound, tenant_tier
+
+class Transport:
+    client: httpx.AsyncClient = None
+    host_limits: Dict[str, asyncio.Semaphore] = {}
+
+http = Transport()
+
+def _build_client() -> httpx.AsyncClient:
+    """Build the pooled async client shared by every integration"""
+    timeout = httpx.Timeout(
+        float(os.getenv("INTEGRATION_HTTP_TIMEOUT", "30")),
+        connect=float(os.getenv("INTEGRATION_HTTP_CONNECT_TIMEOUT", "10")),
+    )
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("INTEGRATION_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("INTEGRATION_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("INTEGRATION_HTTP_KEEPALIVE_EXPIRY", "30")),
+    )
+
+    # HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 keep-alive without it
+    try:
+        import h2  # noqa: F401
+        http2 = os.getenv("INTEGRATION_HTTP2", "true").lower() == "true"
+    except ImportError:
+        http2 = False
+
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2)
+
+async def open_http_client():
+    """Create the shared integration HTTP client"""
+    if http.client is None or http.client.is_closed:
+        http.client = _build_client()
+
+async def close_http_client():
+    """Close the shared integration HTTP client"""
+    if http.client is not None:
+        await http.client.aclose()
+    http.client = None
+    http.host_limits = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    # Scripts and workers outside the FastAPI lifespan get a lazily created client
+    if http.client is None or http.client.is_closed:
+        http.client = _build_client()
+    return http.client
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    semaphore = http.host_limits.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(int(os.getenv("INTEGRATION_HTTP_MAX_PER_HOST", "10")))
+        http.host_limits[host] = semaphore
+    return semaphore
+
+async def request(method: str, url: str, timeout: Optional[float] = None, platform: str = "other", **kwargs) -> httpx.Response:
+    """Send a request on the shared client, capped per upstream host and timed per platform"""
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    async with _host_limit(url):
+        started = time.perf_counter()
+        try:
+            response = await get_http_client().request(method, url, **kwargs)
+        except httpx.TransportError:
+            observe_outbound(platform, None, time.perf_counter() - started)
+            raise
+        observe_outbound(platform, response.status_code, time.perf_counter() - started)
+        return response
+
+@asynccontextmanager
+async def stream(method: str, url: str, platform: str = "other", **kwargs) -> AsyncIterator[httpx.Response]:
+    """Open a streamed response on the shared client; the host slot is held until it closes"""
+    async with _host_limit(url):
+        started = time.perf_counter()
+        response = None
+        try:
+            async with get_http_client().stream(method, url, **kwargs) as response:
+                observe_outbound(platform, response.status_code, time.perf_counter() - started)
+                yield response
+        except httpx.TransportError:
+            if response is None:
+                observe_outbound(platform, None, time.perf_counter() - started)
+            else:
+                # The body broke off after the status was already recorded
+                integration_errors.inc(platform, tenant_tier.get())
+            raise
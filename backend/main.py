@@ -1,30 +1,45 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
+# Load environment variables before the app modules, which read their settings at import time
+load_dotenv()
+
 from database import connect_to_mongo, close_mongo_connection
+from integrations.transport import open_http_client, close_http_client
+from services.jobs import job_runner
+from utils.auth import close_password_hasher
+from utils.compression import CompressionMiddleware
+from utils.metrics import CONTENT_TYPE, MetricsMiddleware, render_metrics
+from utils.serialization import FastJSONResponse
 from routers import auth, dashboard, integrations, analytics
 
-# Load environment variables
-load_dotenv()
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
+    await open_http_client()
+    await job_runner.start()
     yield
     # Shutdown
+    await job_runner.stop()
+    await close_http_client()
+    close_password_hasher()
     await close_mongo_connection()
 
 app = FastAPI(
     title="D2C Analytics API",
     description="API for D2C Analytics SaaS Platform",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
+# Brotli/gzip for JSON bodies over COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
 # CORS middleware - Allow all origins for development
 app.add_middleware(
     CORSMiddleware,
@@ -34,6 +49,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the latency includes every other middleware
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(dashboard.router, prefix="/api/dashboard", tags=["dashboard"])
@@ -48,6 +66,14 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "API is operational"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    # Prometheus text format; protected by a bearer token when METRICS_TOKEN is set
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
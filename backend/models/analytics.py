@@ -1,22 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-from bson import ObjectId
-
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
-
-    @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid objectid")
-        return ObjectId(v)
-
-    @classmethod
-    def __get_pydantic_json_schema__(cls, field_schema):
-        field_schema.update(type="string")
+from models.common import PyObjectId
 
 class MetricData(BaseModel):
     value: float
@@ -47,8 +32,6 @@ class Integration(BaseModel):
 
     class Config:
         populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
 
 class CustomerSegment(BaseModel):
     segment: str
@@ -57,7 +40,7 @@ class CustomerSegment(BaseModel):
     percentage: float
 
 class ProductPerformance(BaseModel):
+    product_id: Optional[str] = None
     product_name: str
     revenue: float
     units_sold: int
-    profit_margin: float
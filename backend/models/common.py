@@ -0,0 +1,37 @@
+from typing import Any, Optional
+from zoneinfo import available_timezones
+
+from bson import ObjectId
+from pydantic_core import core_schema
+
+# IANA names known to the zoneinfo database of this host
+TIMEZONES = frozenset(available_timezones())
+
+class PyObjectId(ObjectId):
+    """ObjectId field that accepts ObjectIds or their hex strings and serializes to the hex string"""
+
+    @classmethod
+    def validate(cls, v):
+        if not ObjectId.is_valid(v):
+            raise ValueError("Invalid objectid")
+        return ObjectId(v)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type: Any, handler) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(str, when_used="json")
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
+
+def validate_timezone(value: str) -> str:
+    if value not in TIMEZONES:
+        raise ValueError(f"Unknown timezone {value!r}, expected an IANA name such as 'Asia/Kolkata'")
+    return value
+
+def resolve_timezone(name: Optional[str]) -> str:
+    """A stored timezone name safe for ZoneInfo and MongoDB, or UTC when it is missing or unknown"""
+    return name if name in TIMEZONES else "UTC"
@@ -1,29 +1,17 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional
 from datetime import datetime
-from bson import ObjectId
-
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
-
-    @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid objectid")
-        return ObjectId(v)
-
-    @classmethod
-    def __get_pydantic_json_schema__(cls, field_schema):
-        field_schema.update(type="string")
+from models.common import PyObjectId, validate_timezone
 
 class UserBase(BaseModel):
     email: EmailStr
     full_name: str
     company_name: Optional[str] = None
+    timezone: str = "UTC"
     is_active: bool = True
 
+    _check_timezone = field_validator("timezone")(validate_timezone)
+
 class UserCreate(UserBase):
     password: str
 
@@ -31,6 +19,13 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class UserUpdate(BaseModel):
+    full_name: Optional[str] = None
+    company_name: Optional[str] = None
+    timezone: Optional[str] = None
+
+    _check_timezone = field_validator("timezone")(validate_timezone)
+
 class UserInDB(UserBase):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     hashed_password: str
@@ -39,8 +34,6 @@ class UserInDB(UserBase):
 
     class Config:
         populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
 
 class User(UserBase):
     id: str
@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Path, Query, Depends, status
+from fastapi.responses import StreamingResponse
 from typing import Optional, List
 from models.analytics import CustomerSegment, ProductPerformance
-import random
+from database import get_database
+from services.cohorts import get_cohorts
+from services.segments import get_segments, segment_summaries
+from services.products import top_products, parse_cursor, make_cursor
+from services.exports import MEDIA_TYPES, stream_export
+from utils.auth import get_current_user, get_tenant_id, get_user_timezone
+from utils.cache import cached_route
+from utils.serialization import FastJSONRoute
+from datetime import date, datetime, timedelta, time
+from zoneinfo import ZoneInfo
+import importlib.util
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 @router.get("/overview")
+@cached_route()
 async def get_analytics_overview(
-    time_range: Optional[str] = Query("30d", regex="^(7d|15d|30d|90d)$")
+    time_range: Optional[str] = Query("30d", regex="^(7d|15d|30d|90d)$"),
+    user: dict = Depends(get_current_user)
 ):
     return {
         "summary": {
@@ -32,55 +45,75 @@ async def get_analytics_overview(
     }
 
 @router.get("/customer-segments")
-async def get_customer_segments():
-    return {
-        "segments": [
-            {
-                "segment": "High Value",
-                "count": 200,
-                "revenue": 50000,
-                "percentage": 16,
-                "avg_order_value": 250
-            },
-            {
-                "segment": "Regular",
-                "count": 600,
-                "revenue": 60000,
-                "percentage": 48,
-                "avg_order_value": 100
-            },
-            {
-                "segment": "New",
-                "count": 450,
-                "revenue": 15000,
-                "percentage": 36,
-                "avg_order_value": 33
-            }
-        ]
-    }
+@cached_route()
+async def get_customer_segments(user: dict = Depends(get_current_user)):
+    db = get_database()
+    result = await get_segments(db, get_tenant_id(user))
+    return {"segments": segment_summaries(result)}
 
 @router.get("/product-performance")
+@cached_route()
 async def get_product_performance(
-    limit: Optional[int] = Query(10, ge=1, le=50)
+    time_range: Optional[str] = Query("all", regex="^(7d|15d|30d|90d|all)$"),
+    limit: Optional[int] = Query(10, ge=1, le=50),
+    cursor: Optional[str] = None,
+    user: dict = Depends(get_current_user)
 ):
-    products = []
-    for i in range(limit):
-        products.append({
-            "product_name": f"Product {chr(65 + i)}",
-            "revenue": round(random.uniform(5000, 25000), 2),
-            "units_sold": random.randint(50, 250),
-            "profit_margin": round(random.uniform(20, 60), 1)
-        })
+    db = get_database()
+    after = None
+    if cursor:
+        try:
+            after = parse_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    since = None
+    if time_range != "all":
+        zone = ZoneInfo(get_user_timezone(user))
+        first_day = datetime.now(zone).date() - timedelta(days=int(time_range.replace('d', '')) - 1)
+        since = datetime.combine(first_day, time.min, tzinfo=zone)
     
-    return {"products": products}
-
-@router.get("/cohort-analysis")
-async def get_cohort_analysis():
+    rows = await top_products(db, get_tenant_id(user), since, limit, after)
+    products = [
+        ProductPerformance(
+            product_id=row["_id"],
+            product_name=row["product_name"],
+            revenue=round(row["revenue"], 2),
+            units_sold=row["units_sold"]
+        )
+        for row in rows
+    ]
     return {
-        "cohorts": [
-            {"month": "2024-01", "customers": 100, "retention_rate": 85},
-            {"month": "2024-02", "customers": 120, "retention_rate": 82},
-            {"month": "2024-03", "customers": 150, "retention_rate": 78},
-            {"month": "2024-04", "customers": 180, "retention_rate": 75}
-        ]
+        "products": products,
+        "next_cursor": make_cursor(rows[-1]) if len(rows) == limit else None
     }
+
+@router.get("/cohort-analysis")
+@cached_route()
+async def get_cohort_analysis(user: dict = Depends(get_current_user)):
+    # The matrix is maintained by the sync engine; this is a single indexed read
+    db = get_database()
+    return {"cohorts": await get_cohorts(db, get_tenant_id(user), get_user_timezone(user))}
+
+@router.get("/export/{dataset}")
+async def export_dataset(
+    dataset: str = Path(..., regex="^(orders|daily_rollups|campaign_metrics)$"),
+    export_format: str = Query("csv", alias="format", regex="^(csv|ndjson|parquet)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    gzip: bool = False,
+    user: dict = Depends(get_current_user)
+):
+    # Streamed straight from the cursor; never cached or buffered in full
+    if start and end and start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end")
+    if export_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Parquet export requires pyarrow")
+    
+    compress = gzip and export_format != "parquet"
+    filename = f"{dataset}.{export_format}" + (".gz" if compress else "")
+    db = get_database()
+    return StreamingResponse(
+        stream_export(db, dataset, export_format, get_tenant_id(user), start, end, get_user_timezone(user), compress),
+        media_type="application/gzip" if compress else MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
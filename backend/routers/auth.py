@@ -1,13 +1,28 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from models.user import UserCreate, UserLogin, User, Token, UserInDB
-from utils.auth import verify_password, get_password_hash, create_access_token, verify_token
-from database import get_database
-from datetime import timedelta
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Depends
+from models.user import UserCreate, UserLogin, UserUpdate, User, Token, UserInDB
+from utils.auth import hash_password, check_password, create_access_token, get_current_user, invalidate_user, profile_claims
+from utils.serialization import FastJSONRoute
+from database import get_database, register_indexes, register_hot_query
+from services.sync import rebuild_for_timezone
+from datetime import datetime, timedelta
 import pymongo
+from pymongo.errors import DuplicateKeyError
 
-router = APIRouter()
-security = HTTPBearer()
+router = APIRouter(route_class=FastJSONRoute)
+
+# Login and token resolution look users up by email; the unique index also
+# settles concurrent registrations of the same address
+register_indexes("users", pymongo.IndexModel([("email", pymongo.ASCENDING)], unique=True))
+register_hot_query("users", {"email": ""})
+
+def _profile(user: dict) -> dict:
+    return {
+        "email": user["email"],
+        "full_name": user["full_name"],
+        "company_name": user.get("company_name"),
+        "timezone": user.get("timezone") or "UTC",
+        "is_active": user["is_active"]
+    }
 
 @router.post("/register", response_model=dict)
 async def register_user(user: UserCreate):
@@ -22,18 +37,25 @@ async def register_user(user: UserCreate):
         )
     
     # Hash password and create user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     user_dict = user.dict()
     del user_dict["password"]
     user_dict["hashed_password"] = hashed_password
     
     # Insert user
-    result = await db.users.insert_one(user_dict)
+    try:
+        result = await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    user_dict["_id"] = result.inserted_id
     
     # Create access token
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, **profile_claims(user_dict)}, expires_delta=access_token_expires
     )
     
     return {
@@ -48,43 +70,38 @@ async def login_user(user: UserLogin):
     
     # Find user
     db_user = await db.users.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user["hashed_password"]):
+    valid, new_hash = await check_password(user.password, db_user["hashed_password"]) if db_user else (False, None)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # The configured bcrypt cost changed since this hash was made: upgrade it
+    if new_hash:
+        await db.users.update_one({"_id": db_user["_id"]}, {"$set": {"hashed_password": new_hash}})
+    
     # Create access token
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, **profile_claims(db_user)}, expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=dict)
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def read_current_user(user: dict = Depends(get_current_user)):
+    return _profile(user)
+
+@router.patch("/me", response_model=dict)
+async def update_current_user(update: UserUpdate, background_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
     db = get_database()
-    
-    email = verify_token(credentials.credentials)
-    if not email:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    user = await db.users.find_one({"email": email})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    return {
-        "email": user["email"],
-        "full_name": user["full_name"],
-        "company_name": user.get("company_name"),
-        "is_active": user["is_active"]
-    }
+    changes = update.dict(exclude_unset=True)
+    if changes:
+        await db.users.update_one({"_id": user["_id"]}, {"$set": {**changes, "updated_at": datetime.utcnow()}})
+        invalidate_user(user["email"])
+    if "timezone" in changes and changes["timezone"] != user.get("timezone"):
+        # Rollups and cohorts are bucketed by local day and month
+        background_tasks.add_task(rebuild_for_timezone, str(user["_id"]), changes["timezone"])
+    return _profile({**user, **changes})
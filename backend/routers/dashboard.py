@@ -1,94 +1,124 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Depends
 from typing import Optional
 from models.analytics import MetricData, ChartDataPoint, PlatformMetric
-from datetime import datetime, timedelta
-import random
+from database import get_database
+from services.rollups import sum_rollups
+from services.segments import get_segments, dashboard_summaries
+from utils.auth import get_current_user, get_tenant_id, get_user_timezone
+from utils.cache import cached_route
+from utils.serialization import FastJSONRoute
+from datetime import datetime, timedelta, time
+from zoneinfo import ZoneInfo
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+def _metric(current: float, previous: float, digits: int = 2) -> MetricData:
+    change = round((current - previous) / previous * 100, 1) if previous else 0.0
+    return MetricData(
+        value=round(current, digits),
+        change=change,
+        trend="up" if change > 0 else "down" if change < 0 else "stable"
+    )
+
+def _ratio(numerator: float, denominator: float) -> float:
+    return numerator / denominator if denominator else 0.0
+
+def _period_days(time_range: str, tz: str):
+    """Current and preceding period as inclusive (first_day, last_day) strings"""
+    days = int(time_range.replace('d', ''))
+    today = datetime.now(ZoneInfo(tz)).date()
+    current_start = today - timedelta(days=days - 1)
+    previous_start = current_start - timedelta(days=days)
+    return {
+        "current": (current_start.isoformat(), today.isoformat()),
+        "previous": (previous_start.isoformat(), (current_start - timedelta(days=1)).isoformat())
+    }
 
 @router.get("/metrics")
+@cached_route()
 async def get_dashboard_metrics(
-    time_range: Optional[str] = Query("30d", regex="^(7d|15d|30d|90d)$")
+    time_range: Optional[str] = Query("30d", regex="^(7d|15d|30d|90d)$"),
+    user: dict = Depends(get_current_user)
 ):
-    # Mock data - replace with actual database queries
+    db = get_database()
+    tz = get_user_timezone(user)
+    totals = await sum_rollups(db, get_tenant_id(user), _period_days(time_range, tz))
+    current, previous = totals["current"], totals["previous"]
+    
     return {
-        "total_revenue": {
-            "value": 125000.50,
-            "change": 12.5,
-            "trend": "up"
-        },
-        "total_orders": {
-            "value": 1250,
-            "change": 8.3,
-            "trend": "up"
-        },
-        "average_order_value": {
-            "value": 100.00,
-            "change": 3.8,
-            "trend": "up"
-        },
-        "conversion_rate": {
-            "value": 3.2,
-            "change": -0.5,
-            "trend": "down"
-        },
-        "customer_acquisition_cost": {
-            "value": 25.50,
-            "change": -5.2,
-            "trend": "down"
-        },
-        "return_on_ad_spend": {
-            "value": 4.2,
-            "change": 15.8,
-            "trend": "up"
-        }
+        "total_revenue": _metric(current["revenue"], previous["revenue"]),
+        "total_orders": _metric(current["orders"], previous["orders"], 0),
+        "average_order_value": _metric(
+            _ratio(current["revenue"], current["orders"]),
+            _ratio(previous["revenue"], previous["orders"])
+        ),
+        "conversion_rate": _metric(
+            _ratio(current["conversions"], current["clicks"]) * 100,
+            _ratio(previous["conversions"], previous["clicks"]) * 100,
+            1
+        ),
+        "customer_acquisition_cost": _metric(
+            _ratio(current["ad_spend"], current["new_customers"]),
+            _ratio(previous["ad_spend"], previous["new_customers"])
+        ),
+        "return_on_ad_spend": _metric(
+            _ratio(current["revenue"], current["ad_spend"]),
+            _ratio(previous["revenue"], previous["ad_spend"]),
+            1
+        )
     }
 
 @router.get("/charts/revenue")
+@cached_route()
 async def get_revenue_chart(
-    time_range: Optional[str] = Query("30d", regex="^(7d|15d|30d|90d)$")
+    time_range: Optional[str] = Query("30d", regex="^(7d|15d|30d|90d)$"),
+    user: dict = Depends(get_current_user)
 ):
-    # Generate mock data based on time range
+    db = get_database()
+    tz = get_user_timezone(user)
+    zone = ZoneInfo(tz)
     days = int(time_range.replace('d', ''))
-    data = []
+    today = datetime.now(zone).date()
+    first_day = today - timedelta(days=days - 1)
+    start = datetime.combine(first_day, time.min, tzinfo=zone)
+    end = datetime.combine(today + timedelta(days=1), time.min, tzinfo=zone)
+    
+    # Orders are summed per local day inside MongoDB on the (tenant_id, created_at)
+    # index; only one small row per day with sales comes back
+    pipeline = [
+        {"$match": {
+            "tenant_id": get_tenant_id(user),
+            "created_at": {"$gte": start, "$lt": end},
+            "cancelled_at": None
+        }},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": tz}},
+            "value": {"$sum": "$total_price"}
+        }}
+    ]
+    totals = {row["_id"]: row["value"] async for row in db.orders.aggregate(pipeline)}
     
+    data = []
     for i in range(days):
-        date = (datetime.now() - timedelta(days=days-i-1)).strftime("%Y-%m-%d")
-        value = random.uniform(3000, 5000)
-        data.append({"date": date, "value": round(value, 2)})
+        date = (first_day + timedelta(days=i)).isoformat()
+        data.append(ChartDataPoint(date=date, value=round(totals.get(date, 0.0), 2)))
     
     return {"data": data}
 
 @router.get("/charts/platforms")
-async def get_platform_metrics():
+@cached_route()
+async def get_platform_metrics(user: dict = Depends(get_current_user)):
     return {
         "data": [
-            {
-                "platform": "Shopify",
-                "revenue": 75000.00,
-                "orders": 750,
-                "aov": 100.00,
-                "roas": 4.5
-            },
-            {
-                "platform": "Facebook Ads",
-                "revenue": 30000.00,
-                "orders": 300,
-                "aov": 100.00,
-                "roas": 3.8
-            },
-            {
-                "platform": "Google Ads",
-                "revenue": 20000.00,
-                "orders": 200,
-                "aov": 100.00,
-                "roas": 4.2
-            }
+            PlatformMetric(platform="Shopify", revenue=75000.00, orders=750, aov=100.00, roas=4.5),
+            PlatformMetric(platform="Facebook Ads", revenue=30000.00, orders=300, aov=100.00, roas=3.8),
+            PlatformMetric(platform="Google Ads", revenue=20000.00, orders=200, aov=100.00, roas=4.2)
         ]
     }
 
 @router.get("/charts/conversion-funnel")
-async def get_conversion_funnel():
+@cached_route()
+async def get_conversion_funnel(user: dict = Depends(get_current_user)):
     return {
         "data": [
             {"stage": "Visitors", "value": 10000, "percentage": 100},
@@ -100,11 +130,9 @@ async def get_conversion_funnel():
     }
 
 @router.get("/charts/customer-segments")
-async def get_customer_segments():
-    return {
-        "data": [
-            {"segment": "New Customers", "count": 450, "revenue": 45000, "percentage": 36},
-            {"segment": "Returning Customers", "count": 600, "revenue": 60000, "percentage": 48},
-            {"segment": "VIP Customers", "count": 200, "revenue": 20000, "percentage": 16}
-        ]
-    }
+@cached_route()
+async def get_customer_segments(user: dict = Depends(get_current_user)):
+    # Shares the stored RFM result with /api/analytics/customer-segments
+    db = get_database()
+    result = await get_segments(db, get_tenant_id(user))
+    return {"data": dashboard_summaries(result)}
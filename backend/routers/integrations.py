@@ -1,44 +1,66 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List, Dict, Any
 from models.analytics import Integration
+from database import get_database, register_indexes, register_hot_query
+from services.sync import RESOURCES
+from services.jobs import job_runner, serialize_job
+from utils.auth import get_current_user, get_tenant_id
+from utils.serialization import FastJSONRoute
 from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+register_indexes("integrations", IndexModel([("user_id", ASCENDING), ("platform", ASCENDING)], unique=True))
+register_hot_query("integrations", {"user_id": ""})
+
+PLATFORM_NAMES = {
+    "shopify": "Shopify",
+    "facebook_ads": "Facebook Ads",
+    "google_ads": "Google Ads",
+    "shiprocket": "Shiprocket",
+    "amazon": "Amazon Seller Central",
+    "flipkart": "Flipkart Seller Hub"
+}
+
+REQUIRED_CREDENTIALS = {
+    "shopify": ["shop_domain", "access_token"],
+    "facebook_ads": ["access_token", "ad_account_id"],
+    "google_ads": ["developer_token", "client_id", "client_secret", "refresh_token", "customer_id"],
+    "shiprocket": ["email", "password"]
+}
+
+def _serialize_integration(integration: Dict[str, Any]) -> Dict[str, Any]:
+    last_sync = integration.get("last_sync")
+    return {
+        "id": str(integration["_id"]),
+        "platform": integration["platform"],
+        "platform_name": integration["platform_name"],
+        "status": integration["status"],
+        "last_sync": last_sync.isoformat() + "Z" if last_sync else None
+    }
+
+async def _get_user_integration(integration_id: str, user: dict) -> Dict[str, Any]:
+    db = get_database()
+    integration = None
+    if ObjectId.is_valid(integration_id):
+        integration = await db.integrations.find_one(
+            {"_id": ObjectId(integration_id), "user_id": get_tenant_id(user)}
+        )
+    if not integration:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Integration not found"
+        )
+    return integration
 
 @router.get("/")
-async def get_integrations():
-    # Mock data - replace with actual database queries
+async def get_integrations(user: dict = Depends(get_current_user)):
+    db = get_database()
+    cursor = db.integrations.find({"user_id": get_tenant_id(user)}, {"credentials": 0})
     return {
-        "integrations": [
-            {
-                "id": "1",
-                "platform": "shopify",
-                "platform_name": "Shopify",
-                "status": "connected",
-                "last_sync": "2024-01-15T10:30:00Z"
-            },
-            {
-                "id": "2",
-                "platform": "facebook_ads",
-                "platform_name": "Facebook Ads",
-                "status": "connected",
-                "last_sync": "2024-01-15T09:15:00Z"
-            },
-            {
-                "id": "3",
-                "platform": "google_ads",
-                "platform_name": "Google Ads",
-                "status": "disconnected",
-                "last_sync": None
-            },
-            {
-                "id": "4",
-                "platform": "shiprocket",
-                "platform_name": "Shiprocket",
-                "status": "connected",
-                "last_sync": "2024-01-15T08:45:00Z"
-            }
-        ]
+        "integrations": [_serialize_integration(integration) async for integration in cursor]
     }
 
 @router.get("/available")
@@ -91,7 +113,7 @@ async def get_available_integrations():
     }
 
 @router.post("/connect")
-async def connect_integration(integration_data: Dict[str, Any]):
+async def connect_integration(integration_data: Dict[str, Any], user: dict = Depends(get_current_user)):
     platform = integration_data.get("platform")
     credentials = integration_data.get("credentials", {})
     
@@ -100,26 +122,74 @@ async def connect_integration(integration_data: Dict[str, Any]):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Platform is required"
         )
+    if platform not in PLATFORM_NAMES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported platform: {platform}"
+        )
+    missing = [field for field in REQUIRED_CREDENTIALS.get(platform, []) if not credentials.get(field)]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Missing credentials: {', '.join(missing)}"
+        )
+    
+    db = get_database()
+    result = await db.integrations.find_one_and_update(
+        {"user_id": get_tenant_id(user), "platform": platform},
+        {
+            "$set": {
+                "platform_name": PLATFORM_NAMES[platform],
+                "status": "connected",
+                "credentials": credentials
+            },
+            "$setOnInsert": {"last_sync": None, "created_at": datetime.utcnow()}
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
     
-    # Mock connection - replace with actual integration logic
     return {
         "message": f"Successfully connected to {platform}",
         "status": "connected",
-        "platform": platform
+        "platform": platform,
+        "id": str(result["_id"])
     }
 
-@router.post("/{integration_id}/sync")
-async def sync_integration(integration_id: str):
-    # Mock sync - replace with actual sync logic
+@router.post("/{integration_id}/sync", status_code=status.HTTP_202_ACCEPTED)
+async def sync_integration(integration_id: str, user: dict = Depends(get_current_user)):
+    integration = await _get_user_integration(integration_id, user)
+    if integration["platform"] not in RESOURCES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Sync is not supported for {integration['platform_name']}"
+        )
+    
+    job = await job_runner.enqueue(integration)
     return {
-        "message": "Sync completed successfully",
-        "last_sync": datetime.utcnow().isoformat(),
-        "records_synced": 150
+        "message": "Sync queued",
+        "job_id": str(job["_id"]),
+        "status": job["status"]
     }
 
+@router.get("/jobs/{job_id}")
+async def get_sync_job(job_id: str, user: dict = Depends(get_current_user)):
+    job = await job_runner.get_job(job_id, get_tenant_id(user))
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sync job not found"
+        )
+    return serialize_job(job)
+
 @router.delete("/{integration_id}")
-async def disconnect_integration(integration_id: str):
-    # Mock disconnect - replace with actual disconnect logic
+async def disconnect_integration(integration_id: str, user: dict = Depends(get_current_user)):
+    integration = await _get_user_integration(integration_id, user)
+    
+    db = get_database()
+    await db.integrations.delete_one({"_id": integration["_id"]})
+    await db.sync_state.delete_many({"integration_id": integration_id})
+    await db.sync_jobs.delete_many({"integration_id": integration_id, "status": "queued"})
     return {
         "message": "Integration disconnected successfully"
     }
@@ -0,0 +1,164 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from database import register_indexes, register_hot_query
+from services.customers import refresh_customer_stats
+from services.snapshots import order_frame
+
+# One document per (tenant, cohort month) holding the number of the cohort's
+# customers that ordered in each calendar month: {"active": {"2024-03": 41}}
+register_indexes("cohorts", IndexModel([("tenant_id", ASCENDING), ("cohort", ASCENDING)], unique=True))
+register_hot_query("cohorts", {"tenant_id": ""}, [("cohort", ASCENDING)])
+
+def month_index(values: pd.Series, tz: str) -> np.ndarray:
+    """Months since year 0 of UTC timestamps, taken in the tenant's timezone"""
+    local = pd.to_datetime(values, utc=True).dt.tz_convert(tz)
+    return (local.dt.year * 12 + local.dt.month - 1).to_numpy()
+
+def _label(month: int) -> str:
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+def _parse(label: str) -> int:
+    year, month = label[:7].split("-")
+    return int(year) * 12 + int(month) - 1
+
+def _month_bounds(month: int, tz: str) -> Tuple[datetime, datetime]:
+    zone = ZoneInfo(tz)
+    start = datetime(month // 12, month % 12 + 1, 1, tzinfo=zone)
+    end = datetime((month + 1) // 12, (month + 1) % 12 + 1, 1, tzinfo=zone)
+    return start, end
+
+def _cells(pairs: pd.DataFrame, cohort: pd.Series) -> pd.Series:
+    """Distinct active customers per (cohort, month) for (customer_id, month) pairs"""
+    pairs = pairs.assign(cohort=pairs["customer_id"].map(cohort)).dropna(subset=["cohort"])
+    return pairs.groupby([pairs["cohort"].astype(int), "month"]).size()
+
+async def customers_ordering_in(db, tenant_id: str, months: Iterable[str], tz: str = "UTC") -> List[str]:
+    """Customers with an order, cancelled or not, created in one of ``months``"""
+    ranges = [_month_bounds(month, tz) for month in sorted({_parse(label) for label in months})]
+    if not ranges:
+        return []
+    orders = await order_frame(db, tenant_id, ["customer_id"], ranges=ranges)
+    return orders["customer_id"].unique().tolist()
+
+async def refresh_cohorts(db, tenant_id: str, months: Optional[Iterable[str]] = None, tz: str = "UTC",
+                          stats: Optional[pd.DataFrame] = None):
+    """Bring the stored cohort matrix up to date after orders in ``months`` changed.
+
+    Every cell whose activity month is in ``months`` is recounted from that
+    month's orders. Customers whose first order moved (a back-dated order, a
+    cancellation) are also shifted between cohorts in their other months with
+    +1/-1 increments, so no untouched month is re-read. Without ``months``,
+    or before anything is stored, the whole matrix is rebuilt.
+
+    Moves are read from ``stats``, what refresh_customer_stats returned for
+    (at least) customers_ordering_in(months); the caller passes it when it
+    refreshed customer_stats itself, otherwise it is refreshed here.
+    """
+    full = months is None or await db.cohorts.find_one({"tenant_id": tenant_id}, {"_id": 1}) is None
+    window = sorted({_parse(label) for label in months or []})
+    if not full and not window:
+        return
+
+    # Cancelled orders are loaded too: their customers' stats may have changed
+    orders = await order_frame(
+        db, tenant_id, ["customer_id", "created_at", "cancelled_at"],
+        ranges=None if full else [_month_bounds(month, tz) for month in window]
+    )
+    if full or stats is None:
+        stats = await refresh_customer_stats(db, tenant_id, None if full else orders["customer_id"].unique().tolist())
+    cohort = pd.Series(month_index(stats["first_order_at"], tz), index=stats.index)
+    previous = pd.Series(month_index(stats["previous_first_order_at"], tz), index=stats.index)
+
+    active = orders[orders["cancelled_at"].isna()]
+    pairs = pd.DataFrame({
+        "customer_id": active["customer_id"].to_numpy(),
+        "month": month_index(active["created_at"], tz)
+    }).drop_duplicates()
+    if full:
+        window = sorted(pairs["month"].unique().tolist())
+    counts = _cells(pairs, cohort)
+
+    # Moved customers: undo their old cohort and count the new one outside the window
+    increments = pd.Series(dtype=int)
+    moved = stats.index[(cohort != previous) & ~(cohort.isna() & previous.isna())] if not full else []
+    if len(moved):
+        history = await order_frame(
+            db, tenant_id, ["customer_id", "created_at"], customer_ids=moved.tolist(), active_only=True
+        )
+        history = pd.DataFrame({
+            "customer_id": history["customer_id"].to_numpy(),
+            "month": month_index(history["created_at"], tz)
+        }).drop_duplicates()
+        history = history[~history["month"].isin(window)]
+        increments = _cells(history, cohort).sub(_cells(history, previous), fill_value=0)
+        increments = increments[increments != 0]
+
+    updates: Dict[int, Dict[str, Dict[str, Any]]] = defaultdict(lambda: defaultdict(dict))
+    if full:
+        for (cohort_month, month), value in counts.items():
+            updates[int(cohort_month)]["$set"].setdefault("active", {})[_label(month)] = int(value)
+    else:
+        existing = [_parse(doc["cohort"]) async for doc in db.cohorts.find({"tenant_id": tenant_id}, {"cohort": 1})]
+        for cohort_month in set(existing) | set(counts.index.get_level_values(0)):
+            for month in window:
+                if month < cohort_month:
+                    continue
+                value = int(counts.get((cohort_month, month), 0))
+                if value:
+                    updates[cohort_month]["$set"][f"active.{_label(month)}"] = value
+                else:
+                    updates[cohort_month]["$unset"][f"active.{_label(month)}"] = ""
+        for (cohort_month, month), value in increments.items():
+            updates[int(cohort_month)]["$inc"][f"active.{_label(month)}"] = int(value)
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"tenant_id": tenant_id, "cohort": _label(cohort_month)},
+            {**update, "$set": {**update["$set"], "updated_at": now}},
+            upsert=True
+        )
+        for cohort_month, update in updates.items()
+    ]
+    if operations:
+        await db.cohorts.bulk_write(operations, ordered=False)
+    # Cohorts that lost every customer (or, on a rebuild, no longer exist); a
+    # cohort's size is its count in its own first month
+    stale = [
+        {"cohort": _label(cohort_month), f"active.{_label(cohort_month)}": {"$not": {"$gt": 0}}}
+        for cohort_month in updates
+    ]
+    if full:
+        stale.append({"cohort": {"$nin": [_label(cohort_month) for cohort_month in updates]}})
+    if stale:
+        await db.cohorts.delete_many({"tenant_id": tenant_id, "$or": stale})
+
+async def get_cohorts(db, tenant_id: str, tz: str = "UTC") -> List[Dict[str, Any]]:
+    """Stored cohort matrix as retention percentages by months since the first order"""
+    current = _parse(datetime.now(ZoneInfo(tz)).strftime("%Y-%m"))
+    cohorts = []
+    async for doc in db.cohorts.find({"tenant_id": tenant_id}).sort("cohort", ASCENDING):
+        start = _parse(doc["cohort"])
+        active = doc.get("active", {})
+        size = active.get(doc["cohort"], 0)
+        if not size:
+            continue
+        retention = [
+            round(active.get(_label(month), 0) / size * 100, 1)
+            for month in range(start, max(start, current) + 1)
+        ]
+        cohorts.append({
+            "month": doc["cohort"],
+            "customers": size,
+            # Share of the cohort that ordered again in the following month
+            "retention_rate": retention[1] if len(retention) > 1 else None,
+            "retention": retention
+        })
+    return cohorts
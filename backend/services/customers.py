@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from pymongo import ASCENDING, DeleteOne, IndexModel, UpdateOne
+
+from database import register_indexes, register_hot_query
+
+# Customers are looked up in chunks so $in lists stay small
+CUSTOMER_CHUNK_SIZE = 10000
+
+STAT_COLUMNS = ["first_order_at", "last_order_at", "orders", "revenue"]
+
+register_indexes(
+    "customer_stats",
+    IndexModel([("tenant_id", ASCENDING), ("customer_id", ASCENDING)], unique=True)
+)
+register_indexes(
+    "orders",
+    IndexModel(
+        [("tenant_id", ASCENDING), ("customer_id", ASCENDING), ("created_at", ASCENDING)],
+        name="tenant_customer_created_at"
+    )
+)
+register_hot_query("orders", {"tenant_id": "", "customer_id": {"$in": [""]}, "cancelled_at": None})
+
+async def load_frame(cursor, columns: List[str]) -> pd.DataFrame:
+    """Materialize a cursor of flat documents as a DataFrame with fixed columns"""
+    return pd.DataFrame(await cursor.to_list(length=None), columns=columns)
+
+def _stats_pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {"$match": {**match, "cancelled_at": None}},
+        {"$group": {
+            "_id": "$customer_id",
+            "first_order_at": {"$min": "$created_at"},
+            "last_order_at": {"$max": "$created_at"},
+            "orders": {"$sum": 1},
+            "revenue": {"$sum": "$total_price"}
+        }}
+    ]
+
+async def refresh_customer_stats(db, tenant_id: str, customer_ids: Optional[List[str]] = None) -> pd.DataFrame:
+    """Recompute the per-customer order totals in ``customer_stats``.
+
+    Only the given customers are refreshed (every customer of the tenant when
+    None). Returns their new stats indexed by customer_id, with the previous
+    ``first_order_at`` alongside so callers can see who changed cohort;
+    customers left without orders have empty stats.
+    """
+    base = {"tenant_id": tenant_id, "customer_id": {"$ne": None}}
+    chunks = [None] if customer_ids is None else [
+        customer_ids[i:i + CUSTOMER_CHUNK_SIZE] for i in range(0, len(customer_ids), CUSTOMER_CHUNK_SIZE)
+    ]
+    frames = []
+    now = datetime.utcnow()
+    for chunk in chunks:
+        match = base if chunk is None else {"tenant_id": tenant_id, "customer_id": {"$in": chunk}}
+        previous = await load_frame(
+            db.customer_stats.find(match, {"_id": 0, "customer_id": 1, "first_order_at": 1}),
+            ["customer_id", "first_order_at"]
+        )
+        current = await load_frame(db.orders.aggregate(_stats_pipeline(match)), ["_id"] + STAT_COLUMNS)
+        current = current.rename(columns={"_id": "customer_id"})
+
+        operations = [
+            UpdateOne(
+                {"tenant_id": tenant_id, "customer_id": row["customer_id"]},
+                {"$set": {**row, "updated_at": now}},
+                upsert=True
+            )
+            for row in current.to_dict("records")
+        ]
+        gone = set(previous["customer_id"]) - set(current["customer_id"])
+        operations += [DeleteOne({"tenant_id": tenant_id, "customer_id": customer_id}) for customer_id in gone]
+        if operations:
+            await db.customer_stats.bulk_write(operations, ordered=False)
+
+        previous = previous.rename(columns={"first_order_at": "previous_first_order_at"})
+        frames.append(current.merge(previous, on="customer_id", how="outer"))
+
+    if not frames:
+        return pd.DataFrame(columns=STAT_COLUMNS + ["previous_first_order_at"])
+    return pd.concat(frames, ignore_index=True).set_index("customer_id")
@@ -0,0 +1,161 @@
+import csv
+import io
+import os
+import zlib
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from pymongo import ASCENDING, IndexModel
+
+from database import register_indexes, register_hot_query
+from utils.serialization import dumps
+
+# Rows pulled from the cursor (and written out) per step; memory stays bounded by this
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+# dataset -> (collection, date field, whether the date field is a "YYYY-MM-DD" string, columns)
+EXPORTS: Dict[str, Tuple[str, str, bool, List[Tuple[str, str]]]] = {
+    "orders": ("orders", "created_at", False, [
+        ("external_id", "str"), ("order_number", "int"), ("platform", "str"), ("customer_id", "str"),
+        ("created_at", "datetime"), ("updated_at", "datetime"), ("cancelled_at", "datetime"),
+        ("financial_status", "str"), ("currency", "str"), ("source_name", "str"),
+        ("total_price", "float"), ("subtotal_price", "float"), ("total_discounts", "float"), ("total_tax", "float")
+    ]),
+    "daily_rollups": ("daily_rollups", "date", True, [
+        ("date", "str"), ("platform", "str"), ("revenue", "float"), ("orders", "int"), ("new_customers", "int"),
+        ("ad_spend", "float"), ("impressions", "int"), ("clicks", "int"), ("conversions", "float"), ("conversion_value", "float")
+    ]),
+    "campaign_metrics": ("campaign_metrics", "date", True, [
+        ("date", "str"), ("platform", "str"), ("campaign_id", "str"), ("campaign_name", "str"), ("spend", "float"),
+        ("impressions", "int"), ("clicks", "int"), ("conversions", "float"), ("conversion_value", "float")
+    ])
+}
+
+# Exports read one tenant's rows by date in date order. orders and daily_rollups
+# already have (tenant_id, date, ...) indexes; campaign_metrics is otherwise
+# indexed by platform first, which would leave MongoDB sorting the whole export
+register_indexes("campaign_metrics", IndexModel([("tenant_id", ASCENDING), ("date", ASCENDING)], name="tenant_date"))
+for collection, date_field, date_is_string, _ in EXPORTS.values():
+    bound = "" if date_is_string else datetime.min
+    register_hot_query(collection, {"tenant_id": "", date_field: {"$gte": bound}}, [(date_field, ASCENDING)])
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+async def iter_batches(db, dataset: str, tenant_id: str, start: Optional[date], end: Optional[date], tz: str) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Rows of a dataset for the tenant, oldest first, in batches of EXPORT_BATCH_SIZE"""
+    collection, date_field, date_is_string, columns = EXPORTS[dataset]
+    match: Dict[str, Any] = {"tenant_id": tenant_id}
+    bounds: Dict[str, Any] = {}
+    if date_is_string:
+        if start:
+            bounds["$gte"] = start.isoformat()
+        if end:
+            bounds["$lte"] = end.isoformat()
+    else:
+        # Inclusive local days of the tenant
+        zone = ZoneInfo(tz)
+        if start:
+            bounds["$gte"] = datetime.combine(start, time.min, tzinfo=zone)
+        if end:
+            bounds["$lt"] = datetime.combine(end + timedelta(days=1), time.min, tzinfo=zone)
+    if bounds:
+        match[date_field] = bounds
+
+    projection = {"_id": 0, **{name: 1 for name, _ in columns}}
+    cursor = db[collection].find(match, projection).sort(date_field, 1).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) == EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _text(value: Any) -> Any:
+    if isinstance(value, datetime):
+        # MongoDB hands back naive UTC datetimes
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+    return value
+
+async def _csv(batches: AsyncIterator[List[Dict[str, Any]]], columns: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for batch in batches:
+        writer.writerows([_text(doc.get(name)) for name in columns] for doc in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def _ndjson(batches: AsyncIterator[List[Dict[str, Any]]], columns: List[str]) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield b"".join(dumps({name: doc.get(name) for name in columns}, naive_utc=True) + b"\n" for doc in batch)
+
+class _ChunkSink:
+    """Write-only file object collecting what pyarrow writes until it is drained"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+async def _parquet(batches: AsyncIterator[List[Dict[str, Any]]], columns: List[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"str": pa.string(), "int": pa.int64(), "float": pa.float64(), "datetime": pa.timestamp("ms", tz="UTC")}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _ChunkSink()
+    # Each batch becomes one row group, flushed to the client as soon as it is written
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        async for batch in batches:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def stream_export(db, dataset: str, export_format: str, tenant_id: str, start: Optional[date] = None,
+                  end: Optional[date] = None, tz: str = "UTC", compress: bool = False) -> AsyncIterator[bytes]:
+    """Encoded bytes of an export, produced batch by batch straight from the cursor"""
+    columns = EXPORTS[dataset][3]
+    batches = iter_batches(db, dataset, tenant_id, start, end, tz)
+    if export_format == "parquet":
+        # Parquet pages are compressed already
+        return _parquet(batches, columns)
+    names = [name for name, _ in columns]
+    chunks = _csv(batches, names) if export_format == "csv" else _ndjson(batches, names)
+    return _gzip(chunks) if compress else chunks
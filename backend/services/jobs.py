@@ -0,0 +1,293 @@
+import asyncio
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import get_database, register_indexes, register_hot_query
+from services.sync import SyncEngine, RESOURCES
+
+register_indexes(
+    "sync_jobs",
+    IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+    IndexModel(
+        [("integration_id", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"active": True},
+        name="one_active_job_per_integration"
+    )
+)
+register_indexes("integrations", IndexModel([("next_sync_at", ASCENDING)]))
+register_hot_query("sync_jobs", {"status": "queued"}, [("created_at", ASCENDING)])
+register_hot_query("integrations", {"$or": [{"next_sync_at": {"$lte": datetime.utcnow()}}, {"next_sync_at": None}]})
+
+def serialize_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": str(job["_id"]),
+        "integration_id": job["integration_id"],
+        "platform": job["platform"],
+        "trigger": job["trigger"],
+        "status": job["status"],
+        "progress": job.get("progress", {}),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job["created_at"].isoformat(),
+        "started_at": job["started_at"].isoformat() if job.get("started_at") else None,
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None
+    }
+
+class SyncJobRunner:
+    """Runs integration syncs as background jobs persisted in ``sync_jobs``.
+
+    Jobs are claimed with an atomic queued -> running transition, so several
+    API workers can share one queue. Each process runs at most ``workers``
+    jobs and never more than ``per_tenant`` for the same tenant; among
+    eligible tenants the one served least recently goes first, so a tenant
+    with many integrations cannot starve the others.
+    """
+
+    def __init__(self):
+        self.workers = int(os.getenv("SYNC_WORKERS", "4"))
+        self.per_tenant = int(os.getenv("SYNC_MAX_JOBS_PER_TENANT", "1"))
+        self.poll_interval = float(os.getenv("SYNC_POLL_SECONDS", "5"))
+        self.schedule_interval = float(os.getenv("SYNC_SCHEDULE_POLL_SECONDS", "60"))
+        self.default_sync_minutes = int(os.getenv("SYNC_INTERVAL_MINUTES", "60"))
+        self.stale_after = timedelta(minutes=int(os.getenv("SYNC_STALE_JOB_MINUTES", "10")))
+        # Running jobs refresh heartbeat_at this often, whether or not they report progress,
+        # and the dispatch loop sweeps for stale jobs at the same pace
+        self.heartbeat_interval = float(os.getenv("SYNC_HEARTBEAT_SECONDS", "30"))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._running_by_tenant: Dict[str, int] = {}
+        self._last_served: Dict[str, float] = {}
+        self._loops: list = []
+        self._last_sweep = 0.0
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        await self._requeue_stale_jobs()
+        self._loops = [
+            asyncio.create_task(self._dispatch_loop()),
+            asyncio.create_task(self._schedule_loop())
+        ]
+
+    async def stop(self):
+        for task in self._loops + list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._loops, *self._tasks.values(), return_exceptions=True)
+        self._loops, self._tasks = [], {}
+
+    async def _requeue_stale_jobs(self):
+        # Jobs whose worker died stay "running"; the sync engine resumes them from
+        # their last checkpoint once they are picked up again
+        self._last_sweep = asyncio.get_running_loop().time()
+        db = get_database()
+        await db.sync_jobs.update_many(
+            {"status": "running", "heartbeat_at": {"$lt": datetime.utcnow() - self.stale_after}},
+            {"$set": {"status": "queued", "worker": None}}
+        )
+
+    async def enqueue(self, integration: Dict[str, Any], trigger: str = "manual") -> Dict[str, Any]:
+        """Queue a sync of the integration, reusing a job that is already pending"""
+        db = get_database()
+        integration_id = str(integration["_id"])
+        # "active" marks queued/running jobs; a partial unique index on it keeps
+        # one pending job per integration even under concurrent enqueues
+        pending = {"integration_id": integration_id, "active": True}
+        try:
+            job = await db.sync_jobs.find_one_and_update(
+                pending,
+                {"$setOnInsert": {
+                    "tenant_id": integration["user_id"],
+                    "platform": integration["platform"],
+                    "trigger": trigger,
+                    "status": "queued",
+                    "progress": {},
+                    "created_at": datetime.utcnow()
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            job = await db.sync_jobs.find_one(pending)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get_job(self, job_id: str, tenant_id: str) -> Optional[Dict[str, Any]]:
+        if not ObjectId.is_valid(job_id):
+            return None
+        db = get_database()
+        return await db.sync_jobs.find_one({"_id": ObjectId(job_id), "tenant_id": tenant_id})
+
+    async def _claim_next(self) -> Optional[Dict[str, Any]]:
+        db = get_database()
+        candidates = await db.sync_jobs.find(
+            {"status": "queued"}, {"tenant_id": 1, "created_at": 1}
+        ).sort("created_at", 1).limit(500).to_list(length=500)
+
+        # Oldest job of every tenant with spare capacity, least recently served tenant first
+        oldest: Dict[str, Dict[str, Any]] = {}
+        for job in candidates:
+            tenant_id = job["tenant_id"]
+            if tenant_id not in oldest and self._running_by_tenant.get(tenant_id, 0) < self.per_tenant:
+                oldest[tenant_id] = job
+        for tenant_id in sorted(oldest, key=lambda t: self._last_served.get(t, 0.0)):
+            now = datetime.utcnow()
+            job = await db.sync_jobs.find_one_and_update(
+                {"_id": oldest[tenant_id]["_id"], "status": "queued"},
+                {"$set": {"status": "running", "worker": self.worker_id, "started_at": now, "heartbeat_at": now}},
+                return_document=ReturnDocument.AFTER
+            )
+            if job:
+                return job
+        return None
+
+    async def _dispatch_loop(self):
+        while True:
+            try:
+                if asyncio.get_running_loop().time() - self._last_sweep >= self.heartbeat_interval:
+                    await self._requeue_stale_jobs()
+                while len(self._tasks) < self.workers:
+                    job = await self._claim_next()
+                    if job is None:
+                        break
+                    self._start(job)
+            except Exception as e:
+                print(f"Error dispatching sync jobs: {e}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, job: Dict[str, Any]):
+        job_id = str(job["_id"])
+        tenant_id = job["tenant_id"]
+        self._running_by_tenant[tenant_id] = self._running_by_tenant.get(tenant_id, 0) + 1
+        self._last_served[tenant_id] = asyncio.get_running_loop().time()
+
+        def finished(_):
+            self._tasks.pop(job_id, None)
+            self._running_by_tenant[tenant_id] -= 1
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+        task = asyncio.create_task(self._run(job))
+        task.add_done_callback(finished)
+        self._tasks[job_id] = task
+
+    async def _run(self, job: Dict[str, Any]):
+        db = get_database()
+        integration = await db.integrations.find_one({"_id": ObjectId(job["integration_id"])})
+        if not integration:
+            await self._finish(job, "failed", error="Integration no longer exists")
+            return
+
+        async def progress(resource: str, records: int):
+            await db.sync_jobs.update_one(
+                {"_id": job["_id"]},
+                {"$set": {f"progress.{resource}": records, "heartbeat_at": datetime.utcnow()}}
+            )
+
+        heartbeat = asyncio.create_task(self._heartbeat(job, asyncio.current_task()))
+        try:
+            try:
+                results = await SyncEngine(integration, progress=progress).run()
+            finally:
+                heartbeat.cancel()
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so another worker resumes it (unless it already has)
+            await db.sync_jobs.update_one(
+                {"_id": job["_id"], "status": "running", "worker": self.worker_id},
+                {"$set": {"status": "queued", "worker": None}}
+            )
+            raise
+        except Exception as e:
+            print(f"Error running sync job {job['_id']}: {e}")
+            await self._finish(job, "failed", error=str(e))
+            await db.integrations.update_one({"_id": integration["_id"]}, {"$set": {"status": "error"}})
+            return
+
+        errors = {name: result["error"] for name, result in results.items() if "error" in result}
+        now = datetime.utcnow()
+        await db.integrations.update_one(
+            {"_id": integration["_id"]},
+            {"$set": {"last_sync": now, "status": "error" if errors else "connected"}}
+        )
+        await self._finish(
+            job,
+            "failed" if errors else "succeeded",
+            result={
+                "records_synced": sum(result["records"] for result in results.values()),
+                "resources": results
+            },
+            error="; ".join(f"{name}: {error}" for name, error in errors.items()) or None
+        )
+
+    async def _heartbeat(self, job: Dict[str, Any], owner: asyncio.Task):
+        # Long waits without page checkpoints (Facebook report jobs, cohort and segment
+        # refreshes) would otherwise look stale and be requeued while still running
+        db = get_database()
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                beat = await db.sync_jobs.update_one(
+                    {"_id": job["_id"], "status": "running", "worker": self.worker_id},
+                    {"$set": {"heartbeat_at": datetime.utcnow()}}
+                )
+            except Exception as e:
+                print(f"Error refreshing heartbeat of sync job {job['_id']}: {e}")
+                continue
+            if not beat.matched_count:
+                # Requeued as stale meanwhile (e.g. MongoDB was unreachable for too long);
+                # stop so two runs never work on the same sync state
+                print(f"Sync job {job['_id']} was requeued elsewhere, stopping this run")
+                owner.cancel()
+                return
+
+    async def _finish(self, job: Dict[str, Any], status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        db = get_database()
+        await db.sync_jobs.update_one(
+            {"_id": job["_id"]},
+            {
+                "$set": {"status": status, "result": result, "error": error, "finished_at": datetime.utcnow()},
+                "$unset": {"active": ""}
+            }
+        )
+
+    async def _schedule_loop(self):
+        while True:
+            try:
+                await self._enqueue_due_syncs()
+            except Exception as e:
+                print(f"Error scheduling periodic syncs: {e}")
+            await asyncio.sleep(self.schedule_interval)
+
+    async def _enqueue_due_syncs(self):
+        db = get_database()
+        now = datetime.utcnow()
+        due = {
+            "status": {"$in": ["connected", "error"]},
+            "platform": {"$in": list(RESOURCES)},
+            "$or": [{"next_sync_at": {"$lte": now}}, {"next_sync_at": None}]
+        }
+        fields = {"user_id": 1, "platform": 1, "next_sync_at": 1, "sync_interval_minutes": 1}
+        async for integration in db.integrations.find(due, fields):
+            interval = integration.get("sync_interval_minutes") or self.default_sync_minutes
+            # Compare-and-set on next_sync_at so each due sync is queued by exactly one API worker
+            claimed = await db.integrations.update_one(
+                {"_id": integration["_id"], "next_sync_at": integration.get("next_sync_at")},
+                {"$set": {"next_sync_at": now + timedelta(minutes=interval)}}
+            )
+            if claimed.modified_count:
+                await self.enqueue(integration, trigger="scheduled")
+
+job_runner = SyncJobRunner()
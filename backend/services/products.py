@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+def parse_cursor(cursor: str) -> Tuple[float, str]:
+    """Keyset cursor "<revenue>:<product key>" of the last row of the previous page"""
+    revenue, key = cursor.split(":", 1)
+    return float(revenue), key
+
+def make_cursor(row: Dict[str, Any]) -> str:
+    return f"{row['revenue']!r}:{row['_id']}"
+
+async def top_products(db, tenant_id: str, since: Optional[datetime], limit: int, after: Optional[Tuple[float, str]] = None) -> List[Dict[str, Any]]:
+    """Best selling products by revenue, ``limit`` at a time after the ``after`` keyset.
+
+    Line items are grouped inside MongoDB, so the server holds one row per
+    product sold in the window (spilling to disk for large catalogues); the
+    $sort + $limit pair then runs as a top-K sort and only ``limit`` rows ever
+    reach this process.
+    """
+    match: Dict[str, Any] = {"tenant_id": tenant_id, "cancelled_at": None}
+    if since:
+        match["created_at"] = {"$gte": since}
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": match},
+        {"$project": {"line_items.product_id": 1, "line_items.title": 1, "line_items.quantity": 1, "line_items.price": 1}},
+        {"$unwind": "$line_items"},
+        {"$group": {
+            # Custom line items have no product, group them by title instead
+            "_id": {"$ifNull": ["$line_items.product_id", "$line_items.title"]},
+            "product_name": {"$max": "$line_items.title"},
+            "revenue": {"$sum": {"$multiply": ["$line_items.price", "$line_items.quantity"]}},
+            "units_sold": {"$sum": "$line_items.quantity"}
+        }}
+    ]
+    if after:
+        revenue, key = after
+        pipeline.append({"$match": {"$or": [
+            {"revenue": {"$lt": revenue}},
+            {"revenue": revenue, "_id": {"$gt": key}}
+        ]}})
+    pipeline += [{"$sort": {"revenue": -1, "_id": 1}}, {"$limit": limit}]
+    return await db.orders.aggregate(pipeline, allowDiskUse=True).to_list(length=limit)
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Iterable, Optional
+from zoneinfo import ZoneInfo
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from database import register_indexes, register_hot_query
+from models.common import resolve_timezone
+
+ROLLUP_FIELDS = {
+    "orders": ["revenue", "orders"],
+    "customers": ["new_customers"],
+    "campaign_metrics": ["ad_spend", "impressions", "clicks", "conversions", "conversion_value"]
+}
+
+register_indexes(
+    "daily_rollups",
+    IndexModel([("tenant_id", ASCENDING), ("date", ASCENDING), ("platform", ASCENDING)], unique=True)
+)
+# Order rollups and the revenue chart scan one tenant's orders by creation time
+register_indexes("orders", IndexModel([("tenant_id", ASCENDING), ("created_at", ASCENDING)], name="tenant_created_at"))
+register_indexes(
+    "campaign_metrics",
+    IndexModel([("tenant_id", ASCENDING), ("platform", ASCENDING), ("date", ASCENDING)], name="tenant_platform_date")
+)
+register_hot_query("daily_rollups", {"tenant_id": "", "date": {"$gte": "", "$lte": ""}})
+register_hot_query("orders", {"tenant_id": "", "created_at": {"$gte": datetime.min, "$lt": datetime.max}, "cancelled_at": None})
+register_hot_query("campaign_metrics", {"tenant_id": "", "platform": "", "date": {"$in": [""]}})
+
+async def get_tenant_timezone(db, tenant_id: str) -> str:
+    user = await db.users.find_one({"_id": ObjectId(tenant_id)}, {"timezone": 1}) if ObjectId.is_valid(tenant_id) else None
+    return resolve_timezone((user or {}).get("timezone"))
+
+def rollup_day(collection: str, doc: Dict[str, Any], tz: str) -> Optional[str]:
+    """Day bucket (in the tenant's timezone) a synced record contributes to"""
+    if collection == "campaign_metrics":
+        return doc.get("date")
+    if collection in ("orders", "customers") and doc.get("created_at"):
+        return doc["created_at"].astimezone(ZoneInfo(tz)).strftime("%Y-%m-%d")
+    return None
+
+def _day_bounds(days: List[str], tz: str):
+    zone = ZoneInfo(tz)
+    start = datetime.strptime(days[0], "%Y-%m-%d").replace(tzinfo=zone)
+    end = datetime.strptime(days[-1], "%Y-%m-%d").replace(tzinfo=zone) + timedelta(days=1)
+    return start, end
+
+def _pipeline(collection: str, tenant_id: str, platform: str, days: List[str], tz: str) -> List[Dict[str, Any]]:
+    match = {"tenant_id": tenant_id, "platform": platform}
+    if collection == "campaign_metrics":
+        match["date"] = {"$in": days}
+        return [
+            {"$match": match},
+            {"$group": {
+                "_id": "$date",
+                "ad_spend": {"$sum": "$spend"},
+                "impressions": {"$sum": "$impressions"},
+                "clicks": {"$sum": "$clicks"},
+                "conversions": {"$sum": "$conversions"},
+                "conversion_value": {"$sum": "$conversion_value"}
+            }}
+        ]
+
+    start, end = _day_bounds(days, tz)
+    match["created_at"] = {"$gte": start, "$lt": end}
+    if collection == "orders":
+        match["cancelled_at"] = None
+    day = {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": tz}}
+    group = {"_id": day}
+    if collection == "orders":
+        group.update(revenue={"$sum": "$total_price"}, orders={"$sum": 1})
+    else:
+        group.update(new_customers={"$sum": 1})
+    return [{"$match": match}, {"$group": group}, {"$match": {"_id": {"$in": days}}}]
+
+async def refresh_rollups(db, tenant_id: str, platform: str, collection: str, days: Iterable[str], tz: str = "UTC"):
+    """Recompute the daily_rollups fields fed by one synced collection for the given days"""
+    fields = ROLLUP_FIELDS.get(collection)
+    days = sorted(set(days))
+    if not fields or not days:
+        return
+
+    totals = {
+        row["_id"]: row
+        async for row in db[collection].aggregate(_pipeline(collection, tenant_id, platform, days, tz))
+    }
+    now = datetime.utcnow()
+    operations = []
+    for day in days:
+        # Days that lost all their records are reset to zero rather than skipped
+        row = totals.get(day, {})
+        values = {field: row.get(field, 0) for field in fields}
+        operations.append(UpdateOne(
+            {"tenant_id": tenant_id, "date": day, "platform": platform},
+            {"$set": {**values, "updated_at": now}},
+            upsert=True
+        ))
+    await db.daily_rollups.bulk_write(operations, ordered=False)
+
+async def rebuild_local_rollups(db, tenant_id: str, tz: str):
+    """Recompute the order and customer rollups of every day, e.g. after the tenant's timezone changed.
+
+    Their days are local to the tenant; ad metrics come dated by the platform
+    and are left as they are.
+    """
+    zone = ZoneInfo(tz)
+    today = datetime.now(zone).date()
+    for collection in ("orders", "customers"):
+        for platform in await db[collection].distinct("platform", {"tenant_id": tenant_id}):
+            first = await db[collection].find_one(
+                {"tenant_id": tenant_id, "platform": platform, "created_at": {"$ne": None}},
+                {"created_at": 1},
+                sort=[("created_at", ASCENDING)]
+            )
+            if not first:
+                continue
+            start = first["created_at"].replace(tzinfo=timezone.utc).astimezone(zone).date()
+            days = [(start + timedelta(days=offset)).isoformat() for offset in range((today - start).days + 1)]
+            await refresh_rollups(db, tenant_id, platform, collection, days, tz)
+            # A day before the first local one only had records in the old timezone
+            await db.daily_rollups.update_many(
+                {"tenant_id": tenant_id, "platform": platform, "date": {"$lt": days[0]}},
+                {"$set": {field: 0 for field in ROLLUP_FIELDS[collection]}}
+            )
+
+async def sum_rollups(db, tenant_id: str, periods: Dict[str, tuple]) -> Dict[str, Dict[str, float]]:
+    """Sum every rollup measure per named (first_day, last_day) period"""
+    first = min(start for start, _ in periods.values())
+    last = max(end for _, end in periods.values())
+    branches = [
+        {"case": {"$and": [{"$gte": ["$date", start]}, {"$lte": ["$date", end]}]}, "then": name}
+        for name, (start, end) in periods.items()
+    ]
+    measures = {field for fields in ROLLUP_FIELDS.values() for field in fields}
+    pipeline = [
+        {"$match": {"tenant_id": tenant_id, "date": {"$gte": first, "$lte": last}}},
+        {"$group": {
+            "_id": {"$switch": {"branches": branches, "default": None}},
+            **{field: {"$sum": f"${field}"} for field in measures}
+        }}
+    ]
+    totals = {name: {field: 0 for field in measures} for name in periods}
+    async for row in db.daily_rollups.aggregate(pipeline):
+        if row["_id"] in totals:
+            totals[row["_id"]].update({field: row[field] for field in measures})
+    return totals
@@ -0,0 +1,176 @@
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from database import register_indexes, register_hot_query
+from services.customers import CUSTOMER_CHUNK_SIZE, load_frame
+
+SEGMENTS = ["VIP", "High Value", "Regular", "New"]
+# Dashboard groups: VIP stays apart, repeat buyers are "returning"
+DASHBOARD_SEGMENTS = {
+    "New Customers": ["New"],
+    "Returning Customers": ["High Value", "Regular"],
+    "VIP Customers": ["VIP"]
+}
+# Scores run 1..5 (quintiles); these thresholds pick the segment
+ACTIVE_RECENCY_SCORE = 4
+VIP_VALUE_SCORE = 9
+HIGH_VALUE_SCORE = 8
+# Between full re-rankings, synced customers are scored against the stored cut points
+SEGMENT_CUT_POINTS_MAX_AGE_HOURS = float(os.getenv("SEGMENT_CUT_POINTS_MAX_AGE_HOURS", "24"))
+SEGMENT_RESCORE_RATIO = float(os.getenv("SEGMENT_RESCORE_RATIO", "0.05"))
+
+register_indexes("customer_segments", IndexModel([("tenant_id", ASCENDING)], unique=True))
+register_hot_query("customer_segments", {"tenant_id": ""})
+register_hot_query("customer_stats", {"tenant_id": ""})
+
+def _quintile(values: np.ndarray) -> np.ndarray:
+    # Rank based so heavy ties (most customers order once) cannot collapse the bins
+    return np.ceil(pd.Series(values).rank(pct=True, method="average").to_numpy() * 5).clip(1, 5)
+
+def _measures(stats: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Values each score ranks; recency uses the last order time itself, so cut points stay valid as days pass"""
+    last_order = pd.to_datetime(stats["last_order_at"]) - pd.Timestamp(0)
+    return {
+        "recency": last_order.dt.total_seconds().to_numpy(),
+        "frequency": stats["orders"].to_numpy(dtype=float),
+        "monetary": stats["revenue"].to_numpy(dtype=float)
+    }
+
+def _segment(stats: pd.DataFrame, scores: Dict[str, np.ndarray]) -> np.ndarray:
+    active = scores["recency"] >= ACTIVE_RECENCY_SCORE
+    value = scores["frequency"] + scores["monetary"]
+    return np.select(
+        [
+            active & (stats["orders"].to_numpy() == 1),
+            active & (value >= VIP_VALUE_SCORE),
+            value >= HIGH_VALUE_SCORE
+        ],
+        ["New", "VIP", "High Value"],
+        default="Regular"
+    )
+
+def score_customers(stats: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, List[Optional[float]]]]:
+    """Recency/frequency/monetary quintile scores and segment of every customer, plus the cut points.
+
+    Cut point k of a score is the highest value that scored k or less (None
+    when no value did), so score_with_cut_points gives these customers the
+    same scores and places any other value where it would have ranked.
+    """
+    measures = _measures(stats)
+    scores = {name: _quintile(values) for name, values in measures.items()}
+    cut_points = {
+        name: [float(values[scores[name] <= k].max()) if (scores[name] <= k).any() else None for k in range(1, 5)]
+        for name, values in measures.items()
+    }
+    return stats.assign(**scores, segment=_segment(stats, scores)), cut_points
+
+def score_with_cut_points(stats: pd.DataFrame, cut_points: Dict[str, List[Optional[float]]]) -> pd.DataFrame:
+    """Scores and segment of some customers against stored quintile cut points"""
+    scores = {
+        name: 1 + np.searchsorted([-np.inf if cut is None else cut for cut in cut_points[name]], values, side="left")
+        for name, values in _measures(stats).items()
+    }
+    return stats.assign(**scores, segment=_segment(stats, scores))
+
+async def _store_segments(db, tenant_id: str, segments: pd.Series):
+    operations = [
+        UpdateOne({"tenant_id": tenant_id, "customer_id": customer_id}, {"$set": {"segment": segment}})
+        for customer_id, segment in segments.items()
+    ]
+    for start in range(0, len(operations), CUSTOMER_CHUNK_SIZE):
+        await db.customer_stats.bulk_write(operations[start:start + CUSTOMER_CHUNK_SIZE], ordered=False)
+
+async def _rescore_all(db, tenant_id: str) -> Dict[str, List[Optional[float]]]:
+    """Rank every customer, storing the segments that changed and the new cut points"""
+    stats = (await load_frame(
+        db.customer_stats.find(
+            {"tenant_id": tenant_id},
+            {"_id": 0, "customer_id": 1, "last_order_at": 1, "orders": 1, "revenue": 1, "segment": 1}
+        ),
+        ["customer_id", "last_order_at", "orders", "revenue", "segment"]
+    )).set_index("customer_id")
+    scored, cut_points = score_customers(stats)
+    changed = scored["segment"] != stats["segment"]
+    await _store_segments(db, tenant_id, scored.loc[changed, "segment"])
+    return cut_points
+
+async def _segment_totals(db, tenant_id: str) -> Tuple[Dict[str, Dict[str, float]], int]:
+    """Totals per segment and the number of customers, summed by MongoDB from the stored segments"""
+    totals = {segment: {"count": 0, "orders": 0, "revenue": 0.0} for segment in SEGMENTS}
+    customers = 0
+    pipeline = [
+        {"$match": {"tenant_id": tenant_id}},
+        {"$group": {"_id": "$segment", "count": {"$sum": 1}, "orders": {"$sum": "$orders"}, "revenue": {"$sum": "$revenue"}}}
+    ]
+    async for row in db.customer_stats.aggregate(pipeline):
+        customers += row["count"]
+        if row["_id"] in totals:
+            totals[row["_id"]] = {"count": int(row["count"]), "orders": int(row["orders"]), "revenue": float(row["revenue"])}
+    return totals, customers
+
+async def refresh_segments(db, tenant_id: str, stats: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """Bring the stored customer segments and per-segment totals up to date.
+
+    Segments are scored from customer_stats, so the caller refreshes it first
+    and passes what refresh_customer_stats returned as ``stats``: only those
+    customers are scored, against the stored quintile cut points. Everyone is
+    re-ranked, and the cut points re-derived, when ``stats`` is None, when no
+    cut points are stored, or once they are SEGMENT_CUT_POINTS_MAX_AGE_HOURS
+    old or SEGMENT_RESCORE_RATIO of the customers were scored against them.
+    """
+    now = datetime.utcnow()
+    stored = await db.customer_segments.find_one({"tenant_id": tenant_id}, {"cut_points": 1, "cut_at": 1, "customers": 1, "rescored": 1})
+    rescored = (stored or {}).get("rescored", 0) + (len(stats) if stats is not None else 0)
+    if (stats is None or not (stored or {}).get("cut_points")
+            or now - stored["cut_at"] > timedelta(hours=SEGMENT_CUT_POINTS_MAX_AGE_HOURS)
+            or rescored > stored["customers"] * SEGMENT_RESCORE_RATIO):
+        cut_points, cut_at, rescored = await _rescore_all(db, tenant_id), now, 0
+    else:
+        cut_points, cut_at = stored["cut_points"], stored["cut_at"]
+        # Customers left without orders were dropped from customer_stats
+        current = stats.dropna(subset=["orders"])
+        await _store_segments(db, tenant_id, score_with_cut_points(current, cut_points)["segment"])
+
+    segments, customers = await _segment_totals(db, tenant_id)
+    result = {
+        "tenant_id": tenant_id,
+        "customers": customers,
+        "segments": segments,
+        "cut_points": cut_points,
+        "cut_at": cut_at,
+        "rescored": rescored,
+        "computed_at": now
+    }
+    await db.customer_segments.replace_one({"tenant_id": tenant_id}, result, upsert=True)
+    return result
+
+async def get_segments(db, tenant_id: str) -> Dict[str, Any]:
+    """Stored segment totals, computed on first use for tenants that never synced orders"""
+    result = await db.customer_segments.find_one({"tenant_id": tenant_id})
+    return result or await refresh_segments(db, tenant_id)
+
+def _summary(name: str, totals: List[Dict[str, Any]], customers: int) -> Dict[str, Any]:
+    count = sum(total["count"] for total in totals)
+    revenue = sum(total["revenue"] for total in totals)
+    orders = sum(total["orders"] for total in totals)
+    return {
+        "segment": name,
+        "count": count,
+        "revenue": round(revenue, 2),
+        "percentage": round(count / customers * 100, 1) if customers else 0.0,
+        "avg_order_value": round(revenue / orders, 2) if orders else 0.0
+    }
+
+def segment_summaries(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [_summary(name, [result["segments"][name]], result["customers"]) for name in SEGMENTS]
+
+def dashboard_summaries(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        _summary(name, [result["segments"][segment] for segment in segments], result["customers"])
+        for name, segments in DASHBOARD_SEGMENTS.items()
+    ]
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING, IndexModel
+
+from database import register_indexes, register_hot_query
+from services.customers import load_frame
+from utils.cache import LRUCache
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+
+SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR", "data/snapshots")
+# Deltas are folded into a new base file once they hold this share of its rows
+SNAPSHOT_COMPACT_RATIO = float(os.getenv("ANALYTICS_SNAPSHOT_COMPACT_RATIO", "0.1"))
+SNAPSHOT_MAX_DELTAS = int(os.getenv("ANALYTICS_SNAPSHOT_MAX_DELTAS", "8"))
+SNAPSHOT_BATCH_SIZE = 50000
+
+register_indexes("orders", IndexModel([("tenant_id", ASCENDING), ("synced_at", ASCENDING)], name="tenant_synced_at"))
+register_hot_query("orders", {"tenant_id": "", "synced_at": {"$gte": datetime.min}})
+
+ORDER_FIELDS = ["platform", "external_id", "customer_id", "created_at", "updated_at", "cancelled_at", "total_price", "line_items"]
+
+# Loaded tables per tenant, reused until the next sync bumps the manifest version.
+# Snapshots are loaded in worker threads, hence the lock.
+_tables = LRUCache(maxsize=int(os.getenv("ANALYTICS_SNAPSHOT_CACHE_TENANTS", "32")), ttl=24 * 3600)
+_tables_lock = threading.Lock()
+
+def _schema():
+    timestamp = pa.timestamp("ms", tz="UTC")
+    return pa.schema([
+        ("platform", pa.string()),
+        ("external_id", pa.string()),
+        ("customer_id", pa.string()),
+        ("created_at", timestamp),
+        ("updated_at", timestamp),
+        ("cancelled_at", timestamp),
+        ("total_price", pa.float64()),
+        ("line_items", pa.list_(pa.struct([
+            ("product_id", pa.string()),
+            ("title", pa.string()),
+            ("quantity", pa.int64()),
+            ("price", pa.float64())
+        ])))
+    ])
+
+class SnapshotFile:
+    """One Arrow IPC file of a snapshot, written a record batch at a time"""
+
+    def __init__(self, directory: str):
+        self.name = f"{uuid.uuid4().hex}.arrow"
+        self.path = os.path.join(directory, self.name)
+        self.rows = 0
+        self._sink = pa.OSFile(self.path, "wb")
+        self._writer = ipc.new_file(self._sink, _schema())
+
+    def write(self, batch):
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        self.write(pa.RecordBatch.from_pylist(rows, schema=_schema()))
+
+    def close(self):
+        self._writer.close()
+        self._sink.close()
+
+class OrderSnapshot:
+    """Append-only Arrow IPC files of one tenant's orders.
+
+    A sync appends the orders written since the snapshot's ``synced_at`` mark
+    as a new delta file; readers memory-map the base and deltas, so an
+    unchanged base is used in place without decoding anything. Rows of a later
+    file replace rows with the same (platform, external_id) in earlier ones,
+    and the files are compacted into a new base once the deltas grow.
+    """
+
+    def __init__(self, tenant_id: str):
+        self.tenant_id = tenant_id
+        self.path = os.path.join(SNAPSHOT_DIR, tenant_id, "orders")
+
+    def manifest(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.path, "manifest.json")) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {"version": 0, "synced_at": None, "files": [], "rows": []}
+        if "synced_at" not in manifest:
+            # Written when deltas were picked by updated_at, which could miss
+            # orders; read everything again and let compaction fold it in
+            manifest["synced_at"] = None
+        return manifest
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        target = os.path.join(self.path, "manifest.json")
+        with open(target + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(target + ".tmp", target)
+
+    def _read(self, name: str):
+        # Memory-mapped: column buffers point straight into the page cache
+        return ipc.open_file(pa.memory_map(os.path.join(self.path, name))).read_all()
+
+    def load(self):
+        """The tenant's orders as one table, or None before the first snapshot (blocking; run in a thread)"""
+        manifest = self.manifest()
+        with _tables_lock:
+            cached = _tables.get(self.tenant_id)
+        if cached and cached[0] == manifest["version"]:
+            return cached[1]
+        if not manifest["files"]:
+            return None
+        table = pa.concat_tables([self._read(name) for name in manifest["files"]])
+        if len(manifest["files"]) > 1:
+            positions = _latest_positions(table)
+            if positions is not None:
+                table = table.take(positions)
+        with _tables_lock:
+            _tables.set(self.tenant_id, (manifest["version"], table))
+        return table
+
+    def new_file(self) -> SnapshotFile:
+        os.makedirs(self.path, exist_ok=True)
+        return SnapshotFile(self.path)
+
+    def discard(self, file: SnapshotFile):
+        file.close()
+        os.remove(file.path)
+
+    def commit(self, file: SnapshotFile, synced_at: Optional[str]):
+        """Add a written delta file to the manifest, compacting the files if the deltas grew too large"""
+        file.close()
+        manifest = self.manifest()
+        manifest["files"].append(file.name)
+        manifest["rows"].append(file.rows)
+        manifest["synced_at"] = synced_at
+        manifest["version"] += 1
+
+        base_rows, delta_rows = manifest["rows"][0], sum(manifest["rows"][1:])
+        stale = []
+        if len(manifest["files"]) > SNAPSHOT_MAX_DELTAS + 1 or delta_rows > base_rows * SNAPSHOT_COMPACT_RATIO:
+            base = self._compact(manifest["files"])
+            stale = manifest["files"]
+            manifest["files"], manifest["rows"] = [base.name], [base.rows]
+        self._save_manifest(manifest)
+        # Readers that still map the old files keep working after the unlink
+        for name in stale:
+            os.remove(os.path.join(self.path, name))
+
+    def _compact(self, files: List[str]) -> SnapshotFile:
+        # The inputs stay memory-mapped; only one batch of surviving rows is copied at a time
+        table = pa.concat_tables([self._read(name) for name in files])
+        positions = _latest_positions(table)
+        base = self.new_file()
+        try:
+            if positions is None:
+                for batch in table.to_batches(SNAPSHOT_BATCH_SIZE):
+                    base.write(batch)
+            else:
+                for start in range(0, len(positions), SNAPSHOT_BATCH_SIZE):
+                    chunk = table.take(positions.slice(start, SNAPSHOT_BATCH_SIZE))
+                    for batch in chunk.to_batches():
+                        base.write(batch)
+        except BaseException:
+            self.discard(base)
+            raise
+        base.close()
+        return base
+
+def _latest_positions(table):
+    """Positions of the last row written for every (platform, external_id), or None if no key repeats"""
+    keys = pc.binary_join_element_wise(table["platform"], table["external_id"], ":")
+    positions = pa.table({"key": keys, "position": pa.array(np.arange(table.num_rows))})
+    latest = positions.group_by("key").aggregate([("position", "max")])["position_max"]
+    if len(latest) == table.num_rows:
+        return None
+    # Positions in file order, so the surviving rows stay roughly sorted by sync time
+    return pc.take(latest, pc.sort_indices(latest))
+
+def _to_row(doc: Dict[str, Any]) -> Dict[str, Any]:
+    row = {field: doc.get(field) for field in ORDER_FIELDS}
+    row["line_items"] = row["line_items"] or []
+    return row
+
+async def refresh_order_snapshot(db, tenant_id: str):
+    """Append the tenant's orders written since the snapshot's ``synced_at`` mark (no-op without pyarrow).
+
+    Changes are picked by the ``synced_at`` stamp the sync writer sets, not by
+    ``updated_at``: every run re-reads from before its predecessor started, so
+    it can write orders whose ``updated_at`` is older than rows the snapshot
+    already holds. Rows go to the delta file SNAPSHOT_BATCH_SIZE at a time.
+    """
+    if pa is None:
+        return
+    snapshot = OrderSnapshot(tenant_id)
+    synced_at = snapshot.manifest()["synced_at"]
+    match: Dict[str, Any] = {"tenant_id": tenant_id}
+    if synced_at:
+        # >= so orders stamped in the same millisecond as the mark are re-read rather than missed
+        match["synced_at"] = {"$gte": datetime.fromisoformat(synced_at)}
+    projection = {"_id": 0, "synced_at": 1, **{field: 1 for field in ORDER_FIELDS}}
+    delta, rows = None, []
+    try:
+        async for doc in db.orders.find(match, projection).batch_size(SNAPSHOT_BATCH_SIZE):
+            rows.append(_to_row(doc))
+            if doc.get("synced_at"):
+                mark = doc["synced_at"].replace(tzinfo=timezone.utc).isoformat()
+                synced_at = max(synced_at or mark, mark)
+            if len(rows) == SNAPSHOT_BATCH_SIZE:
+                delta = delta or await asyncio.to_thread(snapshot.new_file)
+                await asyncio.to_thread(delta.write_rows, rows)
+                rows = []
+        if rows:
+            delta = delta or await asyncio.to_thread(snapshot.new_file)
+            await asyncio.to_thread(delta.write_rows, rows)
+    except BaseException:
+        if delta is not None:
+            await asyncio.to_thread(snapshot.discard, delta)
+        raise
+    if delta is not None:
+        await asyncio.to_thread(snapshot.commit, delta, synced_at)
+
+def _order_mask(table, ranges, customer_ids, active_only):
+    mask = pc.is_valid(table["customer_id"])
+    if ranges:
+        created = table["created_at"]
+        in_range = None
+        for start, end in ranges:
+            inside = pc.and_(
+                pc.greater_equal(created, pa.scalar(start, created.type)),
+                pc.less(created, pa.scalar(end, created.type))
+            )
+            in_range = inside if in_range is None else pc.or_(in_range, inside)
+        mask = pc.and_(mask, in_range)
+    if customer_ids is not None:
+        mask = pc.and_(mask, pc.is_in(table["customer_id"], pa.array(customer_ids, pa.string())))
+    if active_only:
+        mask = pc.and_(mask, pc.is_null(table["cancelled_at"]))
+    return mask
+
+def _snapshot_frame(tenant_id, columns, ranges, customer_ids, active_only) -> Optional[pd.DataFrame]:
+    table = OrderSnapshot(tenant_id).load()
+    if table is None:
+        return None
+    selected = table.select(columns).filter(_order_mask(table, ranges, customer_ids, active_only))
+    frame = selected.to_pandas()
+    for column in columns:
+        if pa.types.is_timestamp(selected.schema.field(column).type):
+            # Same naive-UTC datetimes MongoDB returns
+            frame[column] = frame[column].dt.tz_convert("UTC").dt.tz_localize(None)
+    return frame
+
+async def order_frame(db, tenant_id: str, columns: List[str], ranges: Optional[List[Tuple[datetime, datetime]]] = None,
+                      customer_ids: Optional[List[str]] = None, active_only: bool = False) -> pd.DataFrame:
+    """Orders with a customer, optionally limited to created_at ranges, customers or uncancelled ones.
+
+    Served from the tenant's columnar snapshot when there is one: the filter
+    runs vectorized over the memory-mapped columns and only matching rows of
+    the requested columns are materialized. Falls back to MongoDB otherwise.
+    """
+    if pa is not None:
+        # Loading, filtering and converting are all CPU-bound; keep them off the event loop
+        frame = await asyncio.to_thread(_snapshot_frame, tenant_id, columns, ranges, customer_ids, active_only)
+        if frame is not None:
+            return frame
+
+    match: Dict[str, Any] = {"tenant_id": tenant_id, "customer_id": {"$ne": None}}
+    if ranges:
+        match["$or"] = [{"created_at": {"$gte": start, "$lt": end}} for start, end in ranges]
+    if customer_ids is not None:
+        match["customer_id"] = {"$in": customer_ids}
+    if active_only:
+        match["cancelled_at"] = None
+    return await load_frame(db.orders.find(match, {"_id": 0, **{column: 1 for column in columns}}), columns)
@@ -0,0 +1,447 @@
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Dict, List, Any, Optional, AsyncIterator, Awaitable, Callable, Tuple
+import os
+
+import httpx
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+
+from database import get_database, register_indexes, register_hot_query
+from services.writer import BulkUpsertWriter
+from services.rollups import get_tenant_timezone, rollup_day, refresh_rollups, rebuild_local_rollups
+from services.cohorts import customers_ordering_in, refresh_cohorts
+from services.customers import refresh_customer_stats
+from services.segments import refresh_segments
+from services.snapshots import refresh_order_snapshot
+from utils.cache import invalidate_tenant
+from utils.metrics import tenant_tier, tier_of
+from integrations.shopify_client import ShopifyClient
+from integrations.facebook_ads_client import FacebookAdsClient, FacebookReportError
+from integrations.google_ads_client import GoogleAdsClient
+from integrations.shiprocket_client import ShiprocketClient
+
+# How far back the first sync of an ad account reaches
+INITIAL_AD_DAYS = int(os.getenv("SYNC_INITIAL_AD_DAYS", "90"))
+# Ad platforms keep revising recent days while conversions are attributed
+AD_LOOKBACK_DAYS = int(os.getenv("SYNC_AD_LOOKBACK_DAYS", "3"))
+# Google Ads reports are pulled in windows of this many days
+GOOGLE_WINDOW_DAYS = 30
+# Facebook windows longer than this go through an async insights report job
+FACEBOOK_REPORT_MIN_DAYS = int(os.getenv("SYNC_FACEBOOK_REPORT_MIN_DAYS", "14"))
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+    except ValueError:
+        return None
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _to_int(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def _day(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d")
+
+def _shift_day(day: str, days: int) -> str:
+    return _day(datetime.strptime(day, "%Y-%m-%d") + timedelta(days=days))
+
+class SyncResource:
+    """One incrementally synced resource of a platform.
+
+    ``since`` turns the stored watermark into the lower bound of a run and
+    ``pages`` yields (records, next_cursor) from that bound; the cursor is
+    persisted after every page so an interrupted run resumes where it stopped.
+    """
+    name: str = ""
+    collection: str = ""
+    # Errors after which the saved cursor can never succeed; the next run restarts the window
+    cursor_errors: Tuple[type, ...] = ()
+    # Stamp written records with synced_at, for collections mirrored incrementally (the order snapshot)
+    stamp_synced_at: bool = False
+
+    def since(self, watermark: Optional[str], started_at: datetime) -> Optional[str]:
+        return watermark
+
+    def until(self, started_at: datetime) -> Optional[str]:
+        return None
+
+    def pages(self, client, since: Optional[str], until: Optional[str], cursor: Any) -> AsyncIterator[Tuple[List[Dict[str, Any]], Any]]:
+        raise NotImplementedError
+
+    def normalize(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {"external_id": str(record["id"]), **record}
+
+    def watermark_of(self, doc: Dict[str, Any]) -> Optional[str]:
+        return None
+
+    def completed_watermark(self, high_water: Optional[str], started_at: datetime) -> Optional[str]:
+        return high_water
+
+class ShopifyResource(SyncResource):
+    def __init__(self, name: str, fields: Tuple[str, ...], params: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.collection = name
+        self.fields = fields
+        self.params = params or {}
+
+    def pages(self, client, since, until, cursor):
+        params = dict(self.params)
+        if since:
+            params["updated_at_min"] = since
+        return client.iter_pages(self.name, params, self.fields, page_info=cursor)
+
+    def normalize(self, record):
+        doc = {"external_id": str(record["id"]), **record}
+        del doc["id"]
+        for field in ("created_at", "updated_at", "cancelled_at"):
+            if field in doc:
+                doc[field] = _parse_datetime(doc[field])
+        return doc
+
+    def watermark_of(self, doc):
+        return doc["updated_at"].isoformat() if doc.get("updated_at") else None
+
+    def completed_watermark(self, high_water, started_at):
+        # Records edited while the run was paging may have been read before the
+        # edit, so never advance past the moment the run started
+        started = started_at.replace(tzinfo=timezone.utc).isoformat()
+        return min(high_water, started) if high_water else high_water
+
+class ShopifyOrders(ShopifyResource):
+    stamp_synced_at = True
+
+    def __init__(self):
+        super().__init__("orders", (
+            "id", "order_number", "created_at", "updated_at", "cancelled_at",
+            "financial_status", "currency", "total_price", "subtotal_price",
+            "total_discounts", "total_tax", "source_name", "customer", "line_items"
+        ), {"status": "any"})
+
+    def normalize(self, record):
+        doc = super().normalize(record)
+        customer = doc.pop("customer", None) or {}
+        doc["customer_id"] = str(customer["id"]) if customer.get("id") else None
+        for field in ("total_price", "subtotal_price", "total_discounts", "total_tax"):
+            doc[field] = _to_float(doc.get(field))
+        doc["line_items"] = [
+            {
+                "product_id": str(item["product_id"]) if item.get("product_id") else None,
+                "variant_id": str(item["variant_id"]) if item.get("variant_id") else None,
+                "title": item.get("title"),
+                "quantity": _to_int(item.get("quantity")),
+                "price": _to_float(item.get("price"))
+            }
+            for item in doc.get("line_items") or []
+        ]
+        return doc
+
+class ShiprocketOrders(SyncResource):
+    name = "orders"
+    collection = "shipments"
+
+    def since(self, watermark, started_at):
+        # The orders filter has day granularity; overlap a day to catch late edits
+        return _shift_day(watermark, -1) if watermark else None
+
+    def pages(self, client, since, until, cursor):
+        return client.iter_order_pages(from_date=since, page=cursor or 1)
+
+    def completed_watermark(self, high_water, started_at):
+        return _day(started_at)
+
+class AdCampaignMetrics(SyncResource):
+    name = "campaign_metrics"
+    collection = "campaign_metrics"
+
+    def since(self, watermark, started_at):
+        if watermark:
+            return _shift_day(watermark, -AD_LOOKBACK_DAYS)
+        return _day(started_at - timedelta(days=INITIAL_AD_DAYS))
+
+    def until(self, started_at):
+        return _day(started_at)
+
+    def watermark_of(self, doc):
+        return doc.get("date")
+
+class FacebookCampaignMetrics(AdCampaignMetrics):
+    # A failed, skipped or timed-out report job stays dead; resuming it would fail forever
+    cursor_errors = (FacebookReportError,)
+
+    async def pages(self, client, since, until, cursor):
+        days = (datetime.strptime(until, "%Y-%m-%d") - datetime.strptime(since, "%Y-%m-%d")).days + 1
+        if days < FACEBOOK_REPORT_MIN_DAYS and not isinstance(cursor, dict):
+            async for page in client.iter_campaign_insight_pages(since, until, after=cursor):
+                yield page
+            return
+
+        # Long backfills: one async report job instead of paging the live endpoint.
+        # The cursor carries the report id so a resumed run reuses the finished job.
+        report = cursor or {}
+        report_run_id = report.get("report_run_id")
+        if not report_run_id:
+            report_run_id = await client.start_insights_report(since, until)
+            yield [], {"report_run_id": report_run_id, "after": None}
+        await client.wait_for_report(report_run_id)
+        async for rows, after in client.iter_report_pages(report_run_id, after=report.get("after")):
+            yield rows, {"report_run_id": report_run_id, "after": after} if after else None
+
+    def normalize(self, record):
+        actions = {a.get("action_type"): a.get("value") for a in record.get("actions") or []}
+        values = {a.get("action_type"): a.get("value") for a in record.get("action_values") or []}
+        return {
+            "external_id": f"{record['campaign_id']}:{record['date_start']}",
+            "campaign_id": record["campaign_id"],
+            "campaign_name": record.get("campaign_name"),
+            "date": record["date_start"],
+            "spend": _to_float(record.get("spend")),
+            "impressions": _to_int(record.get("impressions")),
+            "clicks": _to_int(record.get("clicks")),
+            "conversions": _to_float(actions.get("purchase")),
+            "conversion_value": _to_float(values.get("purchase"))
+        }
+
+class GoogleCampaignMetrics(AdCampaignMetrics):
+    # Rows are written while the searchStream response is still arriving
+    chunk_size = 500
+
+    async def pages(self, client, since, until, cursor):
+        start = cursor or since
+        while start <= until:
+            end = min(_shift_day(start, GOOGLE_WINDOW_DAYS - 1), until)
+            rows = []
+            async for row in client.iter_campaign_performance(start, end):
+                rows.append(row)
+                if len(rows) == self.chunk_size:
+                    # A stream cannot be resumed mid-way, so checkpoint at the window start
+                    yield rows, start
+                    rows = []
+            start = _shift_day(end, 1)
+            yield rows, start if start <= until else None
+
+    def normalize(self, record):
+        return {
+            "external_id": f"{record.campaign_id}:{record.date}",
+            "campaign_id": record.campaign_id,
+            "campaign_name": record.campaign_name,
+            "date": record.date,
+            "spend": record.cost_micros / 1_000_000,
+            "cost_micros": record.cost_micros,
+            "impressions": record.impressions,
+            "clicks": record.clicks,
+            "conversions": record.conversions,
+            "conversion_value": record.conversion_value
+        }
+
+RESOURCES = {
+    "shopify": [
+        ShopifyOrders(),
+        ShopifyResource("products", ("id", "title", "product_type", "vendor", "status", "created_at", "updated_at", "variants")),
+        ShopifyResource("customers", ("id", "created_at", "updated_at", "orders_count", "total_spent", "state"))
+    ],
+    "facebook_ads": [FacebookCampaignMetrics()],
+    "google_ads": [GoogleCampaignMetrics()],
+    "shiprocket": [ShiprocketOrders()]
+}
+
+# Every synced collection is upserted on the same natural key
+for collection in sorted({resource.collection for resources in RESOURCES.values() for resource in resources}):
+    register_indexes(collection, IndexModel(
+        [("tenant_id", ASCENDING), ("platform", ASCENDING), ("external_id", ASCENDING)],
+        unique=True,
+        name="tenant_platform_external_id"
+    ))
+    register_hot_query(collection, {"tenant_id": "", "platform": "", "external_id": ""})
+register_indexes("sync_state", IndexModel([("integration_id", ASCENDING), ("resource", ASCENDING)], unique=True))
+register_hot_query("sync_state", {"integration_id": "", "resource": ""})
+
+async def rebuild_for_timezone(tenant_id: str, tz: str, db=None):
+    """Rebuild the data bucketed by the tenant's local days and months after a timezone change"""
+    db = db if db is not None else get_database()
+    try:
+        await rebuild_local_rollups(db, tenant_id, tz)
+        await refresh_cohorts(db, tenant_id, None, tz)
+    except Exception as e:
+        print(f"Error rebuilding data of tenant {tenant_id} for timezone {tz}: {e}")
+    finally:
+        await invalidate_tenant(tenant_id)
+
+def build_client(platform: str, credentials: Dict[str, Any]):
+    """Instantiate the API client of a connected integration"""
+    if platform == "shopify":
+        return ShopifyClient(credentials["shop_domain"], credentials["access_token"])
+    if platform == "facebook_ads":
+        return FacebookAdsClient(credentials["access_token"], credentials["ad_account_id"])
+    if platform == "google_ads":
+        return GoogleAdsClient(
+            credentials["developer_token"],
+            credentials["client_id"],
+            credentials["client_secret"],
+            credentials["refresh_token"],
+            credentials["customer_id"]
+        )
+    if platform == "shiprocket":
+        return ShiprocketClient(credentials["email"], credentials["password"])
+    raise ValueError(f"Sync is not supported for platform {platform}")
+
+class SyncEngine:
+    """Incremental sync of one integration driven by per-resource watermarks.
+
+    State lives in the ``sync_state`` collection, one document per
+    (integration, resource) holding the committed ``watermark`` and, while a
+    run is in flight, the ``run`` checkpoint (bounds, cursor, high-water mark).
+    """
+
+    def __init__(self, integration: Dict[str, Any], db=None, progress: Optional[Callable[[str, int], Awaitable[None]]] = None):
+        self.integration_id = str(integration["_id"])
+        self.tenant_id = integration["user_id"]
+        self.platform = integration["platform"]
+        self.db = db if db is not None else get_database()
+        self.client = build_client(self.platform, integration.get("credentials", {}))
+        self.resources = RESOURCES[self.platform]
+        self.timezone = None
+        self.progress = progress
+
+    async def run(self) -> Dict[str, Dict[str, Any]]:
+        """Sync every resource of the integration, isolating failures per resource"""
+        self.timezone = await get_tenant_timezone(self.db, self.tenant_id)
+        if ObjectId.is_valid(self.tenant_id):
+            # Labels the platform calls of this sync (each job runs in its own task)
+            tenant_tier.set(tier_of(await self.db.users.find_one({"_id": ObjectId(self.tenant_id)}, {"tier": 1})))
+        results = {}
+        for resource in self.resources:
+            try:
+                results[resource.name] = await self.sync_resource(resource)
+            except Exception as e:
+                print(f"Error syncing {self.platform} {resource.name}: {e}")
+                await self.db.sync_state.update_one(
+                    self._state_key(resource),
+                    {"$set": {"last_error": str(e), "last_error_at": datetime.utcnow()}}
+                )
+                results[resource.name] = {"records": 0, "error": str(e)}
+        # Even a partly failed sync may have written data that cached responses predate
+        await invalidate_tenant(self.tenant_id)
+        return results
+
+    def _state_key(self, resource: SyncResource) -> Dict[str, str]:
+        return {"integration_id": self.integration_id, "resource": resource.name}
+
+    async def _start_run(self, resource: SyncResource) -> Dict[str, Any]:
+        key = self._state_key(resource)
+        state = await self.db.sync_state.find_one(key) or {}
+        if state.get("run"):
+            # A previous run died part-way; carry on from its last checkpoint
+            return state["run"]
+
+        started_at = datetime.utcnow()
+        watermark = state.get("watermark")
+        run = {
+            "since": resource.since(watermark, started_at),
+            "until": resource.until(started_at),
+            "cursor": None,
+            "high_water": watermark,
+            "started_at": started_at,
+            "records": 0,
+            "touched_days": [],
+            "fetched": False
+        }
+        await self.db.sync_state.update_one(
+            key,
+            {"$set": {"run": run, "tenant_id": self.tenant_id, "platform": self.platform}},
+            upsert=True
+        )
+        return run
+
+    async def _pages(self, resource: SyncResource, run: Dict[str, Any]):
+        pages = resource.pages(self.client, run["since"], run["until"], run["cursor"])
+        try:
+            first = await pages.__anext__()
+        except StopAsyncIteration:
+            return
+        except httpx.HTTPStatusError as e:
+            if run["cursor"] is None or e.response.status_code >= 500:
+                raise
+            # Saved cursors can expire; restart the run's window from the top
+            print(f"Sync cursor for {self.platform} {resource.name} rejected, restarting window")
+            run["cursor"] = None
+            pages = resource.pages(self.client, run["since"], run["until"], None)
+            first = await pages.__anext__()
+
+        yield first
+        async for page in pages:
+            yield page
+
+    async def sync_resource(self, resource: SyncResource) -> Dict[str, int]:
+        """Fetch everything changed since the watermark, checkpointing after each page"""
+        key = self._state_key(resource)
+        run = await self._start_run(resource)
+        writer = BulkUpsertWriter(
+            self.db[resource.collection], self.tenant_id, self.platform, stamp_synced_at=resource.stamp_synced_at
+        )
+        timezone_name = self.timezone or "UTC"
+        touched_days = set(run.get("touched_days", []))
+
+        async def checkpoint(snapshot: Dict[str, Any]):
+            await self.db.sync_state.update_one(key, {"$set": {"run": snapshot}})
+            if self.progress:
+                await self.progress(resource.name, snapshot["records"])
+
+        if not run.get("fetched"):
+            try:
+                async with writer:
+                    async for records, cursor in self._pages(resource, run):
+                        docs = [resource.normalize(record) for record in records]
+                        for doc in docs:
+                            mark = resource.watermark_of(doc)
+                            if mark and (run["high_water"] is None or mark > run["high_water"]):
+                                run["high_water"] = mark
+                            day = rollup_day(resource.collection, doc, timezone_name)
+                            if day:
+                                touched_days.add(day)
+                        run["cursor"] = cursor
+                        run["records"] += len(docs)
+                        run["touched_days"] = sorted(touched_days)
+                        # The cursor is only persisted once the page's records are committed
+                        await writer.add(docs, checkpoint=partial(checkpoint, dict(run)))
+            except resource.cursor_errors:
+                # After the writer has flushed its checkpoints, which still carry the dead cursor
+                run["cursor"] = None
+                await self.db.sync_state.update_one(key, {"$set": {"run.cursor": None}})
+                raise
+
+            run["fetched"] = True
+            await checkpoint(run)
+
+        # Rollups of every day the run touched are rebuilt before the run is retired,
+        # so a crash here is repaired by the next run without re-fetching
+        await refresh_rollups(self.db, self.tenant_id, self.platform, resource.collection, touched_days, timezone_name)
+        if resource.collection == "orders" and touched_days:
+            months = {day[:7] for day in touched_days}
+            await refresh_order_snapshot(self.db, self.tenant_id)
+            # Cohorts (who changed cohort) and segments both read customer_stats,
+            # so it is refreshed first, once, and the result handed to both
+            customers = await customers_ordering_in(self.db, self.tenant_id, months, timezone_name)
+            stats = await refresh_customer_stats(self.db, self.tenant_id, customers)
+            await refresh_cohorts(self.db, self.tenant_id, months, timezone_name, stats)
+            await refresh_segments(self.db, self.tenant_id, stats)
+
+        await self.db.sync_state.update_one(key, {
+            "$set": {
+                "watermark": resource.completed_watermark(run["high_water"], run["started_at"]),
+                "last_completed_at": datetime.utcnow(),
+                "last_error": None
+            },
+            "$unset": {"run": ""}
+        })
+        return {"records": run["records"], **writer.stats()}
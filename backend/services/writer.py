@@ -0,0 +1,146 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Awaitable, Callable
+
+from pymongo import UpdateOne
+
+Checkpoint = Callable[[], Awaitable[None]]
+
+class BulkUpsertWriter:
+    """Batch idempotent upserts of synced records into one collection.
+
+    Records are keyed on (tenant_id, platform, external_id) and written as
+    unordered ``bulk_write`` batches by a single background consumer. At most
+    ``max_pending`` batches wait in the queue; beyond that ``add`` blocks, which
+    throttles the fetcher to the speed MongoDB can absorb. Checkpoint callbacks
+    passed to ``add`` run once every record added before them is committed.
+    With ``stamp_synced_at`` every write sets ``synced_at`` to the server time,
+    for collections that others follow incrementally.
+    """
+
+    def __init__(
+        self,
+        collection,
+        tenant_id: str,
+        platform: str,
+        batch_size: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        stamp_synced_at: bool = False
+    ):
+        self.collection = collection
+        self.tenant_id = tenant_id
+        self.platform = platform
+        self.stamp_synced_at = stamp_synced_at
+        self.batch_size = batch_size or int(os.getenv("SYNC_WRITE_BATCH_SIZE", "500"))
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending or int(os.getenv("SYNC_WRITE_MAX_PENDING", "2")))
+        self._ops: List[UpdateOne] = []
+        self._checkpoints: List[Checkpoint] = []
+        self._consumer: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+
+        self.batches: List[Dict[str, Any]] = []
+        self.inserted = 0
+        self.modified = 0
+        self.unchanged = 0
+
+    async def __aenter__(self):
+        self._consumer = asyncio.create_task(self._consume())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None and not issubclass(exc_type, Exception):
+            self._consumer.cancel()
+            return
+        try:
+            # Commit what was fetched before a failure so a resumed run skips it
+            await self.close()
+        except Exception:
+            if exc_type is None:
+                raise
+
+    def _operation(self, doc: Dict[str, Any]) -> UpdateOne:
+        key = {"tenant_id": self.tenant_id, "platform": self.platform, "external_id": doc["external_id"]}
+        # No per-write timestamp by default: an identical re-sync must leave the
+        # document untouched so it is reported as unchanged. A synced_at stamp
+        # trades that for a marker that cannot go backwards like updated_at can.
+        update = {"$set": {**doc, **key}, "$setOnInsert": {"first_synced_at": datetime.utcnow()}}
+        if self.stamp_synced_at:
+            update["$currentDate"] = {"synced_at": True}
+        return UpdateOne(key, update, upsert=True)
+
+    async def add(self, docs: List[Dict[str, Any]], checkpoint: Optional[Checkpoint] = None):
+        """Queue records for upsert, blocking while the writer is saturated"""
+        self._raise_if_failed()
+        for doc in docs:
+            self._ops.append(self._operation(doc))
+            if len(self._ops) >= self.batch_size:
+                await self._submit()
+        if checkpoint is not None:
+            self._checkpoints.append(checkpoint)
+
+    async def _submit(self):
+        if not self._ops and not self._checkpoints:
+            return
+        batch = (self._ops, self._checkpoints)
+        self._ops, self._checkpoints = [], []
+        await self._queue.put(batch)
+        self._raise_if_failed()
+
+    async def _consume(self):
+        while True:
+            batch = await self._queue.get()
+            try:
+                if batch is None:
+                    return
+                if self._error is None:
+                    await self._write(*batch)
+            except Exception as e:
+                # Keep draining so producers blocked on the queue wake up and see the error
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    async def _write(self, ops: List[UpdateOne], checkpoints: List[Checkpoint]):
+        counters = {"size": len(ops), "inserted": 0, "modified": 0, "unchanged": 0}
+        if ops:
+            started = time.perf_counter()
+            result = await self.collection.bulk_write(ops, ordered=False)
+            counters.update(
+                inserted=result.upserted_count,
+                modified=result.modified_count,
+                unchanged=result.matched_count - result.modified_count,
+                duration_ms=round((time.perf_counter() - started) * 1000, 2)
+            )
+            self.inserted += counters["inserted"]
+            self.modified += counters["modified"]
+            self.unchanged += counters["unchanged"]
+            self.batches.append(counters)
+        for checkpoint in checkpoints:
+            await checkpoint()
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    async def flush(self):
+        """Write everything buffered so far and wait for it to commit"""
+        await self._submit()
+        await self._queue.join()
+        self._raise_if_failed()
+
+    async def close(self):
+        try:
+            await self.flush()
+        finally:
+            await self._queue.put(None)
+            await self._consumer
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "batches": len(self.batches),
+            "inserted": self.inserted,
+            "modified": self.modified,
+            "unchanged": self.unchanged
+        }
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Run from anywhere: the app modules import each other as top-level packages
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Read by services.snapshots at import time; keep test snapshots out of data/
+os.environ["ANALYTICS_SNAPSHOT_DIR"] = tempfile.mkdtemp(prefix="d2c-test-snapshots-")
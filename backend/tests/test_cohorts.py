@@ -0,0 +1,105 @@
+"""Incremental cohort refreshes must leave the same matrix as a full rebuild.
+
+Random batches of new orders (some back-dated, which moves customers to an
+earlier cohort) and cancellations/un-cancellations (which can empty a
+cohort) are applied; after each batch only the touched months are refreshed
+and the stored matrix is compared with one counted from scratch. Runs once
+against MongoDB and once through the columnar order snapshot. updated_at is
+random rather than increasing, as re-synced orders can carry an older one.
+"""
+import asyncio
+import random
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from services.cohorts import get_cohorts, refresh_cohorts
+from services.snapshots import refresh_order_snapshot
+from services.writer import BulkUpsertWriter
+
+TZ = "Asia/Kolkata"
+
+def _month(created_at: datetime) -> str:
+    return created_at.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo(TZ)).strftime("%Y-%m")
+
+def _expected(orders):
+    """{cohort: {month: distinct active customers}} counted from every order"""
+    first, active = {}, set()
+    for order in orders:
+        if order["cancelled_at"] is None and order["customer_id"]:
+            month = _month(order["created_at"])
+            first[order["customer_id"]] = min(first.get(order["customer_id"], "9999-99"), month)
+            active.add((order["customer_id"], month))
+    matrix = {}
+    for customer_id, month in active:
+        cells = matrix.setdefault(first[customer_id], {})
+        cells[month] = cells.get(month, 0) + 1
+    return matrix
+
+async def _stored(db, tenant_id):
+    return {
+        doc["cohort"]: {month: count for month, count in doc["active"].items() if count}
+        async for doc in db.cohorts.find({"tenant_id": tenant_id})
+    }
+
+async def _check_incremental(tenant_id: str, use_snapshot: bool, seed: int):
+    rng = random.Random(seed)
+    db = AsyncMongoMockClient()["cohorts_test"]
+    def created_at():
+        return datetime(2023, 1, 1) + timedelta(minutes=rng.randint(0, 60 * 24 * 600))
+
+    def updated_at():
+        return datetime(2025, 1, 1) + timedelta(seconds=rng.randint(0, 10**6))
+
+    def order(external_id, customers):
+        return {
+            "tenant_id": tenant_id, "platform": "shopify", "external_id": external_id,
+            "customer_id": rng.choice(customers), "created_at": created_at(), "cancelled_at": None,
+            "total_price": 10.0, "updated_at": updated_at()
+        }
+
+    async def write(docs):
+        # As the orders sync writes them, stamped for the snapshot
+        async with BulkUpsertWriter(db.orders, tenant_id, "shopify", stamp_synced_at=True) as writer:
+            await writer.add([dict(doc) for doc in docs])
+
+    async def refresh(months):
+        if use_snapshot:
+            await refresh_order_snapshot(db, tenant_id)
+        await refresh_cohorts(db, tenant_id, months, TZ)
+
+    orders = [order(str(i), [None] + [f"c{j}" for j in range(60)]) for i in range(600)]
+    await write(orders)
+    await refresh(None)
+    assert await _stored(db, tenant_id) == _expected(orders)
+
+    for batch in range(12):
+        touched = set()
+        for step in range(rng.randint(1, 20)):
+            if rng.random() < 0.5:
+                # New customers c60-c79 appear; existing ones may get back-dated orders
+                changed = order(f"n{batch}-{step}", [f"c{j}" for j in range(80)])
+                orders.append(changed)
+                await write([changed])
+            else:
+                changed = rng.choice(orders)
+                changed["cancelled_at"] = None if changed["cancelled_at"] else datetime(2024, 1, 1)
+                changed["updated_at"] = updated_at()
+                await write([changed])
+            touched.add(_month(changed["created_at"]))
+        await refresh(touched)
+        assert await _stored(db, tenant_id) == _expected(orders), f"batch {batch}"
+
+    cohorts = await get_cohorts(db, tenant_id, TZ)
+    assert [c["month"] for c in cohorts] == sorted(_expected(orders))
+    assert all(c["retention"][0] == 100.0 for c in cohorts)
+
+@pytest.mark.parametrize("seed", [3, 11])
+def test_incremental_refresh_matches_full_rebuild(seed):
+    asyncio.run(_check_incremental(f"mongo-{seed}", use_snapshot=False, seed=seed))
+
+@pytest.mark.parametrize("seed", [3, 11])
+def test_incremental_refresh_matches_full_rebuild_from_snapshot(seed):
+    asyncio.run(_check_incremental(f"snapshot-{seed}", use_snapshot=True, seed=seed))
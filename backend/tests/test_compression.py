@@ -0,0 +1,93 @@
+"""Conditional requests through CompressionMiddleware.
+
+A compressed 200 carries the ETag with the encoding appended; the client sends
+that tag back, and the 304 must match it and echo it unchanged, without the
+route running or the middleware touching the empty body.
+"""
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from utils import cache
+from utils.cache import MemoryBackend, ResponseCache, cached_route
+from utils.compression import CompressionMiddleware, choose_encoding, matching_etag
+from utils.serialization import FastJSONRoute
+
+def current_user():
+    return {"_id": "tenant-1", "timezone": "Asia/Kolkata"}
+
+def _client(monkeypatch):
+    versions = {"tenant-1": 0}
+    calls = []
+
+    async def version(tenant_id):
+        return versions[tenant_id]
+
+    # A fresh cache per test, with the data version kept here instead of in MongoDB
+    response_cache = ResponseCache(MemoryBackend(100, 60))
+    monkeypatch.setattr(response_cache, "version", version)
+    monkeypatch.setattr(cache, "response_cache", response_cache)
+    router = APIRouter(route_class=FastJSONRoute)
+
+    @router.get("/report")
+    @cached_route()
+    async def report(user: dict = Depends(current_user)):
+        calls.append(1)
+        return {"rows": [{"day": day, "revenue": day * 1.5} for day in range(200)]}
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(CompressionMiddleware)
+    return TestClient(app), versions, calls
+
+def test_matching_etag():
+    assert matching_etag('"abc"', "abc") == '"abc"'
+    assert matching_etag('W/"abc-gzip"', "abc") == '"abc-gzip"'
+    assert matching_etag('"x", "abc-br"', "abc") == '"abc-br"'
+    assert matching_etag("*", "abc") == '"abc"'
+    assert matching_etag('"abcd"', "abc") is None
+    assert matching_etag('"abc-deflate"', "abc") is None
+    assert matching_etag("", "abc") is None
+
+def test_choose_encoding():
+    assert choose_encoding("gzip") == "gzip"
+    assert choose_encoding("gzip;q=1, br;q=0.5") == "gzip"
+    assert choose_encoding("identity") is None
+    assert choose_encoding("gzip;q=0") is None
+
+def test_compressed_etag_round_trips_to_304(monkeypatch):
+    client, _, calls = _client(monkeypatch)
+    with client:
+        first = client.get("/report", headers={"Accept-Encoding": "gzip"})
+        assert first.status_code == 200
+        assert first.headers["content-encoding"] == "gzip"
+        etag = first.headers["etag"]
+        assert etag.endswith('-gzip"')
+
+        revalidated = client.get("/report", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == etag
+        assert "content-encoding" not in revalidated.headers
+        assert revalidated.content == b""
+        assert len(calls) == 1
+
+def test_uncompressed_tag_matches_compressed_representation(monkeypatch):
+    client, _, calls = _client(monkeypatch)
+    with client:
+        plain = client.get("/report", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        # The same data in another encoding: still not modified
+        revalidated = client.get("/report", headers={"Accept-Encoding": "br, gzip", "If-None-Match": plain.headers["etag"]})
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == plain.headers["etag"]
+        assert len(calls) == 1
+
+def test_new_data_version_answers_200(monkeypatch):
+    client, versions, calls = _client(monkeypatch)
+    with client:
+        etag = client.get("/report", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+        versions["tenant-1"] += 1
+        fresh = client.get("/report", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert fresh.status_code == 200
+        assert fresh.headers["etag"] != etag
+        assert fresh.json()["rows"][199]["revenue"] == 298.5
+        assert len(calls) == 2
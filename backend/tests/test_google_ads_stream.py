@@ -0,0 +1,66 @@
+"""iter_json_array must decode searchStream batches the same however the response is split into chunks.
+
+The parser tracks strings, escapes and nesting across chunk boundaries; a
+slip there silently drops or corrupts rows rather than failing.
+"""
+import asyncio
+import json
+import random
+
+import pytest
+
+from integrations.google_ads_client import iter_json_array
+
+BATCHES = [
+    {"results": [
+        {"campaign": {"id": "1", "name": 'Summer "sale" [EN]'}, "metrics": {"costMicros": "1500000", "clicks": "3"}},
+        {"campaign": {"id": "2", "name": "back\\slash {brace} \\\" ]"}, "metrics": {"costMicros": "0"}},
+    ], "fieldMask": "campaign.id,campaign.name"},
+    {"results": [{"campaign": {"id": "3", "name": "Diwali दीवाली 🎉"}, "segments": {"date": "2024-11-01"}}]},
+    {"results": [], "summaryRow": {"metrics": {"clicks": "3"}}},
+    {"results": [{"campaign": {"id": "4", "name": "\\\\"}, "tags": [[1, 2], {"x": []}]}]},
+]
+
+def _body() -> bytes:
+    return json.dumps(BATCHES, ensure_ascii=False, indent=1).encode()
+
+async def _decode(chunks):
+    async def source():
+        for chunk in chunks:
+            yield chunk
+    return [element async for element in iter_json_array(source())]
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10**6])
+def test_fixed_chunk_sizes(size):
+    body = _body()
+    chunks = [body[i:i + size] for i in range(0, len(body), size)]
+    assert asyncio.run(_decode(chunks)) == BATCHES
+
+def test_random_chunk_boundaries():
+    body = _body()
+    rng = random.Random(7)
+    for _ in range(200):
+        cuts = sorted(rng.sample(range(1, len(body)), rng.randint(1, 30)))
+        chunks = [body[start:end] for start, end in zip([0] + cuts, cuts + [len(body)])]
+        assert asyncio.run(_decode(chunks)) == BATCHES
+
+def test_elements_are_yielded_before_the_stream_ends():
+    async def check():
+        first = json.dumps(BATCHES[0]).encode()
+        arrived = asyncio.Event()
+
+        async def source():
+            yield b"[" + first + b","
+            # Only sent once the first element was decoded
+            await arrived.wait()
+            yield json.dumps(BATCHES[1]).encode() + b"]"
+
+        elements = iter_json_array(source())
+        assert await elements.__anext__() == BATCHES[0]
+        arrived.set()
+        assert [element async for element in elements] == [BATCHES[1]]
+
+    asyncio.run(check())
+
+def test_empty_array():
+    assert asyncio.run(_decode([b"[", b" ", b"]"])) == []
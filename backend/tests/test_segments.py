@@ -0,0 +1,79 @@
+"""Segments scored against stored cut points must agree with a full re-ranking."""
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from mongomock_motor import AsyncMongoMockClient
+
+import services.segments as segments
+from services.customers import refresh_customer_stats
+from services.segments import refresh_segments, score_customers, score_with_cut_points
+
+def _stats(rng, customers):
+    # Heavy ties, as in real data: most customers order once
+    return pd.DataFrame({
+        "last_order_at": [datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 30)) for _ in range(customers)],
+        "orders": [rng.choice([1, 1, 1, 2, 3, 8]) for _ in range(customers)],
+        "revenue": [float(rng.choice([100, 100, 250, 999])) for _ in range(customers)]
+    }, index=[f"c{i}" for i in range(customers)])
+
+def test_cut_points_reproduce_the_ranking():
+    rng = random.Random(5)
+    for customers in (1, 7, 300):
+        stats = _stats(rng, customers)
+        ranked, cut_points = score_customers(stats)
+        scored = score_with_cut_points(stats, cut_points)
+        for column in ("recency", "frequency", "monetary", "segment"):
+            assert list(scored[column]) == list(ranked[column]), column
+
+async def _check_incremental_refresh(monkeypatch):
+    rng = random.Random(9)
+    db = AsyncMongoMockClient()["segments_test"]
+    orders = [
+        {"tenant_id": "t1", "external_id": str(i), "customer_id": f"c{rng.randint(0, 199)}", "cancelled_at": None,
+         "created_at": datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 300)), "total_price": float(rng.randint(1, 50) * 10)}
+        for i in range(800)
+    ]
+    await db.orders.insert_many(orders)
+    await refresh_customer_stats(db, "t1")
+    first = await refresh_segments(db, "t1")
+
+    # A sync brings new orders for a few customers, one of them new
+    synced = [
+        {"tenant_id": "t1", "external_id": f"n{i}", "customer_id": customer_id, "cancelled_at": None,
+         "created_at": datetime(2024, 11, 1), "total_price": 500.0}
+        for i, customer_id in enumerate(["c1", "c2", "c3", "c999"])
+    ]
+    await db.orders.insert_many(synced)
+    stats = await refresh_customer_stats(db, "t1", ["c1", "c2", "c3", "c999"])
+    written = []
+    store_segments = segments._store_segments
+
+    async def recording_store_segments(db, tenant_id, scored):
+        written.extend(scored.index)
+        await store_segments(db, tenant_id, scored)
+
+    monkeypatch.setattr(segments, "_store_segments", recording_store_segments)
+    second = await refresh_segments(db, "t1", stats)
+
+    # Only the synced customers were re-scored, against the stored cut points
+    assert sorted(written) == ["c1", "c2", "c3", "c999"]
+    assert second["cut_points"] == first["cut_points"] and second["rescored"] == 4
+    stored = pd.DataFrame(await db.customer_stats.find({"tenant_id": "t1"}).to_list(None)).set_index("customer_id")
+    expected = score_with_cut_points(stored, first["cut_points"])["segment"]
+    assert (stored["segment"] == expected).all()
+    assert second["customers"] == len(stored)
+    for segment, total in second["segments"].items():
+        members = stored[stored["segment"] == segment]
+        assert total["count"] == len(members)
+        assert np.isclose(total["revenue"], members["revenue"].sum())
+
+    # Without stats everyone is re-ranked and the cut points are taken afresh
+    third = await refresh_segments(db, "t1")
+    ranked, cut_points = score_customers(stored)
+    assert third["cut_points"] == cut_points and third["rescored"] == 0
+
+def test_incremental_refresh_scores_only_synced_customers(monkeypatch):
+    asyncio.run(_check_incremental_refresh(monkeypatch))
@@ -0,0 +1,81 @@
+"""The order snapshot must hold exactly what MongoDB holds after every refresh.
+
+A sync restarts from before its predecessor started, so it can write orders
+whose updated_at is older than rows already in the snapshot; those must still
+reach it.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pandas as pd
+from mongomock_motor import AsyncMongoMockClient
+
+import services.snapshots as snapshots
+from services.snapshots import order_frame, refresh_order_snapshot
+from services.writer import BulkUpsertWriter
+
+COLUMNS = ["external_id", "customer_id", "created_at", "updated_at", "cancelled_at", "total_price"]
+
+def _order(external_id: str, updated_at: datetime, cancelled: bool = False):
+    return {
+        "external_id": external_id, "customer_id": f"c{int(external_id) % 3}",
+        "created_at": datetime(2024, 6, 1) + timedelta(hours=int(external_id)),
+        "updated_at": updated_at, "cancelled_at": updated_at if cancelled else None,
+        "total_price": float(external_id), "line_items": []
+    }
+
+async def _write(db, tenant_id, docs):
+    async with BulkUpsertWriter(db.orders, tenant_id, "shopify", stamp_synced_at=True) as writer:
+        await writer.add(docs)
+
+async def _frames(db, tenant_id, monkeypatch):
+    from_snapshot = await order_frame(db, tenant_id, COLUMNS)
+    with monkeypatch.context() as patch:
+        patch.setattr(snapshots, "pa", None)
+        from_mongo = await order_frame(db, tenant_id, COLUMNS)
+
+    def normalized(frame):
+        # Arrow keeps ms timestamps, MongoDB's come back as us; the values must match
+        timestamps = {column: "datetime64[ns]" for column in ("created_at", "updated_at", "cancelled_at")}
+        return frame.astype(timestamps).sort_values("external_id").reset_index(drop=True)
+
+    return normalized(from_snapshot), normalized(from_mongo)
+
+async def _check_resync_behind_watermark(monkeypatch):
+    db = AsyncMongoMockClient()["snapshots_test"]
+    noon = datetime(2025, 1, 1, 12)
+    await _write(db, "t1", [_order(str(i), noon) for i in range(5)])
+    await refresh_order_snapshot(db, "t1")
+
+    # Edited before the previous run finished: older updated_at, written later
+    await _write(db, "t1", [_order("5", noon - timedelta(minutes=30)), _order("2", noon - timedelta(hours=1), cancelled=True)])
+    await refresh_order_snapshot(db, "t1")
+
+    from_snapshot, from_mongo = await _frames(db, "t1", monkeypatch)
+    assert len(from_mongo) == 6
+    pd.testing.assert_frame_equal(from_snapshot, from_mongo)
+
+def test_resynced_order_behind_watermark_reaches_snapshot(monkeypatch):
+    asyncio.run(_check_resync_behind_watermark(monkeypatch))
+
+async def _check_batched_writes_and_compaction(monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOT_BATCH_SIZE", 4)
+    monkeypatch.setattr(snapshots, "SNAPSHOT_MAX_DELTAS", 2)
+    monkeypatch.setattr(snapshots, "SNAPSHOT_COMPACT_RATIO", 10.0)
+    db = AsyncMongoMockClient()["snapshots_test"]
+    await _write(db, "t2", [_order(str(i), datetime(2025, 1, 1)) for i in range(10)])
+    await refresh_order_snapshot(db, "t2")
+    assert snapshots.OrderSnapshot("t2").manifest()["rows"] == [10]
+
+    for step in range(4):
+        await _write(db, "t2", [_order(str(step), datetime(2024, 1, 1), cancelled=True), _order(str(20 + step), datetime(2024, 1, 1))])
+        await refresh_order_snapshot(db, "t2")
+    # Four deltas exceed SNAPSHOT_MAX_DELTAS, so a refresh compacted them
+    assert len(snapshots.OrderSnapshot("t2").manifest()["files"]) <= 3
+
+    from_snapshot, from_mongo = await _frames(db, "t2", monkeypatch)
+    assert len(from_mongo) == 14
+    pd.testing.assert_frame_equal(from_snapshot, from_mongo)
+
+def test_batched_deltas_and_compaction_match_mongodb(monkeypatch):
+    asyncio.run(_check_batched_writes_and_compaction(monkeypatch))
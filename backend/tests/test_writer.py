@@ -0,0 +1,92 @@
+"""BulkUpsertWriter must only run a checkpoint once every record added before it is committed.
+
+A checkpoint persists the sync cursor; running one early (or after a failed
+write) would make a resumed sync skip records that never reached MongoDB.
+"""
+import asyncio
+
+import pytest
+
+from services.writer import BulkUpsertWriter
+
+class RecordingCollection:
+    """bulk_write double that logs each committed batch and can fail on a given call"""
+
+    def __init__(self, events, fail_on=None):
+        self.events = events
+        self.fail_on = fail_on
+        self.calls = 0
+
+    async def bulk_write(self, ops, ordered=True):
+        self.calls += 1
+        # Yield so a checkpoint that does not wait for the write would get ahead of it
+        await asyncio.sleep(0)
+        if self.calls == self.fail_on:
+            raise RuntimeError("bulk write failed")
+        self.events.append(("write", [op._filter["external_id"] for op in ops]))
+        return type("Result", (), {"upserted_count": len(ops), "modified_count": 0, "matched_count": 0})()
+
+def _page(start, size):
+    return [{"external_id": str(i), "value": i} for i in range(start, start + size)]
+
+def _checkpoint(events, page):
+    async def checkpoint():
+        events.append(("checkpoint", page))
+    return checkpoint
+
+def _committed(events):
+    return {external_id for kind, ids in events if kind == "write" for external_id in ids}
+
+async def _check_checkpoints_follow_writes():
+    events = []
+    writer = BulkUpsertWriter(RecordingCollection(events), "t1", "shopify", batch_size=4, max_pending=1)
+    async with writer:
+        for page in range(5):
+            await writer.add(_page(page * 3, 3), checkpoint=_checkpoint(events, page))
+
+    for position, (kind, page) in enumerate(events):
+        if kind == "checkpoint":
+            # Every record of this page and of the pages before it was written first
+            assert {str(i) for i in range((page + 1) * 3)} <= _committed(events[:position])
+    assert [page for kind, page in events if kind == "checkpoint"] == list(range(5))
+    assert writer.stats() == {"batches": 4, "inserted": 15, "modified": 0, "unchanged": 0}
+
+def test_checkpoints_run_after_their_records_are_written():
+    asyncio.run(_check_checkpoints_follow_writes())
+
+async def _check_failed_write_stops_checkpoints():
+    events = []
+    writer = BulkUpsertWriter(RecordingCollection(events, fail_on=2), "t1", "shopify", batch_size=4, max_pending=1)
+    with pytest.raises(RuntimeError, match="bulk write failed"):
+        async with writer:
+            for page in range(5):
+                await writer.add(_page(page * 3, 3), checkpoint=_checkpoint(events, page))
+
+    checkpoints = [page for kind, page in events if kind == "checkpoint"]
+    # Only page 0 was fully committed by the first batch (records 0-3)
+    assert checkpoints == [0]
+    assert _committed(events) == {"0", "1", "2", "3"}
+
+def test_failed_write_raises_and_runs_no_later_checkpoint():
+    asyncio.run(_check_failed_write_stops_checkpoints())
+
+async def _check_fetch_error_commits_fetched_records():
+    events = []
+    writer = BulkUpsertWriter(RecordingCollection(events), "t1", "shopify", batch_size=100)
+    with pytest.raises(ValueError, match="page fetch failed"):
+        async with writer:
+            await writer.add(_page(0, 3), checkpoint=_checkpoint(events, 0))
+            raise ValueError("page fetch failed")
+
+    # What was fetched before the failure is committed, so a resumed run skips it
+    assert events == [("write", ["0", "1", "2"]), ("checkpoint", 0)]
+
+def test_fetch_error_still_commits_fetched_records():
+    asyncio.run(_check_fetch_error_commits_fetched_records())
+
+def test_synced_at_stamp_is_opt_in():
+    plain = BulkUpsertWriter(None, "t1", "shopify")._operation({"external_id": "1"})
+    stamped = BulkUpsertWriter(None, "t1", "shopify", stamp_synced_at=True)._operation({"external_id": "1"})
+    # An identical re-sync must stay a no-op unless the collection asks for the stamp
+    assert "$currentDate" not in plain._doc
+    assert stamped._doc["$currentDate"] == {"synced_at": True}
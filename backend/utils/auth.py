@@ -1,15 +1,29 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Optional, Tuple
+from bson import ObjectId
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import HTTPException, status
+from fastapi import HTTPException, Request, status, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
+import time
+
+from database import get_database
+from models.common import resolve_timezone
+from utils.cache import LRUCache
+from utils.metrics import tenant_tier, tier_of
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with a different cost factor are upgraded on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+security = HTTPBearer()
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -17,22 +31,161 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """Verify a password, also returning a new hash when the stored one uses outdated settings"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded executor so hashing never blocks the event loop.
+
+    bcrypt releases the GIL, so a thread pool already hashes in parallel; a
+    process pool can be configured to keep the CPU work out of the API
+    process entirely. Once ``max_pending`` hashes are queued or running,
+    further requests are rejected with 429 right away instead of piling up
+    behind a login storm.
+    """
+
+    def __init__(self):
+        self.kind = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+        self.workers = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+        self.max_pending = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(self.workers * 4)))
+        self.executor: Optional[Executor] = None
+        self.pending = 0
+
+    def _get_executor(self) -> Executor:
+        if self.executor is None:
+            if self.kind == "process":
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self.executor
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many authentication requests, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+password_hasher = PasswordHasher()
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
+
+async def check_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await password_hasher.run(verify_and_update_password, plain_password, hashed_password)
+
+def close_password_hasher():
+    password_hasher.shutdown()
+
+# Decoded tokens and user profiles are kept per worker so authenticated
+# requests do not query MongoDB; profile edits drop the cached entry
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+# Embed the profile in issued tokens so even a cold cache needs no lookup
+AUTH_PROFILE_CLAIMS = os.getenv("AUTH_PROFILE_CLAIMS", "false").lower() == "true"
+PROFILE_FIELDS = ("full_name", "company_name", "timezone", "is_active", "tier")
+
+_token_cache = LRUCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+_profile_cache = LRUCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+# email -> time of the last profile change; older profile claims are ignored
+_profile_changed_at = LRUCache(AUTH_CACHE_MAX_ENTRIES, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str):
+def profile_claims(user: dict) -> dict:
+    """Claims to add to a user's access token (empty unless AUTH_PROFILE_CLAIMS is on)"""
+    if not AUTH_PROFILE_CLAIMS:
+        return {}
+    profile = {field: user.get(field) for field in PROFILE_FIELDS}
+    return {"profile": {"id": str(user["_id"]), **profile}}
+
+def decode_token(token: str) -> Optional[dict]:
+    payload = _token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-        return email
     except JWTError:
         return None
+    if payload.get("sub") is None:
+        return None
+    # Never serve a token from cache past its own expiry
+    ttl = min(AUTH_CACHE_TTL_SECONDS, payload["exp"] - time.time()) if "exp" in payload else None
+    _token_cache.set(token, payload, ttl)
+    return payload
+
+def verify_token(token: str):
+    payload = decode_token(token)
+    return payload["sub"] if payload else None
+
+def _user_from_claims(payload: dict) -> Optional[dict]:
+    profile = payload.get("profile")
+    if not profile or not ObjectId.is_valid(profile.get("id")):
+        return None
+    changed_at = _profile_changed_at.get(payload["sub"])
+    if changed_at is not None and payload.get("iat", 0) <= changed_at:
+        return None
+    user = {field: profile.get(field) for field in PROFILE_FIELDS}
+    return {"_id": ObjectId(profile["id"]), "email": payload["sub"], **user}
+
+def invalidate_user(email: str):
+    """Forget the cached profile (and profile claims issued so far) after the user changed"""
+    _profile_cache.delete(email)
+    _profile_changed_at.set(email, time.time())
+
+def _label_request(request: Request, user: dict) -> dict:
+    # Read by the metrics middleware (request state) and by outbound calls made for the request
+    request.state.tenant_tier = tier_of(user)
+    tenant_tier.set(request.state.tenant_tier)
+    return user
+
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Resolve the bearer token to the user document, the tenant of every data route"""
+    payload = decode_token(credentials.credentials)
+    if not payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    email = payload["sub"]
+    user = _profile_cache.get(email) or _user_from_claims(payload)
+    if user:
+        return _label_request(request, user)
+    
+    db = get_database()
+    user = await db.users.find_one({"email": email}, {"hashed_password": 0})
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    _profile_cache.set(email, user)
+    return _label_request(request, user)
+
+def get_tenant_id(user: dict) -> str:
+    return str(user["_id"])
+
+def get_user_timezone(user: dict) -> str:
+    return resolve_timezone(user.get("timezone"))
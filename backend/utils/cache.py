@@ -0,0 +1,209 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from zoneinfo import ZoneInfo
+
+from pymongo import ReturnDocument
+from starlette.requests import Request
+from starlette.responses import Response
+
+from models.common import resolve_timezone
+from utils.compression import matching_etag
+from utils.serialization import FastJSONResponse, dumps, loads
+
+# Change on deploys that alter response bodies without a data change, so clients drop their copies
+ETAG_SALT = os.getenv("ETAG_SALT", "")
+# How long a worker trusts its copy of a tenant's data version before re-reading it
+CACHE_VERSION_TTL_SECONDS = float(os.getenv("CACHE_VERSION_TTL_SECONDS", "5"))
+
+class LRUCache:
+    """Bounded in-process mapping with per-entry expiry and LRU eviction"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class MemoryBackend:
+    """Per-worker cache backend"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = LRUCache(maxsize, ttl)
+
+    async def get(self, key: str) -> Any:
+        return self.entries.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self.entries.set(key, value, ttl)
+
+class RedisBackend:
+    """Cache backend shared by every worker through Redis"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Any:
+        value = await self.redis.get(f"cache:{key}")
+        return loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.redis.set(f"cache:{key}", dumps(value), ex=max(1, int(ttl)))
+
+class ResponseCache:
+    """Tenant-scoped cache of computed responses.
+
+    Every key embeds the tenant's data version, so bumping the version after a
+    sync makes all of that tenant's entries unreachable at once; they then age
+    out through TTL/LRU. The version is stored in MongoDB (``data_versions``)
+    rather than in the backend, so it survives restarts, and each worker keeps
+    a copy for CACHE_VERSION_TTL_SECONDS. The worker that ran a sync sees its
+    bump at once; the others serve the previous data (and 304s) for at most
+    that long. Concurrent misses for one key share a single computation
+    instead of each hitting MongoDB.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or self._default_backend()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._versions_seen = LRUCache(int(os.getenv("CACHE_MAX_ENTRIES", "10000")), CACHE_VERSION_TTL_SECONDS)
+
+    @staticmethod
+    def _default_backend():
+        maxsize = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+        ttl = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+        if os.getenv("CACHE_BACKEND", "memory") == "redis":
+            try:
+                return RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379"))
+            except ImportError:
+                print("redis package not installed, falling back to in-process cache")
+        return MemoryBackend(maxsize, ttl)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        value = await self.backend.get(key)
+        if value is not None:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, compute, ttl))
+            self._inflight[key] = task
+        # Shield so one cancelled request does not abort the work others wait on
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        try:
+            value = await compute()
+            await self.backend.set(key, value, ttl)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _versions():
+        # Imported here: database imports this module (through utils.metrics)
+        from database import get_database
+        return get_database().data_versions
+
+    async def version(self, tenant_id: str) -> int:
+        version = self._versions_seen.get(tenant_id)
+        if version is None:
+            doc = await self._versions().find_one({"_id": tenant_id})
+            version = doc["version"] if doc else 0
+            self._versions_seen.set(tenant_id, version)
+        return version
+
+    async def invalidate_tenant(self, tenant_id: str):
+        doc = await self._versions().find_one_and_update(
+            {"_id": tenant_id}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        self._versions_seen.set(tenant_id, doc["version"])
+
+response_cache = ResponseCache()
+
+async def invalidate_tenant(tenant_id: str):
+    """Drop every cached response of a tenant, e.g. once a sync has written new data"""
+    await response_cache.invalidate_tenant(tenant_id)
+
+def _etag(key: str, tz: str) -> str:
+    # Results depend on "today" (time ranges, the current cohort month), so the
+    # tenant's local date is part of the tag along with the versioned cache key
+    today = datetime.now(ZoneInfo(tz)).date().isoformat()
+    return hashlib.sha1(f"{ETAG_SALT}:{key}:{today}".encode()).hexdigest()[:24]
+
+def cached_route(ttl: Optional[float] = None):
+    """Cache a route's result per (tenant, data version, route, query params).
+
+    The route must take the authenticated user as a ``user`` parameter.
+    Responses carry a strong ETag derived from the same key, so a matching
+    If-None-Match is answered with 304 before the cache or the route is
+    consulted; a sync bumps the stored data version and with it every tag of
+    the tenant, in every worker (within CACHE_VERSION_TTL_SECONDS) and across
+    restarts.
+    """
+    def decorator(func):
+        route = f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = kwargs.pop("cache_request", None)
+            user = kwargs["user"]
+            tenant_id = str(user["_id"])
+            params = sorted((name, value) for name, value in kwargs.items() if name != "user")
+            version = await response_cache.version(tenant_id)
+            key = f"{tenant_id}:{version}:{route}:{json.dumps(params, default=str)}"
+            etag = _etag(key, resolve_timezone(user.get("timezone")))
+            headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+            if request is not None:
+                matched = matching_etag(request.headers.get("if-none-match", ""), etag)
+                if matched:
+                    return Response(status_code=304, headers={**headers, "ETag": matched})
+
+            value = await response_cache.get_or_compute(
+                key,
+                lambda: func(*args, **kwargs),
+                ttl if ttl is not None else float(os.getenv("CACHE_TTL_SECONDS", "300"))
+            )
+            return FastJSONResponse(value, headers=headers) if request is not None else value
+
+        # FastAPI injects the request for the conditional check; direct callers get the plain value
+        signature = inspect.signature(func)
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter("cache_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+        ])
+        return wrapper
+    return decorator
@@ -0,0 +1,260 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+from utils.cache import LRUCache
+
+# Starlette appends the charset to text/* media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Tier labels are limited to this set to keep the number of series bounded
+TENANT_TIERS = {tier.strip() for tier in os.getenv("METRICS_TENANT_TIERS", "free,standard,enterprise").split(",") if tier.strip()}
+DEFAULT_TENANT_TIER = os.getenv("DEFAULT_TENANT_TIER", "standard")
+METRICS_MONGO_COMMANDS = os.getenv("METRICS_MONGO_COMMANDS", "true").lower() == "true"
+
+# Tier of the tenant the current request or sync job works for
+tenant_tier: ContextVar[str] = ContextVar("tenant_tier", default="none")
+
+REGISTRY: List["Metric"] = []
+
+def tier_of(user: Optional[dict]) -> str:
+    tier = (user or {}).get("tier") or DEFAULT_TENANT_TIER
+    return tier if tier in TENANT_TIERS else "other"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Metric:
+    """A named family of samples keyed by label values.
+
+    Updates take a lock because MongoDB listeners report from pymongo's
+    executor threads; everything else runs on the event loop.
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _sample_lines(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._label_text(values)} {value}" for values, value in items]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._sample_lines()]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _sample_lines(self) -> List[str]:
+        with self._lock:
+            items = [(values, (list(counts), total, count)) for values, (counts, total, count) in self._values.items()]
+        lines = []
+        for values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip([*self.buckets, "+Inf"], counts):
+                cumulative += bucket
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {total}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {count}")
+        return lines
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+http_requests = Counter("http_requests_total", "HTTP requests served", ("route", "method", "status", "tier"))
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("route", "method", "tier"),
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests being served", ("route",))
+
+mongo_command_duration = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ("command", "collection"),
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+mongo_command_failures = Counter("mongodb_command_failures_total", "MongoDB commands that failed", ("command", "collection"))
+mongo_pool_connections = Gauge("mongodb_pool_connections", "Open MongoDB connections")
+mongo_pool_in_use = Gauge("mongodb_pool_connections_in_use", "MongoDB connections checked out of the pool")
+mongo_pool_checkout_failures = Counter("mongodb_pool_checkout_failures_total", "Failed MongoDB connection checkouts", ("reason",))
+mongo_pool_cleared = Counter("mongodb_pool_cleared_total", "Times a MongoDB connection pool was cleared")
+
+integration_request_duration = Histogram(
+    "integration_request_duration_seconds", "Outbound platform API latency (until the response headers)", ("platform", "tier"),
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+integration_requests = Counter("integration_requests_total", "Outbound platform API calls", ("platform", "status", "tier"))
+integration_throttled = Counter("integration_throttled_total", "Outbound calls the platform throttled", ("platform", "tier"))
+integration_errors = Counter("integration_errors_total", "Outbound calls that failed in transport or with a 5xx", ("platform", "tier"))
+
+def observe_outbound(platform: str, status: Optional[int], seconds: float):
+    tier = tenant_tier.get()
+    integration_request_duration.observe(seconds, platform, tier)
+    integration_requests.inc(platform, str(status) if status else "error", tier)
+    if status is None or status >= 500:
+        integration_errors.inc(platform, tier)
+
+# Route templates by (method, path); paths with ids are unbounded, so keep the most recent
+_routes = LRUCache(maxsize=4096, ttl=24 * 3600)
+
+def _route_of(scope) -> str:
+    key = (scope["method"], scope["path"])
+    route = _routes.get(key)
+    if route is None:
+        route = "unmatched"
+        for candidate in scope["app"].router.routes:
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate.path
+                break
+            if match == Match.PARTIAL and route == "unmatched":
+                # Path matched but the method did not (405)
+                route = candidate.path
+        _routes.set(key, route)
+    return route
+
+class MetricsMiddleware:
+    """Latency, status and in-flight requests per route template and tenant tier"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route = _route_of(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc(route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec(route)
+            # Set by get_current_user once the request is authenticated
+            tier = scope.get("state", {}).get("tenant_tier", "none")
+            http_request_duration.observe(elapsed, route, scope["method"], tier)
+            http_requests.inc(route, scope["method"], str(status), tier)
+
+def _collection_of(event) -> str:
+    if event.command_name == "getMore":
+        return str(event.command.get("collection", ""))
+    target = event.command.get(event.command_name)
+    return target if isinstance(target, str) else ""
+
+class CommandMetrics(monitoring.CommandListener):
+    """Command latency per command and collection, from pymongo's command monitoring"""
+
+    def __init__(self):
+        self._started: Dict[Tuple[int, object], Tuple[str, str]] = {}
+
+    def started(self, event):
+        self._started[(event.request_id, event.connection_id)] = (event.command_name, _collection_of(event))
+
+    def succeeded(self, event):
+        command, collection = self._started.pop((event.request_id, event.connection_id), (event.command_name, ""))
+        mongo_command_duration.observe(event.duration_micros / 1e6, command, collection)
+
+    def failed(self, event):
+        command, collection = self._started.pop((event.request_id, event.connection_id), (event.command_name, ""))
+        mongo_command_duration.observe(event.duration_micros / 1e6, command, collection)
+        mongo_command_failures.inc(command, collection)
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Open and checked-out connections, checkout failures and pool clears"""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        mongo_pool_cleared.inc()
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures.inc(str(event.reason))
+
+    def connection_checked_out(self, event):
+        mongo_pool_in_use.inc()
+
+    def connection_checked_in(self, event):
+        mongo_pool_in_use.dec()
+
+def mongo_listeners() -> list:
+    """Event listeners to pass to the MongoDB client"""
+    return [CommandMetrics(), PoolMetrics()] if METRICS_MONGO_COMMANDS else [PoolMetrics()]
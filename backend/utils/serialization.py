@@ -0,0 +1,105 @@
+import functools
+import inspect
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+
+from bson import ObjectId
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.responses import Response
+from starlette.routing import request_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(value: Any) -> Any:
+    """Values neither encoder handles natively"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    # The rest is native to orjson and only reaches here with the stdlib encoder
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if hasattr(value, "tolist"):
+        # numpy arrays and scalars
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any, naive_utc: bool = False) -> bytes:
+        """Compact UTF-8 JSON; ``naive_utc`` marks naive datetimes (as MongoDB returns them) as UTC"""
+        return orjson.dumps(content, default=_default, option=(_OPTIONS | orjson.OPT_NAIVE_UTC) if naive_utc else _OPTIONS)
+
+    loads = orjson.loads
+else:
+    print("orjson not installed, encoding JSON with the stdlib json module")
+
+    def dumps(content: Any, naive_utc: bool = False) -> bytes:
+        """Compact UTF-8 JSON; ``naive_utc`` marks naive datetimes (as MongoDB returns them) as UTC"""
+        if naive_utc:
+            content = _with_utc(content)
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def _with_utc(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: _with_utc(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [_with_utc(item) for item in value]
+        if isinstance(value, datetime) and value.tzinfo is None:
+            return value.isoformat() + "+00:00"
+        return value
+
+    loads = json.loads
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson, handling ObjectIds, datetimes and pydantic models"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class FastJSONRoute(APIRoute):
+    """Route that hands its result straight to a FastJSONResponse.
+
+    Without a response_model FastAPI runs every result through
+    jsonable_encoder, a Python-level walk that copies each dict, list and
+    value before the response class encodes it again. Routes with a
+    response_model keep FastAPI's validation and pydantic-core serialization,
+    as do routes that take a ``Response`` parameter to set headers or cookies.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+        if (self.response_field is None and self.dependant.response_param_name is None
+                and inspect.iscoroutinefunction(self.dependant.call) and issubclass(response_class, FastJSONResponse)):
+            self.dependant.call = self._encoding(self.dependant.call, response_class)
+            self.app = request_response(self.get_route_handler())
+
+    def _encoding(self, call, response_class):
+        status_code = self.status_code
+
+        @functools.wraps(call)
+        async def endpoint(*args, **kwargs):
+            content = await call(*args, **kwargs)
+            if isinstance(content, Response):
+                return content
+            if status_code is None:
+                return response_class(content)
+            return response_class(content, status_code=status_code)
+
+        return endpoint